@@ -0,0 +1,82 @@
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.db import connect
+from common.model import COUNTS, Dataset, scaled
+from common.sql import ROOT
+from queries import reset_schema
+
+sys.path.append(str(ROOT / "lab4"))
+sys.path.append(str(ROOT / "lab12"))
+
+
+def generate(scale, seed_value, now, value_pools=0):
+    from faker import Faker
+
+    fake = Faker("pl_PL")
+    if value_pools:
+        from common.pools import PooledFaker
+        fake = PooledFaker("pl_PL", seed_value, value_pools, fake)
+    return Dataset.generate(fake, seed_value, now, scaled(COUNTS, scale))
+
+
+def load_postgres(database, dataset, partitioned=False):
+    from emit_postgres import emit
+
+    reset_schema(database, partitioned)
+    conn = connect(database)
+    try:
+        return emit(conn, dataset, on_table=lambda table, count: print(f"postgres {table}: {count}"))
+    finally:
+        conn.close()
+
+
+def load_mongo(database, dataset, now):
+    from dotenv import load_dotenv
+    from pymongo.mongo_client import MongoClient
+    from pymongo.server_api import ServerApi
+    from emit_mongo import emit
+
+    load_dotenv()
+    client = MongoClient(os.environ["MONGODB_URI"], server_api=ServerApi('1'))
+    try:
+        return emit(client[database], dataset, now,
+                    on_collection=lambda name, count: print(f"mongo {name}: {count}"))
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Generate one dataset and load the very same records into PostgreSQL and MongoDB.")
+    parser.add_argument("--targets", nargs="+", choices=["postgres", "mongo"], default=["postgres", "mongo"])
+    parser.add_argument("--database", default=os.getenv("BENCH_DATABASE", "blood_bench"),
+                        help="PostgreSQL database the benchmark owns, its public schema is dropped and recreated")
+    parser.add_argument("--mongo-database", default=os.getenv("BENCH_MONGO_DATABASE", "krwiodawcy_bench"),
+                        help="MongoDB database the benchmark owns, its collections are emptied")
+    parser.add_argument("--scale", type=float, default=1, help="scale factor of the lab4 counts")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--partitioned", action="store_true",
+                        help="load the yearly partitioned layout of lab3/partitioning.sql")
+    parser.add_argument("--value-pools", type=int, default=0, metavar="SIZE",
+                        help="draw faker values from cached pools of SIZE values per field")
+    args = parser.parse_args()
+
+    now = datetime.now()
+    start = time.perf_counter()
+    dataset = generate(args.scale, args.seed, now, args.value_pools)
+    print(f"generated {len(dataset.blood_bags)} blood bags in {time.perf_counter() - start:.1f}s")
+
+    if "postgres" in args.targets:
+        start = time.perf_counter()
+        load_postgres(args.database, dataset, args.partitioned)
+        print(f"postgres loaded in {time.perf_counter() - start:.1f}s")
+    if "mongo" in args.targets:
+        start = time.perf_counter()
+        load_mongo(args.mongo_database, dataset, now)
+        print(f"mongo loaded in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.db import connect
+from common.sql import ROOT, queries
+from dataset import generate, load_mongo, load_postgres
+from queries import INDEX_PACK, LAB6_INDEXES, percentile, set_indexes, time_query, vacuum_analyze
+
+sys.path.append(str(ROOT / "lab12"))
+from indexes import create_indexes, pipeline
+from reports import REPORTS
+
+# report -> comment of the lab5/queries.sql statement it mirrors; the doctors
+# of 2024 are left out, lab12 examinations do not name the doctor
+LAB5_QUERIES = {
+    "donors_per_blood_group": "liczba dawcow kazdej grupy krwi",
+    "available_bags_per_blood_group": "zlicza dostepne torebki pogrupowane grupa krwi",
+    "donor_donations": "zlicza donorow i ich donacje",
+    "disqualified_percentage": "zlicza zdyskwalifikowane procentowo",
+    "eligible_donors": "lista donorow ktorzy moga znowu oddac krew",
+    "urgent_awaiting_orders": "pobiera pilne zamówienia oczekujące wraz z nazwą szpitala",
+    "frequent_donors": "Pobiera dawców, którzy oddali krew więcej niż 5 razy w ciągu ostatniego roku, "
+                       "z imieniem użytkownika",
+    "average_weight_height": "Oblicza średnią wagę i wzrost z tabeli badań",
+    "lab_results_per_blood_group": "Oblicza średnie wyniki badań dla wszystkich grup krwi",
+    "facility_statistics": "Statystyki dla placówek - liczba donacji, ilość zakwalifikowanych donacji "
+                           "i liczba dostępnych worków z krwią",
+    "average_qualification_time": "Średni czas potrzebny na kwalifikację torebki krwi w placówce",
+    "certified_donors": "Donorzy z certyfikatem i ilością oddanej krwi",
+    "average_donations_per_donor": "Średnia ilość donacji na dawcę",
+    "orders_per_hospital": "Ilość zamówień zrobionych przez kazdy szpital",
+}
+
+POSTGRES_STORAGE = """
+SELECT COALESCE(SUM(pg_table_size(c.oid)), 0), COALESCE(SUM(pg_indexes_size(c.oid)), 0)
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = 'public' AND c.relkind = 'r'
+"""
+
+
+def sql_reports():
+    lab5 = dict(queries(ROOT / "lab5" / "queries.sql"))
+    return {name: lab5[comment] for name, comment in LAB5_QUERIES.items()}
+
+
+def time_pipeline(db, name, now, indexed, runs, warmup):
+    # with the indexes, the reports run in their index-backed form
+    collection, stages = pipeline(name, now, indexed)
+    samples = []
+    rows = 0
+    for i in range(warmup + runs):
+        start = time.perf_counter()
+        rows = len(list(db[collection].aggregate(stages, allowDiskUse=True)))
+        elapsed = (time.perf_counter() - start) * 1000
+        if i >= warmup:
+            samples.append(elapsed)
+    return samples, rows
+
+
+def summary(samples, rows):
+    return {
+        "rows": rows,
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        # sequential runs, one client
+        "queries_per_s": round(len(samples) / (sum(samples) / 1000), 2) if sum(samples) else None,
+        "samples_ms": [round(s, 3) for s in samples],
+    }
+
+
+def postgres_reports(conn, names, runs, warmup):
+    sql = sql_reports()
+    results = {}
+    with conn.cursor() as cur:
+        for name in names:
+            samples = time_query(cur, sql[name], runs, warmup)
+            results[name] = summary(samples, cur.rowcount)
+    conn.rollback()
+    return results
+
+
+def mongo_reports(db, names, now, indexed, runs, warmup):
+    return {name: summary(*time_pipeline(db, name, now, indexed, runs, warmup)) for name in names}
+
+
+def postgres_storage(conn):
+    with conn.cursor() as cur:
+        cur.execute(POSTGRES_STORAGE)
+        data, indexes = cur.fetchone()
+    conn.rollback()
+    return {"data_bytes": int(data), "index_bytes": int(indexes)}
+
+
+def mongo_storage(db):
+    # storageSize is what the collections take on disk, dataSize their
+    # uncompressed BSON
+    stats = db.command("dbStats")
+    return {"data_bytes": int(stats["storageSize"]), "index_bytes": int(stats["indexSize"]),
+            "uncompressed_bytes": int(stats["dataSize"])}
+
+
+def mongo_database(name):
+    from dotenv import load_dotenv
+    from pymongo.mongo_client import MongoClient
+    from pymongo.server_api import ServerApi
+
+    load_dotenv()
+    client = MongoClient(os.environ["MONGODB_URI"], server_api=ServerApi('1'))
+    return client, client[name]
+
+
+def megabytes(n):
+    return n / 1024 / 1024
+
+
+def print_comparison(report):
+    print(f"\nscale {report['scale']:g}x, p50 / p95 ms, rows")
+    print(f"{'report':<36}{'postgres':>28}{'mongo':>28}")
+    for name in report["postgres"]["reports"]:
+        cells = ""
+        for engine in ["postgres", "mongo"]:
+            r = report[engine]["reports"][name]
+            cells += f"{r['p50_ms']:>12.2f}{r['p95_ms']:>10.2f}{r['rows']:>6}"
+        print(f"{name:<36}{cells}")
+
+
+def write_report(path, reports):
+    # markdown with the measured numbers only, one section per scale factor
+    lines = ["# PostgreSQL vs MongoDB on the same dataset", ""]
+    for report in reports:
+        pg, mongo = report["postgres"], report["mongo"]
+        lines += [
+            f"## scale {report['scale']:g}x",
+            "",
+            f"{report['records']} records generated once with seed {report['seed']} and loaded into both "
+            f"engines. {report['runs']} timed runs per report after {report['warmup']} warm-up runs, "
+            f"indexes: {'lab6 pack and lab12/indexes.py' if report['indexes'] else 'keys only'}.",
+            "",
+            "| | PostgreSQL | MongoDB |",
+            "|---|---|---|",
+            f"| load | {pg['load_seconds']:.1f} s, {pg['load_records_per_s']:.0f} records/s "
+            f"| {mongo['load_seconds']:.1f} s, {mongo['load_records_per_s']:.0f} records/s |",
+            f"| data | {megabytes(pg['storage']['data_bytes']):.1f} MB "
+            f"| {megabytes(mongo['storage']['data_bytes']):.1f} MB "
+            f"({megabytes(mongo['storage']['uncompressed_bytes']):.1f} MB uncompressed) |",
+            f"| indexes | {megabytes(pg['storage']['index_bytes']):.1f} MB "
+            f"| {megabytes(mongo['storage']['index_bytes']):.1f} MB |",
+            "",
+            "| report | PostgreSQL p50 / p95 ms | MongoDB p50 / p95 ms | PostgreSQL q/s | MongoDB q/s "
+            "| rows | faster |",
+            "|---|---|---|---|---|---|---|",
+        ]
+        for name, p in pg["reports"].items():
+            m = mongo["reports"][name]
+            rows = str(p["rows"]) if p["rows"] == m["rows"] else f"{p['rows']} / {m['rows']}"
+            faster = "PostgreSQL" if p["p50_ms"] <= m["p50_ms"] else "MongoDB"
+            ratio = max(p["p50_ms"], m["p50_ms"]) / max(min(p["p50_ms"], m["p50_ms"]), 0.001)
+            lines.append(f"| {name} | {p['p50_ms']:.2f} / {p['p95_ms']:.2f} | {m['p50_ms']:.2f} / {m['p95_ms']:.2f} "
+                         f"| {p['queries_per_s']} | {m['queries_per_s']} | {rows} | {faster} {ratio:.1f}x |")
+        lines.append("")
+    Path(path).write_text("\n".join(lines), encoding="utf-8")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Load one generated dataset into PostgreSQL and MongoDB at several scale factors and "
+                    "compare the lab5 reports, load throughput and storage size of both engines.")
+    parser.add_argument("--database", default=os.getenv("BENCH_DATABASE", "blood_bench"),
+                        help="PostgreSQL database the benchmark owns, its public schema is dropped and recreated")
+    parser.add_argument("--mongo-database", default=os.getenv("BENCH_MONGO_DATABASE", "krwiodawcy_bench"),
+                        help="MongoDB database the benchmark owns, its collections are emptied")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10],
+                        help="scale factors of the lab4 counts")
+    parser.add_argument("--runs", type=int, default=10, help="timed runs per report")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed runs per report before timing")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reports", nargs="+", choices=list(REPORTS), default=list(REPORTS))
+    parser.add_argument("--indexes", action="store_true",
+                        help="build the lab6 indexes and index pack on PostgreSQL and the lab12/indexes.py "
+                             "indexes on MongoDB before timing")
+    parser.add_argument("--value-pools", type=int, default=0, metavar="SIZE",
+                        help="draw faker values from cached pools of SIZE values per field")
+    parser.add_argument("--output", default=str(ROOT / "benchmarks" / "results"),
+                        help="directory for the JSON results and the markdown report")
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    started = datetime.now().strftime("%Y%m%d-%H%M%S")
+    client, db = mongo_database(args.mongo_database)
+    reports = []
+
+    for scale in args.scales:
+        label = f"{scale:g}"
+        now = datetime.now()
+        start = time.perf_counter()
+        dataset = generate(scale, args.seed, now, args.value_pools)
+        generate_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        records = sum(load_postgres(args.database, dataset).values())
+        pg_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        documents = sum(load_mongo(args.mongo_database, dataset, now).values())
+        mongo_seconds = time.perf_counter() - start
+        del dataset
+
+        conn = connect(args.database)
+        if args.indexes:
+            set_indexes(conn, [LAB6_INDEXES, INDEX_PACK])
+            create_indexes(db)
+        vacuum_analyze(conn)
+
+        report = {
+            "scale": scale,
+            "seed": args.seed,
+            "runs": args.runs,
+            "warmup": args.warmup,
+            "indexes": args.indexes,
+            "records": records,
+            "generate_seconds": round(generate_seconds, 3),
+            "postgres": {
+                "load_seconds": round(pg_seconds, 3),
+                "load_records_per_s": round(records / pg_seconds, 1),
+                "storage": postgres_storage(conn),
+                "reports": postgres_reports(conn, args.reports, args.runs, args.warmup),
+            },
+            "mongo": {
+                "load_seconds": round(mongo_seconds, 3),
+                # the same records as PostgreSQL, embedded in fewer documents
+                "load_records_per_s": round(records / mongo_seconds, 1),
+                "documents": documents,
+                "storage": mongo_storage(db),
+                "reports": mongo_reports(db, args.reports, now, args.indexes, args.runs, args.warmup),
+            },
+        }
+        conn.close()
+
+        path = output / f"{started}-engines-scale{label}.json"
+        path.write_text(json.dumps(report, indent=2, default=str))
+        reports.append(report)
+        print_comparison(report)
+        print(f"results written to {path}")
+
+    client.close()
+    report_path = output / f"{started}-engines-report.md"
+    write_report(report_path, reports)
+    print(f"report written to {report_path}")
@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.db import connect
+from common.sql import ROOT
+from queries import INDEX_PACK, LAB6_INDEXES, reset_schema, seed, set_indexes
+
+# one switch per configuration, so that each one's effect can be read on its own
+CONFIGS = {
+    "baseline": [],
+    "synchronous_commit_off": ["--synchronous-commit", "off"],
+    "work_mem": ["--work-mem", "256MB"],
+    "maintenance_work_mem": ["--maintenance-work-mem", "1GB"],
+    "defer_indexes": ["--defer-indexes"],
+    "defer_foreign_keys": ["--defer-foreign-keys"],
+    "defer_indexes_partitioned": ["--defer-indexes"],
+    "defer_foreign_keys_partitioned": ["--defer-foreign-keys"],
+    "bare": ["--bare"],
+    "bare_partitioned": ["--bare"],
+    "all": ["--synchronous-commit", "off", "--work-mem", "256MB", "--maintenance-work-mem", "1GB",
+            "--bare"],
+}
+# always loaded into the partitioned layout, its indexes and keys are restored differently
+PARTITIONED_CONFIGS = {"defer_indexes_partitioned", "defer_foreign_keys_partitioned", "bare_partitioned"}
+
+
+def load(database, scale, seed_value, workers, manifest, extra_args, partitioned):
+    # the lab6 indexes exist before the load, like on a database that is reseeded
+    reset_schema(database, partitioned)
+    conn = connect(database)
+    set_indexes(conn, [LAB6_INDEXES, INDEX_PACK], partitioned)
+    conn.close()
+
+    seconds = seed(database, scale, seed_value, workers, manifest, partitioned, extra_args)
+    stages = json.loads(Path(manifest).read_text())["stages"]
+    return seconds, {stage: info.get("seconds") for stage, info in stages.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Time the lab4 load under each session setting and deferral switch separately.")
+    parser.add_argument("--database", default=os.getenv("BENCH_DATABASE", "blood_bench"),
+                        help="database the benchmark owns, its public schema is dropped and recreated")
+    parser.add_argument("--scale", type=float, default=10, help="scale factor passed to the lab4 seeder")
+    parser.add_argument("--seed", type=int, default=1, help="seed passed to the lab4 seeder")
+    parser.add_argument("--workers", type=int, default=1, help="seeder worker processes")
+    parser.add_argument("--repeats", type=int, default=3, help="loads per configuration, the median is reported")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="seed the yearly partitioned layout of lab3/partitioning.sql")
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--output", default=str(ROOT / "benchmarks" / "results"),
+                        help="directory for the JSON results")
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    started = datetime.now().strftime("%Y%m%d-%H%M%S")
+    results = {}
+
+    for config in args.configs:
+        partitioned = args.partitioned or config in PARTITIONED_CONFIGS
+        runs = []
+        for repeat in range(args.repeats):
+            manifest = output / f"{started}-load-{config}-{repeat}-manifest.json"
+            seconds, stages = load(args.database, args.scale, args.seed, args.workers, manifest,
+                                   CONFIGS[config], partitioned)
+            runs.append({"seconds": round(seconds, 3), "stages": stages})
+        median = statistics.median(run["seconds"] for run in runs)
+        results[config] = {"args": CONFIGS[config], "partitioned": partitioned, "median_seconds": median,
+                           "runs": runs}
+
+    baseline = results[args.configs[0]]["median_seconds"]
+    print(f"\nscale {args.scale:g}x, median of {args.repeats} loads")
+    for config, result in results.items():
+        print(f"{config:<32}{result['median_seconds']:>10.2f}s{baseline / result['median_seconds']:>8.2f}x")
+
+    path = output / f"{started}-load.json"
+    path.write_text(json.dumps({"scale": args.scale, "seed": args.seed, "workers": args.workers,
+                                "partitioned": args.partitioned, "results": results}, indent=2))
+    print(f"results written to {path}")
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / "lab9"))
+from common.db import connect
+from common.sql import ROOT
+from migrate import Migration
+from queries import percentile, reset_schema, seed
+
+MONOLITHIC_SQL = ROOT / "lab9" / "ddl.sql"
+
+
+class Writer(threading.Thread):
+    # keeps updating random orders while the migration runs, each update is
+    # timed so that the time writers spend blocked shows up in the latencies
+    def __init__(self, database, order_ids):
+        super().__init__(daemon=True)
+        self.database = database
+        self.order_ids = order_ids
+        self.stop = threading.Event()
+        self.samples = []
+        self.errors = 0
+
+    def run(self):
+        conn = connect(self.database)
+        rng = random.Random(0)
+        while not self.stop.is_set():
+            start = time.perf_counter()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('UPDATE "orders" SET is_urgent = NOT is_urgent WHERE id = %s',
+                                (rng.choice(self.order_ids),))
+                conn.commit()
+                self.samples.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                conn.rollback()
+                self.errors += 1
+        conn.close()
+
+    def stats(self):
+        return {
+            "writes": len(self.samples),
+            "errors": self.errors,
+            "p50_ms": round(percentile(self.samples, 50), 3) if self.samples else None,
+            "p95_ms": round(percentile(self.samples, 95), 3) if self.samples else None,
+            "max_ms": round(max(self.samples), 3) if self.samples else None,
+        }
+
+
+def monolithic(conn, batch_size):
+    with conn.cursor() as cur:
+        cur.execute(MONOLITHIC_SQL.read_text(encoding="utf-8"))
+    conn.commit()
+    return {}
+
+
+def online(conn, batch_size):
+    return Migration(conn, batch_size, progress_every=100).run("all")
+
+
+MODES = {"monolithic": monolithic, "online": online}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compare the monolithic lab9 migration with the online one on lab4-seeded data "
+                    "while a writer keeps updating orders.")
+    parser.add_argument("--database", default=os.getenv("BENCH_DATABASE", "blood_bench"),
+                        help="database the benchmark owns, its public schema is dropped and recreated")
+    parser.add_argument("--scale", type=float, default=100, help="scale factor passed to the lab4 seeder")
+    parser.add_argument("--seed", type=int, default=1, help="seed passed to the lab4 seeder")
+    parser.add_argument("--batch-size", type=int, default=5000, help="orders per batch of the online migration")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--output", default=str(ROOT / "benchmarks" / "results"),
+                        help="directory for the JSON results")
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    started = datetime.now().strftime("%Y%m%d-%H%M%S")
+    results = {}
+
+    for mode in args.modes:
+        # every mode starts from the same data
+        reset_schema(args.database)
+        seed(args.database, args.scale, args.seed, 1, output / f"{started}-migration-{mode}-manifest.json")
+
+        conn = connect(args.database)
+        with conn.cursor() as cur:
+            cur.execute('SELECT id FROM "orders"')
+            order_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+
+        writer = Writer(args.database, order_ids)
+        writer.start()
+        start = time.perf_counter()
+        report = MODES[mode](conn, args.batch_size)
+        seconds = time.perf_counter() - start
+        writer.stop.set()
+        writer.join()
+        conn.close()
+
+        results[mode] = {"seconds": round(seconds, 3), "migration": report, "writer": writer.stats()}
+        print(f"{mode}: {seconds:.2f}s, writer {results[mode]['writer']}")
+
+    path = output / f"{started}-migration.json"
+    path.write_text(json.dumps({"scale": args.scale, "seed": args.seed, "results": results}, indent=2))
+    print(f"results written to {path}")
@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.db import connect
+from common.sql import ROOT, indexes, queries
+
+QUERY_FILES = [ROOT / "lab5" / "queries.sql", ROOT / "lab6" / "queries.sql"]
+LAB6_INDEXES = ROOT / "lab6" / "queries.sql"
+INDEX_PACK = ROOT / "lab6" / "index-pack.sql"
+SARGABLE_QUERIES = ROOT / "lab6" / "sargable-queries.sql"
+DDL_FILE = ROOT / "lab3" / "blood-ddl.sql"
+PARTITIONING_FILE = ROOT / "lab3" / "partitioning.sql"
+SEEDER = ROOT / "lab4" / "main.py"
+
+
+def load_queries():
+    # lab6 repeats the lab5 reports behind EXPLAIN, only the queries it adds count
+    seen = set()
+    result = []
+    for path in QUERY_FILES:
+        for i, (comment, sql) in enumerate(queries(path), 1):
+            if sql in seen:
+                continue
+            seen.add(sql)
+            result.append((comment or f"{path.parent.name} #{i}", sql))
+    return result
+
+
+def variants():
+    # name -> (index files, rewritten queries replacing the lab5 ones by comment)
+    rewrites = dict(queries(SARGABLE_QUERIES))
+    return {
+        "baseline": ([], {}),
+        "lab6_indexes": ([LAB6_INDEXES], {}),
+        "index_pack": ([LAB6_INDEXES, INDEX_PACK], rewrites),
+    }
+
+
+def reset_schema(database, partitioned=False):
+    conn = connect(database)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("DROP SCHEMA public CASCADE")
+        cur.execute("CREATE SCHEMA public")
+        cur.execute(DDL_FILE.read_text(encoding="utf-8"))
+        if partitioned:
+            cur.execute(PARTITIONING_FILE.read_text(encoding="utf-8"))
+    conn.close()
+
+
+def seed(database, scale, seed_value, workers, manifest, partitioned=False, extra_args=()):
+    env = dict(os.environ, DB_DATABASE=database)
+    command = [
+        sys.executable, str(SEEDER), "--bulk",
+        "--scale", str(scale),
+        "--seed", str(seed_value),
+        "--workers", str(workers),
+        "--manifest", str(manifest),
+    ]
+    if partitioned:
+        command.append("--partitioned")
+    command.extend(extra_args)
+    start = time.perf_counter()
+    subprocess.run(command, env=env, check=True)
+    return time.perf_counter() - start
+
+
+def vacuum_analyze(conn):
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("VACUUM ANALYZE")
+    conn.autocommit = False
+
+
+def set_indexes(conn, index_files, partitioned=False):
+    # autocommit, the index pack is built CONCURRENTLY, which partitioned
+    # tables do not support
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        for path in [LAB6_INDEXES, INDEX_PACK]:
+            for name, _ in indexes(path):
+                cur.execute(f'DROP INDEX IF EXISTS "{name}"')
+        for path in index_files:
+            for _, sql in indexes(path):
+                cur.execute(sql.replace(" CONCURRENTLY", "") if partitioned else sql)
+        cur.execute("ANALYZE")
+    conn.autocommit = False
+
+
+def percentile(samples, p):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[p - 1]
+
+
+def time_query(cur, sql, runs, warmup):
+    samples = []
+    for i in range(warmup + runs):
+        start = time.perf_counter()
+        cur.execute(sql)
+        cur.fetchall()
+        elapsed = (time.perf_counter() - start) * 1000
+        if i >= warmup:
+            samples.append(elapsed)
+    return samples
+
+
+def explain(cur, sql):
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)
+    return cur.fetchone()[0][0]
+
+
+def scans(node, found=None):
+    found = [] if found is None else found
+    if "Scan" in node["Node Type"]:
+        # bitmap index scans name the index, not the table
+        found.append(f"{node['Node Type']} on {node.get('Relation Name') or node.get('Index Name', '?')}")
+    for child in node.get("Plans", []):
+        scans(child, found)
+    return found
+
+
+def run_variant(conn, query_list, runs, warmup, rewrites):
+    results = []
+    with conn.cursor() as cur:
+        for name, sql in query_list:
+            rewritten = name in rewrites
+            sql = rewrites.get(name, sql)
+            samples = time_query(cur, sql, runs, warmup)
+            plan = explain(cur, sql)
+            conn.rollback()
+            results.append({
+                "query": name,
+                "rewritten": rewritten,
+                "p50_ms": round(percentile(samples, 50), 3),
+                "p95_ms": round(percentile(samples, 95), 3),
+                "samples_ms": [round(s, 3) for s in samples],
+                "shared_hit_blocks": plan["Plan"].get("Shared Hit Blocks"),
+                "shared_read_blocks": plan["Plan"].get("Shared Read Blocks"),
+                "scans": scans(plan["Plan"]),
+                "plan": plan,
+            })
+    return results
+
+
+def print_comparison(scale, results):
+    baseline = {r["query"]: r for r in next(iter(results.values()))}
+    print(f"\nscale {scale}x, p50 / p95 ms")
+    header = "".join(f"{variant:>24}" for variant in results)
+    print(f"{'query':<60}{header}")
+    for name in baseline:
+        cells = ""
+        for variant in results.values():
+            result = next(r for r in variant if r["query"] == name)
+            cells += f"{result['p50_ms']:>12.2f}{result['p95_ms']:>12.2f}"
+        print(f"{name[:60]:<60}{cells}")
+
+
+def write_report(path, reports):
+    # markdown with the measured numbers only, one table per scale factor
+    lines = ["# lab5/lab6 query benchmark", ""]
+    for report in reports:
+        results = report["variants"]
+        names = list(results)
+        baseline = {r["query"]: r for r in results[names[0]]}
+        lines += [
+            f"## scale {report['scale']:g}x",
+            "",
+            f"{report['runs']} timed runs per query after {report['warmup']} warm-up runs, "
+            f"seed {report['seed']}. Latency in ms, speedup is the {names[0]} p50 divided by the {names[-1]} p50.",
+            "",
+            "| query | " + " | ".join(f"{name} p50 / p95" for name in names) + " | speedup |",
+            "|---|" + "---|" * len(names) + "---|",
+        ]
+        best = names[-1]
+        for name, base in baseline.items():
+            cells = []
+            for variant in names:
+                result = next(r for r in results[variant] if r["query"] == name)
+                mark = " (rewritten)" if result["rewritten"] else ""
+                cells.append(f"{result['p50_ms']:.2f} / {result['p95_ms']:.2f}{mark}")
+            after = next(r for r in results[best] if r["query"] == name)
+            speedup = base["p50_ms"] / after["p50_ms"] if after["p50_ms"] else float("inf")
+            lines.append(f"| {name} | " + " | ".join(cells) + f" | {speedup:.2f}x |")
+
+        lines += ["", f"### scans, {names[0]} vs {best}", ""]
+        for name, base in baseline.items():
+            after = next(r for r in results[best] if r["query"] == name)
+            lines.append(f"- {name}: {', '.join(base['scans'])} -> {', '.join(after['scans'])}")
+        lines.append("")
+    Path(path).write_text("\n".join(lines), encoding="utf-8")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Seed the schema at several scale factors and time the lab5/lab6 queries "
+                    "without indexes, with the lab6 indexes and with the lab6 index pack.")
+    parser.add_argument("--database", default=os.getenv("BENCH_DATABASE", "blood_bench"),
+                        help="database the benchmark owns, its public schema is dropped and recreated")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100],
+                        help="scale factors passed to the lab4 seeder")
+    parser.add_argument("--runs", type=int, default=20, help="timed runs per query")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed runs per query before timing")
+    parser.add_argument("--seed", type=int, default=1, help="seed passed to the lab4 seeder")
+    parser.add_argument("--workers", type=int, default=1, help="seeder worker processes")
+    parser.add_argument("--no-seed", action="store_true",
+                        help="benchmark the data already in --database, --scales then only labels the run")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="seed the yearly partitioned layout of lab3/partitioning.sql")
+    parser.add_argument("--variants", nargs="+", default=list(variants()),
+                        help="index variants to compare, the first one is the baseline of the report")
+    parser.add_argument("--output", default=str(ROOT / "benchmarks" / "results"),
+                        help="directory for the JSON results and the markdown report")
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    query_list = load_queries()
+    started = datetime.now().strftime("%Y%m%d-%H%M%S")
+    available = variants()
+    reports = []
+
+    for scale in args.scales:
+        label = f"{scale:g}"
+        seed_seconds = None
+        if not args.no_seed:
+            reset_schema(args.database, args.partitioned)
+            seed_seconds = seed(args.database, scale, args.seed, args.workers,
+                                output / f"{started}-scale{label}-manifest.json", args.partitioned)
+
+        conn = connect(args.database)
+        vacuum_analyze(conn)
+
+        results = {}
+        for variant in args.variants:
+            index_files, rewrites = available[variant]
+            set_indexes(conn, index_files, args.partitioned)
+            results[variant] = run_variant(conn, query_list, args.runs, args.warmup, rewrites)
+        conn.close()
+
+        path = output / f"{started}-scale{label}.json"
+        report = {
+            "scale": scale,
+            "seed": args.seed,
+            "runs": args.runs,
+            "warmup": args.warmup,
+            "seed_seconds": seed_seconds,
+            "partitioned": args.partitioned,
+            "variants": results,
+        }
+        path.write_text(json.dumps(report, indent=2, default=str))
+        reports.append(report)
+
+        print_comparison(label, results)
+        print(f"results written to {path}")
+
+    report_path = output / f"{started}-report.md"
+    write_report(report_path, reports)
+    print(f"report written to {report_path}")
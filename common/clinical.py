@@ -0,0 +1,74 @@
+import random
+
+import numpy as np
+
+# whole columns of examination and lab result values at once; the ranges are the
+# ones the row-by-row generators in lab4 and lab12 use
+
+# minimal hemoglobin of a donor, g/dl
+MIN_HEMOGLOBIN = 12.5
+
+
+def generator(rng=random):
+    # seeded from the stage's python generator, so a run stays reproducible
+    return np.random.default_rng(rng.getrandbits(64))
+
+
+def uniform(gen, n, low, high, decimals=2):
+    return np.round(gen.uniform(low, high, n), decimals)
+
+
+def integers(gen, n, low, high):
+    # both ends included, like random.randint
+    return gen.integers(low, high + 1, n)
+
+
+def flags(gen, n, chance):
+    return gen.random(n) < chance
+
+
+def examinations(gen, n, correlated=False):
+    columns = {
+        "weight": uniform(gen, n, 50.0, 100.0),
+        "height": integers(gen, n, 150, 200),
+        "diastolic_blood_pressure": integers(gen, n, 60, 90),
+        "systolic_blood_pressure": integers(gen, n, 90, 140),
+        "is_qualified": flags(gen, n, 8 / 9),
+    }
+    if correlated:
+        # taller donors weigh more, systolic follows diastolic with a 30-50 mmHg gap,
+        # the highest pressures are turned away more often
+        columns["weight"] = np.round(np.clip(
+            22.5 * (columns["height"] / 100) ** 2 + gen.normal(0, 8, n), 50.0, 100.0), 2)
+        columns["systolic_blood_pressure"] = np.clip(
+            columns["diastolic_blood_pressure"] + integers(gen, n, 30, 50), 90, 140)
+        high_pressure = (columns["systolic_blood_pressure"] >= 135) | (columns["diastolic_blood_pressure"] >= 88)
+        columns["is_qualified"] &= ~(high_pressure & flags(gen, n, 0.5))
+    return columns
+
+
+def lab_results(gen, n, correlated=False):
+    columns = {
+        "red_cells_count": uniform(gen, n, 4.0, 6.0),
+        "white_cells_count": uniform(gen, n, 4.0, 11.0),
+        "platelet_count": uniform(gen, n, 150, 450),
+        "hemoglobin_level": uniform(gen, n, 12.0, 18.0),
+        "hematocrit_level": uniform(gen, n, 36.0, 52.0),
+        "glucose_level": uniform(gen, n, 70, 140),
+        "is_qualified": flags(gen, n, 8 / 9),
+    }
+    if correlated:
+        # hematocrit is about three times the hemoglobin and red cells follow it;
+        # a bag is qualified only above the donor hemoglobin minimum, which keeps
+        # the 8 in 9 ratio of the uncorrelated columns
+        hemoglobin = columns["hemoglobin_level"]
+        columns["hematocrit_level"] = np.round(np.clip(3 * hemoglobin + gen.normal(0, 1.5, n), 36.0, 52.0), 2)
+        columns["red_cells_count"] = np.round(np.clip(hemoglobin / 3 + gen.normal(0, 0.3, n), 4.0, 6.0), 2)
+        columns["is_qualified"] = (hemoglobin >= MIN_HEMOGLOBIN) & flags(gen, n, 0.97)
+    return columns
+
+
+def rows(columns, names):
+    # tolist hands back plain python values, which the COPY writer and the
+    # MongoDB driver take as they are
+    return zip(*(columns[name].tolist() for name in names))
@@ -0,0 +1,23 @@
+import os
+from pathlib import Path
+
+import psycopg2
+from dotenv import load_dotenv
+
+# db.env is looked up in the working directory, like every script in the repo
+load_dotenv(dotenv_path=Path('db.env'))
+
+
+def params(dbname=None, **kwargs):
+    return dict(
+        dbname=dbname or os.getenv('DB_DATABASE'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        host=os.getenv('DB_HOST'),
+        port=os.getenv('DB_PORT'),
+        **kwargs
+    )
+
+
+def connect(dbname=None, **kwargs):
+    return psycopg2.connect(**params(dbname, **kwargs))
@@ -0,0 +1,100 @@
+import json
+import os
+import random
+import threading
+from datetime import datetime
+from pathlib import Path
+
+
+class RunManifest:
+    # seeds, counts and per-stage checkpoints of one seeding run, kept in a
+    # JSON file so that a crashed run can be resumed and a finished one replayed
+
+    def __init__(self, path, data):
+        self.path = Path(path)
+        self.data = data
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path, seed=None, counts=None, settings=None, resume=False):
+        path = Path(path)
+        if resume:
+            if not path.exists():
+                raise FileNotFoundError(f"no manifest to resume from: {path}")
+            manifest = cls(path, json.loads(path.read_text()))
+            if counts is not None and manifest.counts != counts:
+                raise ValueError(f"{path} was written for different counts, start a new run instead")
+            return manifest
+
+        manifest = cls(path, {
+            "seed": seed if seed is not None else random.randrange(2 ** 32),
+            "reference_time": datetime.now().replace(microsecond=0).isoformat(),
+            "counts": counts or {},
+            "settings": settings or {},
+            "stages": {},
+        })
+        manifest.save()
+        return manifest
+
+    @property
+    def seed(self):
+        return self.data["seed"]
+
+    @property
+    def counts(self):
+        return self.data["counts"]
+
+    @property
+    def reference_time(self):
+        # stands in for datetime.now() so that relative dates are reproducible
+        return datetime.fromisoformat(self.data["reference_time"])
+
+    def stage_seed(self, stage):
+        return f"{self.seed}:{stage}"
+
+    def stage(self, stage):
+        return self.data["stages"].setdefault(stage, {})
+
+    def is_done(self, stage):
+        return self.data["stages"].get(stage, {}).get("done", False)
+
+    def complete(self, stage, **info):
+        with self.lock:
+            self.stage(stage).update(info, done=True, finished_at=datetime.now().isoformat())
+            self.save()
+
+    def plan(self, stage):
+        return self.data["stages"].get(stage, {}).get("plan")
+
+    def save_plan(self, stage, plan):
+        with self.lock:
+            self.stage(stage)["plan"] = plan
+            self.save()
+
+    def is_shard_done(self, stage, shard):
+        return shard in self.data["stages"].get(stage, {}).get("shards_done", [])
+
+    def complete_shard(self, stage, shard):
+        with self.lock:
+            self.stage(stage).setdefault("shards_done", []).append(shard)
+            self.save()
+
+    def save(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.data, indent=2))
+        os.replace(tmp, self.path)
+
+
+def to_ranges(ids):
+    # contiguous runs of ids as [first, last] pairs, reserved id blocks stay tiny
+    ranges = []
+    for value in ids:
+        if ranges and ranges[-1][1] + 1 == value:
+            ranges[-1][1] = value
+        else:
+            ranges.append([value, value])
+    return ranges
+
+
+def from_ranges(ranges):
+    return [value for first, last in ranges for value in range(first, last + 1)]
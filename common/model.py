@@ -0,0 +1,352 @@
+import random
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from common.pesel import PeselAllocator
+
+# the enums of lab3/blood-ddl.sql, shared by both seeders
+BLOOD_TYPES = ("0", "A", "B", "AB")
+BLOOD_RHS = ("+", "-")
+SEXES = ("M", "F")
+# lab12 spells the sex out
+SEX_NAMES = {"M": "Male", "F": "Female"}
+ORDER_STATES = ("COMPLETED", "AWAITING", "CANCELED")
+# lab12 writes the order states in lower case
+ORDER_STATE_NAMES = {"COMPLETED": "completed", "AWAITING": "awaiting", "CANCELED": "cancelled"}
+CERTIFICATE_LEVELS = ("I", "II", "III")
+
+EMAIL_DOMAINS = ("example.com", "mail.com", "webmail.com", "testmail.com", "demo.com")
+DONATION_DAYS = 10000
+
+COUNTS = {
+    "users": 5000,
+    "doctors": 20,
+    "nurses": 30,
+    "moderators": 10,
+    "hospitals": 10,
+    "donors": 2000,
+    "drivers": 15,
+    "transports": 10000,
+    "orders": 20,
+    "facilities": 5,
+    "donations": 50,
+    "donation_rounds": 100,
+    "certificates": 100,
+}
+
+POLISH_SIGNS = str.maketrans("ąćęłńóśźżü", "acelnoszzu")
+
+
+@dataclass(slots=True)
+class User:
+    id: int
+    first_name: str
+    last_name: str
+    login: str
+    email: str
+    password: str
+    phone_number: str
+
+
+@dataclass(slots=True)
+class Doctor:
+    id: int
+    user_id: int
+
+
+@dataclass(slots=True)
+class Moderator:
+    id: int
+    user_id: int
+
+
+@dataclass(slots=True)
+class Nurse:
+    id: int
+    first_name: str
+    last_name: str
+    phone_number: str
+
+
+@dataclass(slots=True)
+class Driver:
+    id: int
+    first_name: str
+    last_name: str
+
+
+@dataclass(slots=True)
+class Transport:
+    id: int
+    driver_id: int
+
+
+@dataclass(slots=True)
+class Hospital:
+    id: int
+    name: str
+    address: str
+    user_id: int
+
+
+@dataclass(slots=True)
+class Facility:
+    id: int
+    name: str
+    address: str
+    email: str
+    phone_number: str
+    doctor_ids: list = field(default_factory=list)
+    nurse_ids: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Donor:
+    id: int
+    user_id: int
+    pesel: str
+    birth_date: date
+    sex: str
+    blood_type: str
+    blood_rh: str
+
+
+@dataclass(slots=True)
+class Certificate:
+    id: int
+    level: str
+    acquisition_date: date
+    donor_id: int
+
+
+@dataclass(slots=True)
+class Order:
+    id: int
+    date: date
+    state: str
+    is_urgent: bool
+    blood_type: str
+    blood_rh: str
+    bag_count: int
+    transport_id: int
+    hospital_id: int
+
+
+@dataclass(slots=True)
+class Donation:
+    id: int
+    date: date
+    donor_id: int
+    nurse_id: int
+
+
+@dataclass(slots=True)
+class Examination:
+    id: int
+    date: date
+    weight: float
+    height: int
+    diastolic_blood_pressure: int
+    systolic_blood_pressure: int
+    is_qualified: bool
+    form_number: str
+    donor_id: int
+    doctor_id: int
+
+
+@dataclass(slots=True)
+class LabResult:
+    id: int
+    date: date
+    red_cells_count: float
+    white_cells_count: float
+    platelet_count: float
+    hemoglobin_level: float
+    hematocrit_level: float
+    glucose_level: float
+    is_qualified: bool
+
+
+@dataclass(slots=True)
+class BloodBag:
+    id: int
+    volume: int
+    donation_id: int
+    lab_result_id: int
+    facility_id: int
+    order_id: int = None
+
+
+def ascii_name(name):
+    return name.lower().replace(" ", "").translate(POLISH_SIGNS)
+
+
+def scaled(counts, scale):
+    # donation_rounds is the history length per donor, scaling the donors
+    # already scales the donations
+    return {
+        name: count if name == "donation_rounds" else max(1, round(count * scale))
+        for name, count in counts.items()
+    }
+
+
+class Dataset:
+    # every entity of both databases, generated once with integer ids starting
+    # at 1; lab4/emit_postgres.py and lab12/emit_mongo.py write the same records,
+    # so both engines hold identical data
+
+    def __init__(self):
+        self.users = []
+        self.doctors = []
+        self.moderators = []
+        self.nurses = []
+        self.drivers = []
+        self.transports = []
+        self.hospitals = []
+        self.facilities = []
+        self.donors = []
+        self.certificates = []
+        self.orders = []
+        self.donations = []
+        self.examinations = []
+        self.lab_results = []
+        self.blood_bags = []
+
+    @classmethod
+    def generate(cls, fake, seed, now=None, counts=None):
+        # fake: a Faker (or common.pools.PooledFaker) instance, seeded here
+        dataset = cls()
+        dataset.rng = random.Random(seed)
+        dataset.fake = fake
+        dataset.fake.seed_instance(seed)
+        now = now or datetime.now()
+        dataset.now = now.date() if isinstance(now, datetime) else now
+        counts = counts or COUNTS
+
+        dataset.generate_people(counts)
+        dataset.generate_places(counts)
+        dataset.generate_donors(counts)
+        dataset.generate_orders(counts)
+        dataset.generate_donations(counts)
+        dataset.fill_orders()
+        del dataset.rng, dataset.fake
+        return dataset
+
+    def random_date(self, start, end=None):
+        end = end or self.now
+        return start + timedelta(days=self.rng.randint(0, max((end - start).days, 0)))
+
+    def generate_people(self, counts):
+        rng, fake = self.rng, self.fake
+        for user_id in range(1, counts["users"] + 1):
+            first_name, last_name = fake.first_name(), fake.last_name()
+            # the id makes login, email and phone number unique without any registry
+            login = f"{ascii_name(first_name)[:3]}{ascii_name(last_name)}{user_id}"
+            self.users.append(User(
+                user_id, first_name, last_name, login,
+                f"{login}@{rng.choice(EMAIL_DOMAINS)}",
+                fake.password(length=10, special_chars=True, upper_case=True).replace("_", "!"),
+                f"+48{500000000 + user_id}"))
+
+        user_ids = [user.id for user in self.users]
+        self.doctors = [Doctor(i, user_id) for i, user_id in
+                        enumerate(rng.sample(user_ids, min(counts["doctors"], len(user_ids))), 1)]
+        self.moderators = [Moderator(i, user_id) for i, user_id in
+                           enumerate(rng.sample(user_ids, min(counts["moderators"], len(user_ids))), 1)]
+        self.nurses = [Nurse(i, fake.first_name(), fake.last_name(), f"+48{600000000 + i}")
+                       for i in range(1, counts["nurses"] + 1)]
+        self.drivers = [Driver(i, fake.first_name(), fake.last_name()) for i in range(1, counts["drivers"] + 1)]
+        self.transports = [Transport(i, rng.choice(self.drivers).id) for i in range(1, counts["transports"] + 1)]
+
+    def generate_places(self, counts):
+        rng, fake = self.rng, self.fake
+        user_ids = [user.id for user in self.users]
+        self.hospitals = [
+            Hospital(i, f"Szpital {fake.city()}", fake.address().replace("\n", ", "), user_id)
+            for i, user_id in enumerate(rng.sample(user_ids, min(counts["hospitals"], len(user_ids))), 1)
+        ]
+        for i in range(1, counts["facilities"] + 1):
+            self.facilities.append(Facility(
+                i, f"Centrum Krwiodawstwa {fake.city()}", fake.address().replace("\n", ", "),
+                f"centrum{i}@krwiodawstwo.pl", f"+48{220000000 + i}"))
+
+        for doctor in self.doctors:
+            for facility in rng.sample(self.facilities, min(rng.randint(1, 3), len(self.facilities))):
+                facility.doctor_ids.append(doctor.id)
+        for nurse in self.nurses:
+            for facility in rng.sample(self.facilities, min(rng.randint(1, 3), len(self.facilities))):
+                facility.nurse_ids.append(nurse.id)
+
+    def generate_donors(self, counts):
+        rng = self.rng
+        pesels = PeselAllocator()
+        user_ids = [user.id for user in self.users]
+        for i, user_id in enumerate(rng.sample(user_ids, min(counts["donors"], len(user_ids))), 1):
+            birth_date = self.random_date(self.now - timedelta(days=int(61 * 365.25) - 1),
+                                          self.now - timedelta(days=int(18 * 365.25) + 1))
+            sex = rng.choice(SEXES)
+            self.donors.append(Donor(i, user_id, pesels.allocate(birth_date, sex), birth_date, sex,
+                                     rng.choice(BLOOD_TYPES), rng.choice(BLOOD_RHS)))
+
+        pairs = set()
+        while len(pairs) < min(counts["certificates"], len(self.donors) * len(CERTIFICATE_LEVELS)):
+            pairs.add((rng.choice(self.donors).id, rng.choice(CERTIFICATE_LEVELS)))
+        for i, (donor_id, level) in enumerate(sorted(pairs), 1):
+            self.certificates.append(Certificate(i, level, self.random_date(date(2015, 1, 1)), donor_id))
+
+    def generate_orders(self, counts):
+        rng = self.rng
+        for i in range(1, counts["orders"] + 1):
+            state = rng.choice(ORDER_STATES)
+            self.orders.append(Order(
+                i, self.random_date(self.now - timedelta(days=365)), state, rng.random() < 0.3,
+                rng.choice(BLOOD_TYPES), rng.choice(BLOOD_RHS), rng.randint(1, 3),
+                rng.choice(self.transports).id if state != "AWAITING" else None,
+                rng.choice(self.hospitals).id))
+
+    def generate_donations(self, counts):
+        rng = self.rng
+        for _ in range(counts["donation_rounds"]):
+            for donor in rng.sample(self.donors, min(counts["donations"], len(self.donors))):
+                # never before the donor turned 18
+                adult_days = (self.now - donor.birth_date).days - int(18 * 365.25)
+                donation_date = self.now - timedelta(days=rng.randint(1, max(1, min(DONATION_DAYS, adult_days))))
+                i = len(self.donations) + 1
+
+                self.donations.append(Donation(i, donation_date, donor.id, rng.choice(self.nurses).id))
+                self.examinations.append(Examination(
+                    i, donation_date, round(rng.uniform(50.0, 100.0), 2), rng.randint(150, 200),
+                    rng.randint(60, 90), rng.randint(90, 140), rng.random() < 8 / 9,
+                    str(500000000 + i), donor.id, rng.choice(self.doctors).id))
+                self.lab_results.append(LabResult(
+                    i, min(donation_date + timedelta(days=rng.randint(1, 7)), self.now),
+                    round(rng.uniform(4.0, 6.0), 2), round(rng.uniform(4.0, 11.0), 2),
+                    round(rng.uniform(150, 450), 2), round(rng.uniform(12.0, 18.0), 2),
+                    round(rng.uniform(36.0, 52.0), 2), round(rng.uniform(70, 140), 2), rng.random() < 8 / 9))
+                self.blood_bags.append(BloodBag(i, rng.randint(450, 550), i, i, rng.choice(self.facilities).id))
+
+    def fill_orders(self):
+        # completed orders get qualified bags of exactly their blood group,
+        # oldest donations first
+        donors = {donor.id: donor for donor in self.donors}
+        qualified = {lab_result.id for lab_result in self.lab_results if lab_result.is_qualified}
+        available = {}
+        for bag in self.blood_bags:
+            if bag.lab_result_id in qualified:
+                donor = donors[self.donations[bag.donation_id - 1].donor_id]
+                available.setdefault((donor.blood_type, donor.blood_rh), []).append(bag)
+        for bags in available.values():
+            bags.sort(key=lambda bag: self.donations[bag.donation_id - 1].date, reverse=True)
+
+        for order in self.orders:
+            if order.state != "COMPLETED":
+                continue
+            bags = available.get((order.blood_type, order.blood_rh), [])
+            for _ in range(min(order.bag_count, len(bags))):
+                bags.pop().order_id = order.id
+
+    def donor(self, donor_id):
+        return self.donors[donor_id - 1]
+
+    def user(self, user_id):
+        return self.users[user_id - 1]
@@ -0,0 +1,99 @@
+from collections import defaultdict
+from datetime import date, datetime
+
+WEIGHTS = (1, 3, 7, 9, 1, 3, 7, 9, 1, 3)
+
+# the century is encoded in the month
+MONTH_OFFSETS = {18: 80, 19: 0, 20: 20, 21: 40, 22: 60}
+
+# per birth date and sex: serial 000-999 times five sex digits
+SERIALS = 5000
+
+# coprime with SERIALS, spreads the serials handed out for one day over the range
+STRIDE = 3571
+
+
+def checksum(digits):
+    return (10 - sum(weight * digit for weight, digit in zip(WEIGHTS, digits)) % 10) % 10
+
+
+def weighted(digits, weights):
+    return "".join(map(str, digits)), sum(weight * digit for weight, digit in zip(weights, digits))
+
+
+def serial_digits(serial, sex):
+    number, sex_digit = divmod(serial, 5)
+    return [number // 100, number // 10 % 10, number % 10, 2 * sex_digit + (1 if sex == "M" else 0)]
+
+
+# the last four digits and their part of the checksum, for every serial and sex
+SUFFIXES = {sex: [weighted(serial_digits(serial, sex), WEIGHTS[6:]) for serial in range(SERIALS)]
+            for sex in "MF"}
+
+_prefixes = {}
+
+
+def prefix(birth_date):
+    # date digits and their part of the checksum, computed once per date
+    if birth_date not in _prefixes:
+        month = birth_date.month + MONTH_OFFSETS[birth_date.year // 100]
+        _prefixes[birth_date] = weighted([
+            birth_date.year // 10 % 10, birth_date.year % 10,
+            month // 10, month % 10,
+            birth_date.day // 10, birth_date.day % 10,
+        ], WEIGHTS[:6])
+    return _prefixes[birth_date]
+
+
+def encode(birth_date, sex, serial):
+    # sex: "M"/"F" or anything starting with them, e.g. "Male"
+    if isinstance(birth_date, datetime):
+        birth_date = birth_date.date()
+    date_digits, date_sum = prefix(birth_date)
+    serial_part, serial_sum = SUFFIXES[sex[0]][serial]
+    return f"{date_digits}{serial_part}{(10 - (date_sum + serial_sum) % 10) % 10}"
+
+
+def decode(pesel):
+    digits = [int(c) for c in pesel]
+    year, month, day = digits[0] * 10 + digits[1], digits[2] * 10 + digits[3], digits[4] * 10 + digits[5]
+    century = next(century for century, offset in MONTH_OFFSETS.items() if offset < month <= offset + 12)
+    sex = "M" if digits[9] % 2 else "F"
+    return date(century * 100 + year, month - MONTH_OFFSETS[century], day), sex
+
+
+def is_valid(pesel):
+    if len(pesel) != 11 or not pesel.isdigit():
+        return False
+    try:
+        decode(pesel)
+    except (StopIteration, ValueError):
+        return False
+    return checksum([int(c) for c in pesel[:10]]) == int(pesel[10])
+
+
+class PeselAllocator:
+    # hands out the serials of each (birth date, sex) from a counter, so every
+    # number is unique by construction; shards take every shards-th serial and
+    # never meet, numbers already in the database are skipped
+    def __init__(self, taken=(), shard=0, shards=1):
+        self.taken = set(taken)
+        self.shard = shard
+        self.shards = shards
+        self.allocated = defaultdict(int)
+
+    def allocate(self, birth_date, sex):
+        if isinstance(birth_date, datetime):
+            birth_date = birth_date.date()
+        key = (birth_date, sex[0])
+        while True:
+            n = self.allocated[key] * self.shards + self.shard
+            if n >= SERIALS:
+                raise ValueError(f"all {SERIALS} PESEL numbers of {birth_date} {key[1]} are taken")
+            self.allocated[key] += 1
+            pesel = encode(birth_date, sex, STRIDE * n % SERIALS)
+            if pesel not in self.taken:
+                return pesel
+
+    def batch(self, birth_dates, sexes):
+        return [self.allocate(birth_date, sex) for birth_date, sex in zip(birth_dates, sexes)]
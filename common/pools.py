@@ -0,0 +1,135 @@
+import json
+import os
+import random
+import threading
+from pathlib import Path
+
+import faker
+from faker import Faker
+
+CACHE_DIR = Path(os.getenv("VALUE_POOL_CACHE", Path(__file__).resolve().parent.parent / ".cache" / "pools"))
+POOL_SIZE = 10000
+SAMPLE_BLOCK = 4096
+
+# providers called without positional arguments that are worth pooling, every
+# other call goes straight to faker
+POOLED = {"first_name", "last_name", "company", "address", "city", "email", "user_name", "phone_number", "password"}
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def pool_path(locale, seed, field, size, kwargs):
+    options = "".join(f"-{name}={value}" for name, value in sorted(kwargs.items()))
+    # faker's word lists change between versions, so does the pool
+    return CACHE_DIR / f"{locale}-{seed}-{field}{options}-{size}-faker{faker.VERSION}.json"
+
+
+def load_pool(locale, seed, field, size=POOL_SIZE, **kwargs):
+    # generated once per locale, seed and field, then read back from disk
+    key = (locale, seed, field, size, tuple(sorted(kwargs.items())))
+    with _lock:
+        if key in _pools:
+            return _pools[key]
+
+        path = pool_path(locale.replace("-", "_"), seed, field, size, kwargs)
+        if path.exists():
+            values = json.loads(path.read_text(encoding="utf-8"))
+        else:
+            fake = Faker(locale)
+            fake.seed_instance(f"{seed}:pool:{field}")
+            provider = getattr(fake, field)
+            values = [provider(**kwargs) for _ in range(size)]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # several seeding processes may build the same pool at once
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(values, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+
+        _pools[key] = values
+        return values
+
+
+def with_suffix(value, n):
+    if "@" in value:
+        local, domain = value.rsplit("@", 1)
+        return f"{local}{n}@{domain}"
+    return f"{value}{n}"
+
+
+class PooledFaker:
+    # stands in for a Faker instance: pooled providers return a value drawn from
+    # their pool, indexes are drawn a block at a time from the instance's own
+    # generator, so seed_instance still makes a stage reproducible
+    def __init__(self, locale, seed, size=POOL_SIZE, fake=None):
+        self.locale = locale
+        self.pool_seed = seed
+        self.size = size
+        self.faker = fake or Faker(locale)
+        self.rng = random.Random()
+        self.buffers = {}
+        self.unique = UniqueValues(self)
+
+    def seed_instance(self, seed):
+        self.rng.seed(seed)
+        self.faker.seed_instance(seed)
+        self.buffers.clear()
+        self.unique.clear()
+
+    def draw(self, key, field, kwargs):
+        buffer = self.buffers.get(key)
+        if not buffer:
+            pool = load_pool(self.locale, self.pool_seed, field, self.size, **kwargs)
+            buffer = self.rng.choices(pool, k=SAMPLE_BLOCK)
+            buffer.reverse()
+            self.buffers[key] = buffer
+        return buffer.pop()
+
+    def __getattr__(self, name):
+        provider = getattr(self.faker, name)
+        if name not in POOLED:
+            return provider
+
+        def sample(*args, **kwargs):
+            if args:
+                return provider(*args, **kwargs)
+            key = (name, tuple(sorted(kwargs.items()))) if kwargs else name
+            buffer = self.buffers.get(key)
+            if buffer:
+                return buffer.pop()
+            return self.draw(key, name, kwargs)
+
+        # looked up once, later calls find it on the instance
+        setattr(self, name, sample)
+        return sample
+
+
+class UniqueValues:
+    # fake.unique.<field>() like faker's own proxy, but a value that came up
+    # before gets a number appended (before the @ of an email) instead of
+    # being drawn again, which a small pool would run out of
+    def __init__(self, source):
+        self.source = source
+        self.seen = set()
+        self.next_suffix = {}
+
+    def clear(self):
+        self.seen.clear()
+        self.next_suffix.clear()
+
+    def __getattr__(self, name):
+        provider = getattr(self.source, name)
+
+        def sample(*args, **kwargs):
+            value = provider(*args, **kwargs)
+            if value in self.seen:
+                n = self.next_suffix.get(value, 1)
+                while with_suffix(value, n) in self.seen:
+                    n += 1
+                self.next_suffix[value] = n + 1
+                value = with_suffix(value, n)
+            self.seen.add(value)
+            return value
+
+        setattr(self, name, sample)
+        return sample
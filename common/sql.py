@@ -0,0 +1,40 @@
+import re
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+INDEX_NAME = re.compile(r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?"?(\w+)"?', re.I)
+
+
+def statements(path):
+    # splits a .sql file of the labs into (comment, statement) pairs, the
+    # comment being the last "--" line written above the statement
+    comment = None
+    lines = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        stripped = line.strip()
+        if not lines and stripped.startswith("--"):
+            comment = stripped.lstrip("-").strip() or comment
+            continue
+        if not lines and not stripped:
+            continue
+        lines.append(line)
+        if stripped.endswith(";"):
+            yield comment, "\n".join(lines).rstrip().rstrip(";")
+            comment = None
+            lines = []
+    if lines:
+        yield comment, "\n".join(lines).rstrip().rstrip(";")
+
+
+def queries(path):
+    return [(comment, sql) for comment, sql in statements(path) if sql.lstrip().upper().startswith("SELECT")]
+
+
+def indexes(path):
+    # CREATE INDEX statements with the index name, so they can be dropped again
+    return [
+        (INDEX_NAME.match(sql.lstrip()).group(1), sql)
+        for _, sql in statements(path)
+        if INDEX_NAME.match(sql.lstrip())
+    ]
@@ -0,0 +1,228 @@
+import struct
+from datetime import datetime, time
+from itertools import islice
+
+from bson.objectid import ObjectId
+
+from common.model import ORDER_STATE_NAMES, SEX_NAMES
+
+CHUNK_SIZE = 1000
+
+# one byte of every ObjectId tells the collection, the last seven carry the
+# integer id of the shared model, so a record gets the same _id on every run
+ENTITIES = ["users", "doctors", "moderators", "nurses", "drivers", "hospitals", "facilities",
+            "donors", "orders", "blood_bags"]
+
+
+def object_ids(now):
+    timestamp = struct.pack(">I", int(now.timestamp()))
+    codes = {entity: bytes([code]) for code, entity in enumerate(ENTITIES)}
+
+    def object_id(entity, record_id):
+        return ObjectId(timestamp + codes[entity] + record_id.to_bytes(7, "big"))
+
+    return object_id
+
+
+def as_datetime(value):
+    # BSON has no date without a time
+    return datetime.combine(value, time.min)
+
+
+def documents(dataset, now):
+    # (collection, documents) in the shapes lab12/main2.py writes; documents are
+    # built while the collection is written, the lookups below hold ids only
+    oid = object_ids(now)
+    users = dataset.user
+    donations = dataset.donations
+
+    profiles = {}
+    for role, records in [("doctor", dataset.doctors), ("donor", dataset.donors),
+                          ("moderator", dataset.moderators), ("hospital", dataset.hospitals)]:
+        for record in records:
+            profiles.setdefault(record.user_id, []).append({"role": role, f"{role}_id": oid(f"{role}s", record.id)})
+
+    doctor_facilities = {}
+    for facility in dataset.facilities:
+        for doctor_id in facility.doctor_ids:
+            doctor_facilities.setdefault(doctor_id, []).append(oid("facilities", facility.id))
+
+    examinations = {}
+    for examination in dataset.examinations:
+        examinations.setdefault(examination.donor_id, []).append(examination)
+    certificates = {}
+    for certificate in dataset.certificates:
+        certificates.setdefault(certificate.donor_id, []).append(certificate)
+
+    qualified = {lab_result.id for lab_result in dataset.lab_results if lab_result.is_qualified}
+    available = {}
+    order_bags = {}
+    for bag in dataset.blood_bags:
+        if bag.order_id is not None:
+            order_bags.setdefault(bag.order_id, []).append(oid("blood_bags", bag.id))
+        elif bag.lab_result_id in qualified:
+            available.setdefault(bag.facility_id, []).append(oid("blood_bags", bag.id))
+
+    yield "users", ({
+        "_id": oid("users", u.id),
+        "password": u.password,
+        "profiles": profiles.get(u.id, []),
+        "phone_number": u.phone_number,
+        "login": u.login,
+        "email": u.email,
+    } for u in dataset.users)
+
+    yield "doctors", ({
+        "_id": oid("doctors", d.id),
+        "user_id": oid("users", d.user_id),
+        "name": users(d.user_id).first_name,
+        "last_name": users(d.user_id).last_name,
+        "facilities": doctor_facilities.get(d.id, []),
+    } for d in dataset.doctors)
+
+    yield "donors", ({
+        "_id": oid("donors", d.id),
+        "user_id": oid("users", d.user_id),
+        "examinations": [{
+            "date": as_datetime(e.date),
+            "weight": e.weight,
+            "height": e.height,
+            "is_qualified": e.is_qualified,
+        } for e in examinations.get(d.id, [])],
+        "certificates": [{
+            "level": c.level,
+            "acquisition_date": as_datetime(c.acquisition_date),
+        } for c in certificates.get(d.id, [])],
+        "birth_date": as_datetime(d.birth_date),
+        "sex": SEX_NAMES[d.sex],
+        "blood_type": d.blood_type,
+        "blod_rh": d.blood_rh,
+        "name": users(d.user_id).first_name,
+        "last_name": users(d.user_id).last_name,
+        "pesel": d.pesel,
+    } for d in dataset.donors)
+
+    yield "moderators", ({
+        "_id": oid("moderators", m.id),
+        "user_id": oid("users", m.user_id),
+        "name": users(m.user_id).first_name,
+        "last_name": users(m.user_id).last_name,
+    } for m in dataset.moderators)
+
+    yield "hospitals", ({
+        "_id": oid("hospitals", h.id),
+        "user_id": oid("users", h.user_id),
+        "name": h.name,
+        "address": h.address,
+    } for h in dataset.hospitals)
+
+    yield "drivers", ({
+        "_id": oid("drivers", d.id),
+        "name": d.first_name,
+        "last_name": d.last_name,
+    } for d in dataset.drivers)
+
+    yield "nurses", ({
+        "_id": oid("nurses", n.id),
+        "name": n.first_name,
+        "last_name": n.last_name,
+        "phone_number": n.phone_number,
+    } for n in dataset.nurses)
+
+    yield "facilities", ({
+        "_id": oid("facilities", f.id),
+        "doctors": [{
+            "user_id": oid("users", dataset.doctors[doctor_id - 1].user_id),
+            "name": users(dataset.doctors[doctor_id - 1].user_id).first_name,
+            "last_name": users(dataset.doctors[doctor_id - 1].user_id).last_name,
+        } for doctor_id in f.doctor_ids],
+        "name": f.name,
+        "address": f.address,
+        "phone_number": f.phone_number,
+        "available_blood_bags": available.get(f.id, []),
+        "nurses": [{
+            "name": dataset.nurses[nurse_id - 1].first_name,
+            "last_name": dataset.nurses[nurse_id - 1].last_name,
+            "phone_number": dataset.nurses[nurse_id - 1].phone_number,
+            "nurse_id": oid("nurses", nurse_id),
+        } for nurse_id in f.nurse_ids],
+        "email": f.email,
+    } for f in dataset.facilities)
+
+    def order_document(o):
+        hospital = dataset.hospitals[o.hospital_id - 1]
+        realizations = []
+        # a shipped order has one realization, carrying all of its bags
+        if o.transport_id is not None:
+            realizations.append({
+                "date": as_datetime(o.date),
+                "transport": {"driver_id": oid("drivers", dataset.transports[o.transport_id - 1].driver_id)},
+                "blood_bags": order_bags.get(o.id, []),
+            })
+        return {
+            "_id": oid("orders", o.id),
+            "date": as_datetime(o.date),
+            "is_urgent": o.is_urgent,
+            "state": ORDER_STATE_NAMES[o.state],
+            "blood_type": o.blood_type,
+            "blood_rh": o.blood_rh,
+            "bag_count": o.bag_count,
+            "hospital": {
+                "address": hospital.address,
+                "user_id": oid("users", hospital.user_id),
+                "name": hospital.name,
+                "hospital_id": oid("hospitals", hospital.id),
+            },
+            "realizations": realizations,
+        }
+
+    yield "orders", (order_document(o) for o in dataset.orders)
+
+    def blood_bag_document(b):
+        donation = donations[b.donation_id - 1]
+        lab_result = dataset.lab_results[b.lab_result_id - 1]
+        bag = {
+            "_id": oid("blood_bags", b.id),
+            "volume": float(b.volume),
+            "donation": {
+                "date": as_datetime(donation.date),
+                "donor_id": oid("donors", donation.donor_id),
+                "nurse_id": oid("nurses", donation.nurse_id),
+            },
+            "facility_id": oid("facilities", b.facility_id),
+            "lab_result": {
+                "date": as_datetime(lab_result.date),
+                "is_qualified": lab_result.is_qualified,
+                "red_cells_count": lab_result.red_cells_count,
+                "white_cells_count": lab_result.white_cells_count,
+                "platelet_count": lab_result.platelet_count,
+                "hemoglobin_level": lab_result.hemoglobin_level,
+                "hematocrit_level": lab_result.hematocrit_level,
+                "glucose_level": lab_result.glucose_level,
+            },
+        }
+        if b.order_id is not None:
+            bag["order"] = oid("orders", b.order_id)
+        return bag
+
+    yield "blood_bags", (blood_bag_document(b) for b in dataset.blood_bags)
+
+
+def emit(db, dataset, now, chunk_size=CHUNK_SIZE, on_collection=None):
+    # replaces every collection with the dataset, only one chunk of documents
+    # is alive at a time
+    counts = {}
+    for name, docs in documents(dataset, now):
+        collection = db[name]
+        collection.delete_many({})
+        counts[name] = 0
+        docs = iter(docs)
+        while True:
+            chunk = list(islice(docs, chunk_size))
+            if not chunk:
+                break
+            collection.insert_many(chunk, ordered=False)
+            counts[name] += len(chunk)
+        if on_collection:
+            on_collection(name, counts[name])
+    return counts
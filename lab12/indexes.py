@@ -0,0 +1,214 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from pymongo import IndexModel
+
+from reports import REPORTS, reference_day
+from reports import pipeline as report_pipeline
+
+INDEXES = {
+    "blood_bags": [
+        # last donation per donor: a $sort on it turns the $group into a DISTINCT_SCAN
+        IndexModel([("donation.donor_id", 1), ("donation.date", -1)], name="bags_donor_date"),
+        # donations of a period, covered up to the $group by donor
+        IndexModel([("donation.date", 1), ("donation.donor_id", 1)], name="bags_date_donor"),
+        IndexModel([("facility_id", 1)], name="bags_facility"),
+        IndexModel([("order", 1)], name="bags_order", partialFilterExpression={"order": {"$exists": True}}),
+        # qualified bags only; a partial filter cannot say "no order", unassigned
+        # bags are the order: null range of the index
+        IndexModel([("order", 1), ("donation.donor_id", 1)], name="bags_qualified_by_order",
+                   partialFilterExpression={"lab_result.is_qualified": True}),
+    ],
+    "donors": [
+        IndexModel([("blood_type", 1), ("blod_rh", 1)], name="donors_blood_group"),
+        IndexModel([("certificates.level", 1)], name="donors_certificate_level", sparse=True),
+        IndexModel([("examinations.date", 1)], name="donors_examination_date"),
+    ],
+    "users": [
+        IndexModel([("profiles.role", 1)], name="users_profile_role"),
+    ],
+    "orders": [
+        IndexModel([("state", 1), ("is_urgent", 1)], name="orders_state_urgent"),
+        IndexModel([("hospital.hospital_id", 1), ("hospital.name", 1)], name="orders_hospital"),
+    ],
+}
+
+# reports that aggregate every document of their collection; an index would
+# only add a fetch per document, explain is expected to show a COLLSCAN
+FULL_SCANS = {
+    "disqualified_percentage",
+    "average_weight_height",
+    "lab_results_per_blood_group",
+    "facility_statistics",
+    "average_qualification_time",
+    "average_donations_per_donor",
+}
+
+SCAN_STAGES = {"IXSCAN", "DISTINCT_SCAN", "COUNT_SCAN", "IDHACK", "EXPRESS_IXSCAN"}
+
+
+def replace_first(stages, stage):
+    return [stage] + stages[1:]
+
+
+def sorted_by(fields, stages):
+    # a leading $sort on indexed fields makes the planner walk the index, and
+    # the scan is covered when the rest of the pipeline needs only those fields
+    return [{"$sort": fields}] + stages
+
+
+# name -> the report rewritten so it can use the indexes above, like the
+# sargable rewrites of lab6; the other reports use them as they are
+REWRITES = {
+    "donors_per_blood_group": lambda stages: sorted_by({"blood_type": 1, "blod_rh": 1}, stages),
+    "available_bags_per_blood_group": lambda stages: replace_first(
+        stages, {"$match": {"lab_result.is_qualified": True, "order": None}}),
+    "donor_donations": lambda stages: sorted_by({"donation.donor_id": 1}, stages),
+    "eligible_donors": lambda stages: sorted_by({"donation.donor_id": 1, "donation.date": -1}, replace_first(
+        stages, {"$group": {"_id": "$donation.donor_id", "last_donation_date": {"$first": "$donation.date"}}})),
+    "certified_donors": lambda stages: replace_first(stages, {"$match": {"certificates.level": {"$exists": True}}}),
+    "orders_per_hospital": lambda stages: sorted_by({"hospital.hospital_id": 1}, stages),
+}
+
+# not a lab5 report, the users of one role through the multikey profiles index
+EXTRA = {
+    "doctor_users": ("users", lambda today: [
+        {"$match": {"profiles.role": "doctor"}},
+        {"$project": {"login": 1, "email": 1}},
+    ]),
+}
+
+
+def pipeline(name, now=None, indexed=True):
+    if name in EXTRA:
+        collection, build = EXTRA[name]
+        return collection, build(reference_day(now))
+    collection, stages = report_pipeline(name, now)
+    if indexed and name in REWRITES:
+        stages = REWRITES[name](stages)
+    return collection, stages
+
+
+def create_indexes(db):
+    for collection, indexes in INDEXES.items():
+        db[collection].create_indexes(indexes)
+
+
+def drop_indexes(db):
+    for collection, indexes in INDEXES.items():
+        existing = set(db[collection].index_information())
+        for index in indexes:
+            if index.document["name"] in existing:
+                db[collection].drop_index(index.document["name"])
+
+
+def walk(node, found):
+    if isinstance(node, list):
+        for item in node:
+            walk(item, found)
+        return
+    if not isinstance(node, dict):
+        return
+    if isinstance(node.get("stage"), str):
+        found["stages"].add(node["stage"])
+    if isinstance(node.get("indexName"), str):
+        found["indexes"].add(node["indexName"])
+    # $lookup reports how it reached the foreign collection
+    found["indexes"].update(node.get("indexesUsed", []))
+    if isinstance(node.get("collectionScans"), int):
+        found["lookup_scans"] += node["collectionScans"]
+    for key, value in node.items():
+        if key != "rejectedPlans":
+            walk(value, found)
+
+
+def explain(db, name, now=None, indexed=True):
+    collection, stages = pipeline(name, now, indexed)
+    result = db.command({"explain": {"aggregate": collection, "pipeline": stages, "cursor": {}},
+                         "verbosity": "executionStats"})
+    found = {"stages": set(), "indexes": set(), "lookup_scans": 0}
+    walk(result, found)
+    return {
+        "stages": sorted(found["stages"]),
+        "indexes": sorted(found["indexes"]),
+        "lookup_scans": found["lookup_scans"],
+        "index_backed": ("COLLSCAN" not in found["stages"] and not found["lookup_scans"]
+                         and bool(found["stages"] & SCAN_STAGES)),
+    }
+
+
+def verify(db, names, now=None):
+    # every report outside FULL_SCANS has to be answered from an index
+    failed = []
+    for name in names:
+        plan = explain(db, name, now)
+        expected = name not in FULL_SCANS
+        status = "ok" if plan["index_backed"] or not expected else "NOT INDEX-BACKED"
+        if status != "ok":
+            failed.append(name)
+        print(f"{name:<36}{status:<18}{', '.join(plan['stages'])}; indexes: {', '.join(plan['indexes']) or '-'}"
+              + (f"; {plan['lookup_scans']} $lookup collection scans" if plan["lookup_scans"] else ""))
+    return failed
+
+
+def time_pipeline(db, name, now, indexed, runs, warmup):
+    collection, stages = pipeline(name, now, indexed)
+    samples = []
+    for i in range(warmup + runs):
+        start = time.perf_counter()
+        list(db[collection].aggregate(stages, allowDiskUse=True))
+        if i >= warmup:
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def benchmark(db, names, runs, warmup, now=None):
+    # median ms of every report on the lab12 pipelines without the indexes,
+    # then with the indexes and the rewrites
+    drop_indexes(db)
+    before = {name: time_pipeline(db, name, now, False, runs, warmup) for name in names}
+    create_indexes(db)
+    after = {name: time_pipeline(db, name, now, True, runs, warmup) for name in names}
+
+    counts = {collection: db[collection].estimated_document_count() for collection in INDEXES}
+    print(f"\n{', '.join(f'{n} {c}' for c, n in counts.items())}; median ms of {runs} runs")
+    print(f"{'report':<36}{'no indexes':>12}{'indexes':>12}{'speedup':>10}")
+    for name in names:
+        speedup = before[name] / after[name] if after[name] else float("inf")
+        print(f"{name:<36}{before[name]:>12.2f}{after[name]:>12.2f}{speedup:>9.2f}x")
+    return before, after
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from pymongo.mongo_client import MongoClient
+    from pymongo.server_api import ServerApi
+
+    names = list(REPORTS) + list(EXTRA)
+    parser = argparse.ArgumentParser(description="Create the lab12 indexes and check the reports use them.")
+    parser.add_argument("command", choices=["create", "drop", "verify", "benchmark"],
+                        help="verify explains every report, benchmark times them without and with the indexes")
+    parser.add_argument("--database", default="krwiodawcy")
+    parser.add_argument("--reports", nargs="+", choices=names, default=names)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = MongoClient(os.environ["MONGODB_URI"], server_api=ServerApi('1'))
+    db = client[args.database]
+
+    if args.command == "create":
+        create_indexes(db)
+    elif args.command == "drop":
+        drop_indexes(db)
+    elif args.command == "verify":
+        create_indexes(db)
+        if verify(db, args.reports):
+            sys.exit(1)
+    else:
+        benchmark(db, args.reports, args.runs, args.warmup)
+        verify(db, args.reports)
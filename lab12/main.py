@@ -1,6 +1,8 @@
 import os
 import random
+import sys
 from datetime import datetime, timedelta, time
+from pathlib import Path
 
 from dotenv import load_dotenv
 from faker import Faker
@@ -8,6 +10,10 @@ from bson.objectid import ObjectId
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.model import BLOOD_RHS, BLOOD_TYPES, ORDER_STATE_NAMES, SEX_NAMES
+from common.pesel import PeselAllocator
+
 # -----------------------
 # CONFIGURATIONS
 # -----------------------
@@ -91,11 +97,13 @@ print(f"Inserted {len(doctors_ids)} doctors.")
 donors_collection = db["donors"]
 
 # Helper for random enum picks
-possible_sexes = ["Male", "Female"]
-possible_blood_types = ["0", "A", "B", "AB"]
-possible_rh = ["+", "-"]
+possible_sexes = list(SEX_NAMES.values())
+possible_blood_types = BLOOD_TYPES
+possible_rh = BLOOD_RHS
+possible_states = list(ORDER_STATE_NAMES.values())
 
 donors_data = []
+pesels = PeselAllocator()
 for _ in range(COUNT_DONORS):
     random_user_id = random.choice(users_ids)
     birth_date = fake_pl.date_of_birth(minimum_age=18, maximum_age=65)
@@ -116,16 +124,17 @@ for _ in range(COUNT_DONORS):
             "is_qualified": is_qual
         })
 
+    sex = random.choice(possible_sexes)
     donors_data.append({
         "user_id": random_user_id,
         "examinations": examinations,
         "birth_date": birth_date,
-        "sex": random.choice(possible_sexes),
+        "sex": sex,
         "blood_type": random.choice(possible_blood_types),
         "blod_rh": random.choice(possible_rh),
         "name": fake_pl.first_name(),
         "last_name": fake_pl.last_name(),
-        "pesel": fake_pl.pesel(),
+        "pesel": pesels.allocate(birth_date, sex),
     })
 
 donors_insert_result = donors_collection.insert_many(donors_data)
@@ -288,7 +297,7 @@ for _ in range(COUNT_ORDERS):
 
     orders_data.append({
         "is_urgent": fake_pl.boolean(chance_of_getting_true=30),
-        "state": random.choice(["partially_completed", "completed", "awaiting", "cancelled"]),
+        "state": random.choice(possible_states),
         "hospital": hospital_embed,
         "realizations": reals
     })
@@ -1,13 +1,27 @@
+import argparse
 import os
 import random
+import struct
+import sys
 from datetime import datetime, time, timedelta
+from itertools import islice
+from pathlib import Path
 
 from dotenv import load_dotenv
 from faker import Faker
 from bson.objectid import ObjectId
+from pymongo import UpdateOne
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 
+from scheduler import run_stages
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.manifest import RunManifest
+from common.model import BLOOD_RHS, BLOOD_TYPES, ORDER_STATE_NAMES, SEX_NAMES
+from common.pesel import PeselAllocator
+from common.pools import PooledFaker, with_suffix
+
 COUNT_USERS = 2000
 COUNT_DOCTORS = 300
 COUNT_DONORS = 700
@@ -19,6 +33,44 @@ COUNT_FACILITIES = 100
 COUNT_ORDERS = 500
 COUNT_BLOODBAGS = 3000
 
+CHUNK_SIZE = 1000
+STAGE_WORKERS = 4
+
+COUNTS = {
+    "users": COUNT_USERS,
+    "doctors": COUNT_DOCTORS,
+    "donors": COUNT_DONORS,
+    "moderators": COUNT_MODERATORS,
+    "hospitals": COUNT_HOSPITALS,
+    "drivers": COUNT_DRIVERS,
+    "nurses": COUNT_NURSES,
+    "facilities": COUNT_FACILITIES,
+    "orders": COUNT_ORDERS,
+    "blood_bags": COUNT_BLOODBAGS,
+}
+
+parser = argparse.ArgumentParser(description="Populate the MongoDB blood donation database with random data.")
+parser.add_argument("--seed", type=int, default=None,
+                    help="base seed, every stage derives its own seed from it")
+parser.add_argument("--manifest", default="seed-manifest.json",
+                    help="file recording the seed, counts and completed stages of the run")
+parser.add_argument("--resume", action="store_true",
+                    help="continue the run recorded in --manifest, completed stages are not written again")
+parser.add_argument("--vectorized", action="store_true",
+                    help="generate the donor examinations as whole numpy columns")
+parser.add_argument("--value-pools", type=int, default=0, metavar="SIZE",
+                    help="draw names, cities, addresses, emails and the like from pools of SIZE faker values "
+                         "per field, generated once per seed and cached in .cache/pools")
+args = parser.parse_args()
+
+manifest = RunManifest.open(args.manifest, seed=args.seed, counts=COUNTS,
+                            settings={"vectorized": args.vectorized, "value_pools": args.value_pools},
+                            resume=args.resume)
+NOW = manifest.reference_time
+VECTORIZED = manifest.data.get("settings", {}).get("vectorized", False)
+VALUE_POOLS = manifest.data.get("settings", {}).get("value_pools", 0)
+print(f"seed: {manifest.seed}, manifest: {args.manifest}")
+
 load_dotenv()
 uri = os.getenv("MONGODB_URI")
 
@@ -29,8 +81,6 @@ if not uri:
 client = MongoClient(uri, server_api=ServerApi('1'))
 db = client["krwiodawcy"]
 
-fake_pl = Faker("pl_PL")
-
 try:
     client.admin.command('ping')
     print("Pinged your deployment. Successfully connected to MongoDB!")
@@ -38,326 +88,448 @@ except Exception as e:
     print("Connection error:", e)
     exit(1)
 
-users_collection = db["users"]
-users_collection.delete_many({})
-
-users_data = []
-for _ in range(COUNT_USERS):
-    users_data.append({
-        "password": fake_pl.password(),
-        "profiles": [],
-        "phone_number": fake_pl.phone_number(),
-        "login": fake_pl.user_name(),
-        "email": fake_pl.email()
-    })
-
-users_insert_result = users_collection.insert_many(users_data)
-users_ids = list(users_insert_result.inserted_ids)
-print(f"Inserted {len(users_ids)} users.")
-
-doctors_collection = db["doctors"]
-doctors_collection.delete_many({})
-
-doctors_data = []
-for _ in range(COUNT_DOCTORS):
-    random_user_id = random.choice(users_ids)
-    doctors_data.append({
-        "user_id": random_user_id,
-        "name": fake_pl.first_name(),
-        "last_name": fake_pl.last_name(),
-        "facilities": []
-    })
-
-doctors_insert_result = doctors_collection.insert_many(doctors_data)
-doctors_ids = list(doctors_insert_result.inserted_ids)
-print(f"Inserted {len(doctors_ids)} doctors.")
-
-donors_collection = db["donors"]
-donors_collection.delete_many({})
-
-possible_sexes = ["Male", "Female"]
-possible_blood_types = ["0", "A", "B", "AB"]
-possible_rh = ["+", "-"]
-
-donors_data = []
-for _ in range(COUNT_DONORS):
-    random_user_id = random.choice(users_ids)
-
-    birth_date = fake_pl.date_of_birth(minimum_age=18, maximum_age=65)
-    birth_date = datetime.combine(birth_date, time.min)
-
-    exam_count = random.randint(1, 5)
-    examinations = []
-    for __ in range(exam_count):
-        exam_date = fake_pl.date_between_dates(
-            date_start=birth_date.date(),
-            date_end=datetime.now().date()
-        )
-        exam_date = datetime.combine(exam_date, time.min)
-
-        weight = round(random.uniform(50, 100), 1)
-        height = round(random.uniform(150, 200), 1)
-        is_qual = random.choice([True, False])
-        examinations.append({
-            "date": exam_date,
-            "weight": weight,
-            "height": height,
-            "is_qualified": is_qual
-        })
-
-    donors_data.append({
-        "user_id": random_user_id,
-        "examinations": examinations,
-        "birth_date": birth_date,
-        "sex": random.choice(possible_sexes),
-        "blood_type": random.choice(possible_blood_types),
-        "blod_rh": random.choice(possible_rh),
-        "name": fake_pl.first_name(),
-        "last_name": fake_pl.last_name(),
-        "pesel": fake_pl.pesel(),
-    })
-
-donors_insert_result = donors_collection.insert_many(donors_data)
-donors_ids = list(donors_insert_result.inserted_ids)
-print(f"Inserted {len(donors_ids)} donors.")
-
-moderators_collection = db["moderators"]
-moderators_collection.delete_many({})
-
-moderators_data = []
-for _ in range(COUNT_MODERATORS):
-    random_user_id = random.choice(users_ids)
-    moderators_data.append({
-        "user_id": random_user_id,
-        "name": fake_pl.first_name(),
-        "last_name": fake_pl.last_name()
-    })
-
-moderators_insert_result = moderators_collection.insert_many(moderators_data)
-moderators_ids = list(moderators_insert_result.inserted_ids)
-print(f"Inserted {len(moderators_ids)} moderators.")
-
-hospitals_collection = db["hospitals"]
-hospitals_collection.delete_many({})
-
-hospitals_data = []
-for _ in range(COUNT_HOSPITALS):
-    random_user_id = random.choice(users_ids)
-    hospitals_data.append({
-        "user_id": random_user_id,
-        "name": f"Szpital {fake_pl.city()}",
-        "address": fake_pl.address().replace("\n", ", ")
-    })
-
-hospitals_insert_result = hospitals_collection.insert_many(hospitals_data)
-hospitals_ids = list(hospitals_insert_result.inserted_ids)
-print(f"Inserted {len(hospitals_ids)} hospitals.")
-
-drivers_collection = db["drivers"]
-drivers_collection.delete_many({})
-
-drivers_data = []
-for _ in range(COUNT_DRIVERS):
-    drivers_data.append({
-        "name": fake_pl.first_name(),
-        "last_name": fake_pl.last_name()
-    })
-
-drivers_insert_result = drivers_collection.insert_many(drivers_data)
-drivers_ids = list(drivers_insert_result.inserted_ids)
-print(f"Inserted {len(drivers_ids)} drivers.")
-
-nurses_collection = db["nurses"]
-nurses_collection.delete_many({})
-
-nurses_data = []
-for _ in range(COUNT_NURSES):
-    nurses_data.append({
-        "name": fake_pl.first_name(),
-        "last_name": fake_pl.last_name(),
-        "phone_number": fake_pl.phone_number()
-    })
-
-nurses_insert_result = nurses_collection.insert_many(nurses_data)
-nurses_ids = list(nurses_insert_result.inserted_ids)
-print(f"Inserted {len(nurses_ids)} nurses.")
-
-facilities_collection = db["facilities"]
-facilities_collection.delete_many({})
-
-all_doctors_for_embed = list(doctors_collection.find({}, {"user_id": 1, "name": 1, "last_name": 1, "_id": 0}))
-
-all_nurses_for_embed = []
-for nurse in nurses_collection.find({}):
-    all_nurses_for_embed.append({
-        "name": nurse["name"],
-        "last_name": nurse["last_name"],
-        "phone_number": nurse["phone_number"],
-        "nurse_id": nurse["_id"]
-    })
-
-facilities_data = []
-for _ in range(COUNT_FACILITIES):
-    random_doctors_count = random.randint(1, 5)
-    random_nurses_count = random.randint(1, 5)
-    random_doctors = random.sample(all_doctors_for_embed, random_doctors_count)
-    random_nurses = random.sample(all_nurses_for_embed, random_nurses_count)
-
-    facilities_data.append({
-        "doctors": random_doctors,
-        "name": f"Centrum Krwiodawstwa {fake_pl.city()}",
-        "address": fake_pl.address().replace("\n", ", "),
-        "phone_number": fake_pl.phone_number(),
-        "available_blood_bags": [],
-        "nurses": random_nurses,
-        "email": fake_pl.email()
-    })
-
-facilities_insert_result = facilities_collection.insert_many(facilities_data)
-facilities_ids = list(facilities_insert_result.inserted_ids)
-print(f"Inserted {len(facilities_ids)} facilities.")
-
-orders_collection = db["orders"]
-orders_collection.delete_many({})
-
-hospitals_docs = list(hospitals_collection.find({}))
-orders_data = []
-for _ in range(COUNT_ORDERS):
-
-    h = random.choice(hospitals_docs)
-    hospital_embed = {
-        "address": h["address"],
-        "user_id": h["user_id"],
-        "name": h["name"],
-        "hospital_id": h["_id"]
-    }
-
-    realization_count = random.randint(0, 3)
-    reals = []
-    for __ in range(realization_count):
-        real_date = fake_pl.date_between_dates(
-            date_start=datetime(2020, 1, 1).date(),
-            date_end=datetime.now().date()
-        )
-        real_date = datetime.combine(real_date, time.min)
-        reals.append({
-            "date": real_date,
-            "transport": {
-                "driver_id": random.choice(drivers_ids)
+possible_sexes = list(SEX_NAMES.values())
+possible_blood_types = BLOOD_TYPES
+possible_rh = BLOOD_RHS
+possible_states = list(ORDER_STATE_NAMES.values())
+
+
+def chunks(items):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+def insert_stream(collection, docs, on_chunk=None):
+    # only one chunk of documents is alive at a time
+    count = 0
+    for chunk in chunks(docs):
+        collection.insert_many(chunk, ordered=False)
+        if on_chunk:
+            on_chunk(chunk)
+        count += len(chunk)
+    return count
+
+
+def write_updates(collection, updates):
+    count = 0
+    for chunk in chunks(updates):
+        collection.bulk_write(chunk, ordered=False)
+        count += len(chunk)
+    return count
+
+
+def add_profile(user_profiles, user_id, profile):
+    user_profiles.setdefault(user_id, []).append(profile)
+
+
+def random_date(run, start, end=None):
+    end = end or NOW.date()
+    return datetime.combine(run.fake.date_between_dates(date_start=start, date_end=end), time.min)
+
+
+def generate_users(run, users_ids):
+    for i in range(1, COUNT_USERS + 1):
+        user_id = run.new_id()
+        users_ids.append(user_id)
+        # the running number makes login and email unique, fake.unique retries
+        # ever longer as its registry fills up
+        yield {
+            "_id": user_id,
+            "password": run.fake.password(),
+            "profiles": [],
+            "phone_number": run.fake.phone_number(),
+            "login": with_suffix(run.fake.user_name(), i),
+            "email": with_suffix(run.fake.email(), i)
+        }
+
+
+def generate_doctors(run, users_ids, doctors_for_embed, user_profiles):
+    for _ in range(COUNT_DOCTORS):
+        doctor = {
+            "_id": run.new_id(),
+            "user_id": run.rng.choice(users_ids),
+            "name": run.fake.first_name(),
+            "last_name": run.fake.last_name(),
+            "facilities": []
+        }
+        doctors_for_embed.append((doctor["user_id"], doctor["name"], doctor["last_name"]))
+        add_profile(user_profiles, doctor["user_id"], {"role": "doctor", "doctor_id": doctor["_id"]})
+        yield doctor
+
+
+def examination_values(run):
+    # weight, height and qualification of every examination of every donor, one
+    # numpy column each; donors have at most 5 examinations
+    from common import clinical
+    gen = clinical.generator(run.rng)
+    n = COUNT_DONORS * 5
+    return clinical.rows({
+        "weight": clinical.uniform(gen, n, 50, 100, 1),
+        "height": clinical.uniform(gen, n, 150, 200, 1),
+        "is_qualified": clinical.flags(gen, n, 0.5),
+    }, ["weight", "height", "is_qualified"])
+
+
+def generate_donors(run, users_ids, donors_refs, user_profiles):
+    values = examination_values(run) if VECTORIZED else None
+    pesels = PeselAllocator()
+    for _ in range(COUNT_DONORS):
+        random_user_id = run.rng.choice(users_ids)
+
+        birth_date = random_date(run, (NOW - timedelta(days=int(66 * 365.25) - 1)).date(),
+                                 (NOW - timedelta(days=int(18 * 365.25) + 1)).date())
+
+        exam_count = run.rng.randint(1, 5)
+        examinations = []
+        for __ in range(exam_count):
+            exam_date = random_date(run, birth_date.date())
+
+            if values is not None:
+                weight, height, is_qual = next(values)
+            else:
+                weight = round(run.rng.uniform(50, 100), 1)
+                height = round(run.rng.uniform(150, 200), 1)
+                is_qual = run.rng.choice([True, False])
+            examinations.append({
+                "date": exam_date,
+                "weight": weight,
+                "height": height,
+                "is_qualified": is_qual
+            })
+
+        donor_id = run.new_id()
+        donors_refs.append((donor_id, birth_date.date()))
+        add_profile(user_profiles, random_user_id, {"role": "donor", "donor_id": donor_id})
+        sex = run.rng.choice(possible_sexes)
+        yield {
+            "_id": donor_id,
+            "user_id": random_user_id,
+            "examinations": examinations,
+            "birth_date": birth_date,
+            "sex": sex,
+            "blood_type": run.rng.choice(possible_blood_types),
+            "blod_rh": run.rng.choice(possible_rh),
+            "name": run.fake.first_name(),
+            "last_name": run.fake.last_name(),
+            "pesel": pesels.allocate(birth_date, sex),
+        }
+
+
+def generate_moderators(run, users_ids, user_profiles):
+    for _ in range(COUNT_MODERATORS):
+        moderator = {
+            "_id": run.new_id(),
+            "user_id": run.rng.choice(users_ids),
+            "name": run.fake.first_name(),
+            "last_name": run.fake.last_name()
+        }
+        add_profile(user_profiles, moderator["user_id"], {"role": "moderator", "moderator_id": moderator["_id"]})
+        yield moderator
+
+
+def generate_hospitals(run, users_ids, hospitals_for_embed, user_profiles):
+    for _ in range(COUNT_HOSPITALS):
+        hospital = {
+            "_id": run.new_id(),
+            "user_id": run.rng.choice(users_ids),
+            "name": f"Szpital {run.fake.city()}",
+            "address": run.fake.address().replace("\n", ", ")
+        }
+        hospitals_for_embed.append((hospital["address"], hospital["user_id"], hospital["name"], hospital["_id"]))
+        add_profile(user_profiles, hospital["user_id"], {"role": "hospital", "hospital_id": hospital["_id"]})
+        yield hospital
+
+
+def generate_drivers(run, drivers_ids):
+    for _ in range(COUNT_DRIVERS):
+        driver_id = run.new_id()
+        drivers_ids.append(driver_id)
+        yield {
+            "_id": driver_id,
+            "name": run.fake.first_name(),
+            "last_name": run.fake.last_name()
+        }
+
+
+def generate_nurses(run, nurses_for_embed):
+    for _ in range(COUNT_NURSES):
+        nurse = {
+            "_id": run.new_id(),
+            "name": run.fake.first_name(),
+            "last_name": run.fake.last_name(),
+            "phone_number": run.fake.phone_number()
+        }
+        nurses_for_embed.append((nurse["name"], nurse["last_name"], nurse["phone_number"], nurse["_id"]))
+        yield nurse
+
+
+def generate_facilities(run, doctors_for_embed, nurses_for_embed, facilities_ids):
+    for _ in range(COUNT_FACILITIES):
+        random_doctors_count = run.rng.randint(1, 5)
+        random_nurses_count = run.rng.randint(1, 5)
+        random_doctors = run.rng.sample(doctors_for_embed, random_doctors_count)
+        random_nurses = run.rng.sample(nurses_for_embed, random_nurses_count)
+
+        facility_id = run.new_id()
+        facilities_ids.append(facility_id)
+        yield {
+            "_id": facility_id,
+            "doctors": [
+                {"user_id": user_id, "name": name, "last_name": last_name}
+                for user_id, name, last_name in random_doctors
+            ],
+            "name": f"Centrum Krwiodawstwa {run.fake.city()}",
+            "address": run.fake.address().replace("\n", ", "),
+            "phone_number": run.fake.phone_number(),
+            "available_blood_bags": [],
+            "nurses": [
+                {"name": name, "last_name": last_name, "phone_number": phone_number, "nurse_id": nurse_id}
+                for name, last_name, phone_number, nurse_id in random_nurses
+            ],
+            "email": run.fake.email()
+        }
+
+
+def generate_orders(run, hospitals_for_embed, drivers_ids, orders_ids):
+    for _ in range(COUNT_ORDERS):
+        address, user_id, name, hospital_id = run.rng.choice(hospitals_for_embed)
+        hospital_embed = {
+            "address": address,
+            "user_id": user_id,
+            "name": name,
+            "hospital_id": hospital_id
+        }
+
+        realization_count = run.rng.randint(0, 3)
+        reals = []
+        for __ in range(realization_count):
+            reals.append({
+                "date": random_date(run, datetime(2020, 1, 1).date()),
+                "transport": {
+                    "driver_id": run.rng.choice(drivers_ids)
+                },
+                "blood_bags": []
+            })
+
+        order_id = run.new_id()
+        orders_ids.append(order_id)
+        yield {
+            "_id": order_id,
+            "is_urgent": run.fake.boolean(chance_of_getting_true=30),
+            "state": run.rng.choice(possible_states),
+            "hospital": hospital_embed,
+            "realizations": reals
+        }
+
+
+def generate_blood_bags(run, facilities_ids, donors_refs, nurses_for_embed, orders_ids):
+    for _ in range(COUNT_BLOODBAGS):
+        facility_id = run.rng.choice(facilities_ids)
+        donor_id, birth_date = run.rng.choice(donors_refs)
+        nurse_id = run.rng.choice(nurses_for_embed)[3]
+        maybe_order = run.rng.choice([None, run.rng.choice(orders_ids)])
+
+        donation_date = random_date(run, birth_date)
+
+        bag = {
+            "_id": run.new_id(),
+            "volume": float(run.rng.choice([300, 350, 450, 500])),
+            "donation": {
+                "date": donation_date,
+                "donor_id": donor_id,
+                "nurse_id": nurse_id
             },
-            "blood_bags": []
-        })
-
-    orders_data.append({
-        "is_urgent": fake_pl.boolean(chance_of_getting_true=30),
-        "state": random.choice(["partially_completed", "completed", "awaiting", "cancelled"]),
-        "hospital": hospital_embed,
-        "realizations": reals
-    })
-
-orders_insert_result = orders_collection.insert_many(orders_data)
-orders_ids = list(orders_insert_result.inserted_ids)
-print(f"Inserted {len(orders_ids)} orders.")
-
-blood_bags_collection = db["blood_bags"]
-blood_bags_collection.delete_many({})
-
-facilities_docs = list(facilities_collection.find({}))
-donors_docs = list(donors_collection.find({}))
-nurses_docs = list(nurses_collection.find({}))
-orders_docs = list(orders_collection.find({}))
-
-blood_bags_data = []
-for _ in range(COUNT_BLOODBAGS):
-    facility = random.choice(facilities_docs)
-    donor = random.choice(donors_docs)
-    nurse = random.choice(nurses_docs)
-    maybe_order = random.choice([None, random.choice(orders_docs)])
-
-    donation_date = fake_pl.date_between_dates(
-        date_start=donor["birth_date"].date(),
-        date_end=datetime.now().date()
-    )
-    donation_date = datetime.combine(donation_date, time.min)
+            "facility_id": facility_id
+        }
+
+        lab_date = donation_date + timedelta(days=run.rng.randint(1, 7))
+        # the lab_results fields of the lab8 schema, in the ranges lab4 uses
+        bag["lab_result"] = {
+            "date": lab_date,
+            "is_qualified": run.fake.boolean(chance_of_getting_true=80),
+            "red_cells_count": round(run.rng.uniform(4.0, 6.0), 2),
+            "white_cells_count": round(run.rng.uniform(4.0, 11.0), 2),
+            "platelet_count": round(run.rng.uniform(150, 450), 2),
+            "hemoglobin_level": round(run.rng.uniform(12.0, 18.0), 2),
+            "hematocrit_level": round(run.rng.uniform(36.0, 52.0), 2),
+            "glucose_level": round(run.rng.uniform(70, 140), 2)
+        }
+
+        if maybe_order:
+            bag["order"] = maybe_order
+
+        yield bag
+
+
+class StageRun:
+    # per-stage random state derived from the manifest seed, so that stages
+    # running on different threads never share a generator
+    def __init__(self, name, replay=False):
+        seed = manifest.stage_seed(name)
+        self.name = name
+        self.replay = replay
+        self.rng = random.Random(seed)
+        self.fake = Faker("pl_PL")
+        if VALUE_POOLS:
+            self.fake = PooledFaker("pl_PL", manifest.seed, VALUE_POOLS, self.fake)
+        self.fake.seed_instance(seed)
+        self.timestamp = struct.pack(">I", int(NOW.timestamp()))
+
+    def new_id(self):
+        return ObjectId(self.timestamp + self.rng.randbytes(8))
+
+    def insert(self, name, docs, on_chunk=None):
+        # a replayed stage only regenerates the references later stages need
+        if self.replay:
+            return sum(1 for _ in docs)
+        collection = db[name]
+        collection.delete_many({})
+        return insert_stream(collection, docs, on_chunk)
+
+
+def checkpointed(name, fn, replay=True):
+    def run_stage(ctx):
+        done = manifest.is_done(name)
+        if done and not replay:
+            print(f"{name}: already done, skipping")
+            return
+        fn(ctx, StageRun(name, replay=done))
+        if not done:
+            manifest.complete(name)
+
+    return run_stage
+
+
+def seed_users(ctx, run):
+    ctx["users_ids"] = []
+    count = run.insert("users", generate_users(run, ctx["users_ids"]))
+    print(f"Inserted {count} users.")
+
+
+def seed_doctors(ctx, run):
+    ctx["doctors_for_embed"] = []
+    ctx["doctor_profiles"] = {}
+    count = run.insert("doctors", generate_doctors(
+        run, ctx["users_ids"], ctx["doctors_for_embed"], ctx["doctor_profiles"]))
+    print(f"Inserted {count} doctors.")
+
+
+def seed_donors(ctx, run):
+    ctx["donors_refs"] = []
+    ctx["donor_profiles"] = {}
+    count = run.insert("donors", generate_donors(
+        run, ctx["users_ids"], ctx["donors_refs"], ctx["donor_profiles"]))
+    print(f"Inserted {count} donors.")
+
+
+def seed_moderators(ctx, run):
+    ctx["moderator_profiles"] = {}
+    count = run.insert("moderators", generate_moderators(run, ctx["users_ids"], ctx["moderator_profiles"]))
+    print(f"Inserted {count} moderators.")
+
+
+def seed_hospitals(ctx, run):
+    ctx["hospitals_for_embed"] = []
+    ctx["hospital_profiles"] = {}
+    count = run.insert("hospitals", generate_hospitals(
+        run, ctx["users_ids"], ctx["hospitals_for_embed"], ctx["hospital_profiles"]))
+    print(f"Inserted {count} hospitals.")
+
+
+def seed_drivers(ctx, run):
+    ctx["drivers_ids"] = []
+    count = run.insert("drivers", generate_drivers(run, ctx["drivers_ids"]))
+    print(f"Inserted {count} drivers.")
+
+
+def seed_nurses(ctx, run):
+    ctx["nurses_for_embed"] = []
+    count = run.insert("nurses", generate_nurses(run, ctx["nurses_for_embed"]))
+    print(f"Inserted {count} nurses.")
+
+
+def seed_facilities(ctx, run):
+    ctx["facilities_ids"] = []
+    count = run.insert("facilities", generate_facilities(
+        run, ctx["doctors_for_embed"], ctx["nurses_for_embed"], ctx["facilities_ids"]))
+    print(f"Inserted {count} facilities.")
 
-    bag = {
-        "volume": float(random.choice([300, 350, 450, 500])),
-        "donation": {
-            "date": donation_date,
-            "donor_id": donor["_id"],
-            "nurse_id": nurse["_id"]
-        },
-        "facility_id": facility["_id"]
-    }
 
-    lab_date = donation_date + timedelta(days=random.randint(1, 7))
-    bag["lab_result"] = {
-        "date": lab_date,
-        "is_qualified": fake_pl.boolean(chance_of_getting_true=80)
-    }
+def seed_orders(ctx, run):
+    ctx["orders_ids"] = []
+    count = run.insert("orders", generate_orders(
+        run, ctx["hospitals_for_embed"], ctx["drivers_ids"], ctx["orders_ids"]))
+    print(f"Inserted {count} orders.")
+
+
+def seed_blood_bags(ctx, run):
+    facilities_collection = db["facilities"]
+    # a crashed earlier attempt may have pushed part of the bags already
+    facilities_collection.update_many({}, {"$set": {"available_blood_bags": []}})
+
+    # every facility keeps a random share of its bags as available, decided per
+    # chunk so the bag ids never have to be collected for the whole collection
+    facility_availability = {f_id: run.rng.random() for f_id in ctx["facilities_ids"]}
 
-    if maybe_order:
-        bag["order"] = maybe_order["_id"]
+    def push_available_blood_bags(chunk):
+        facility_to_bag_ids = {}
+        for bag in chunk:
+            f_id = bag["facility_id"]
+            if run.rng.random() < facility_availability[f_id]:
+                facility_to_bag_ids.setdefault(f_id, []).append(bag["_id"])
 
-    blood_bags_data.append(bag)
+        write_updates(facilities_collection, (
+            UpdateOne({"_id": f_id}, {"$push": {"available_blood_bags": {"$each": bag_ids}}})
+            for f_id, bag_ids in facility_to_bag_ids.items()
+        ))
 
-CHUNK_SIZE = 1000
-for i in range(0, len(blood_bags_data), CHUNK_SIZE):
-    chunk = blood_bags_data[i: i + CHUNK_SIZE]
-    blood_bags_collection.insert_many(chunk)
-
-print(f"Inserted {len(blood_bags_data)} blood_bags.")
-
-facility_to_bag_ids = {}
-bags_cursor = blood_bags_collection.find({}, {"_id": 1, "facility_id": 1})
-for doc in bags_cursor:
-    f_id = doc["facility_id"]
-    if f_id not in facility_to_bag_ids:
-        facility_to_bag_ids[f_id] = []
-    facility_to_bag_ids[f_id].append(doc["_id"])
-
-for f_id, bag_ids in facility_to_bag_ids.items():
-    num_available = random.randint(0, len(bag_ids))
-    subset = random.sample(bag_ids, num_available)
-    facilities_collection.update_one(
-        {"_id": f_id},
-        {"$set": {"available_blood_bags": subset}}
+    count = run.insert(
+        "blood_bags",
+        generate_blood_bags(run, ctx["facilities_ids"], ctx["donors_refs"], ctx["nurses_for_embed"], ctx["orders_ids"]),
+        on_chunk=push_available_blood_bags
     )
-
-print("Facilities updated with available blood bags.")
-
-for doc in doctors_collection.find({}, {"_id": 1, "user_id": 1}):
-    doctor_id = doc["_id"]
-    user_id = doc["user_id"]
-    db.users.update_one(
-        {"_id": user_id},
-        {"$push": {"profiles": {"role": "doctor", "doctor_id": doctor_id}}}
-    )
-
-for doc in donors_collection.find({}, {"_id": 1, "user_id": 1}):
-    donor_id = doc["_id"]
-    user_id = doc["user_id"]
-    db.users.update_one(
-        {"_id": user_id},
-        {"$push": {"profiles": {"role": "donor", "donor_id": donor_id}}}
-    )
-
-for doc in moderators_collection.find({}, {"_id": 1, "user_id": 1}):
-    mod_id = doc["_id"]
-    user_id = doc["user_id"]
-    db.users.update_one(
-        {"_id": user_id},
-        {"$push": {"profiles": {"role": "moderator", "moderator_id": mod_id}}}
-    )
-
-for doc in hospitals_collection.find({}, {"_id": 1, "user_id": 1}):
-    hospital_id = doc["_id"]
-    user_id = doc["user_id"]
-    db.users.update_one(
-        {"_id": user_id},
-        {"$push": {"profiles": {"role": "hospital", "hospital_id": hospital_id}}}
-    )
-
-print("Users updated with role profiles.")
+    print(f"Inserted {count} blood_bags.")
+    print("Facilities updated with available blood bags.")
+
+
+def seed_profiles(ctx, run):
+    users_collection = db["users"]
+    users_collection.update_many({}, {"$set": {"profiles": []}})
+
+    # every role stage collected its own profiles per user, merged here in a
+    # fixed order so each user gets all of its profiles in a single update
+    user_profiles = {}
+    for role in ["doctor", "donor", "moderator", "hospital"]:
+        for user_id, profiles in ctx[f"{role}_profiles"].items():
+            user_profiles.setdefault(user_id, []).extend(profiles)
+
+    write_updates(users_collection, (
+        UpdateOne({"_id": user_id}, {"$push": {"profiles": {"$each": profiles}}})
+        for user_id, profiles in user_profiles.items()
+    ))
+    print("Users updated with role profiles.")
+
+
+STAGES = {
+    "users": ([], checkpointed("users", seed_users)),
+    "doctors": (["users"], checkpointed("doctors", seed_doctors)),
+    "donors": (["users"], checkpointed("donors", seed_donors)),
+    "moderators": (["users"], checkpointed("moderators", seed_moderators)),
+    "hospitals": (["users"], checkpointed("hospitals", seed_hospitals)),
+    "drivers": ([], checkpointed("drivers", seed_drivers)),
+    "nurses": ([], checkpointed("nurses", seed_nurses)),
+    "facilities": (["doctors", "nurses"], checkpointed("facilities", seed_facilities)),
+    "orders": (["hospitals", "drivers"], checkpointed("orders", seed_orders)),
+    "blood_bags": (["facilities", "donors", "nurses", "orders"],
+                   checkpointed("blood_bags", seed_blood_bags, replay=False)),
+    "profiles": (["users", "doctors", "donors", "moderators", "hospitals"],
+                 checkpointed("profiles", seed_profiles, replay=False)),
+}
+
+run_stages(STAGES, {}, max_workers=STAGE_WORKERS)
 
 print("\nSeeding completed successfully!")
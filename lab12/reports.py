@@ -0,0 +1,249 @@
+import argparse
+import calendar
+import os
+import time
+from datetime import datetime
+
+# the lab5/queries.sql reports as aggregation pipelines over the lab12
+# collections, name -> (collection, pipeline of the reference day)
+#
+# field names are the ones lab12/main2.py and emit_mongo.py write, which
+# embed the lab8 model (lab8/Lab 8_updated.json) and differ from it in:
+# - donors.blod_rh is lab8's blood_rh;
+# - a bag points at its order through "order", lab8 goes through realization_id;
+# - order states are lower case, see common.model.ORDER_STATE_NAMES;
+# - examinations keep date, weight, height and is_qualified only, so the lab5
+#   report on the doctors of 2024 has no pipeline.
+# lab_results_per_blood_group averages the lab_result levels main2.py writes;
+# bags seeded by lab12/main.py or an older main2.py have none and average to null
+
+BLOOD_GROUP = {"$concat": ["$donor.blood_type", "$donor.blod_rh"]}
+NO_ORDER = {"$eq": [{"$type": "$order"}, "missing"]}
+LAB_LEVELS = ["hemoglobin_level", "red_cells_count", "white_cells_count", "platelet_count",
+              "hematocrit_level", "glucose_level"]
+
+
+def months_before(day, months):
+    # like the INTERVAL arithmetic of PostgreSQL, the 31st falls back to the
+    # last day of a shorter month
+    year, month = divmod(day.year * 12 + day.month - 1 - months, 12)
+    return day.replace(year=year, month=month + 1, day=min(day.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def with_donor(fields):
+    # after a $group by donor id, one lookup per donor instead of one per bag
+    return [
+        {"$lookup": {"from": "donors", "localField": "_id", "foreignField": "_id", "as": "donor"}},
+        {"$unwind": "$donor"},
+        {"$project": {"_id": 1, "first_name": "$donor.name", "last_name": "$donor.last_name", **fields}},
+    ]
+
+
+def with_facility(fields):
+    return [
+        {"$lookup": {"from": "facilities", "localField": "_id", "foreignField": "_id", "as": "facility"}},
+        {"$unwind": "$facility"},
+        {"$project": {"_id": 0, "facility_id": "$_id", "facility_name": "$facility.name", **fields}},
+    ]
+
+
+def donors_per_blood_group(today):
+    return [
+        {"$group": {"_id": {"$concat": ["$blood_type", "$blod_rh"]}, "donor_count": {"$sum": 1}}},
+        {"$sort": {"donor_count": 1}},
+    ]
+
+
+def available_bags_per_blood_group(today):
+    return [
+        {"$match": {"lab_result.is_qualified": True, "order": {"$exists": False}}},
+        {"$group": {"_id": "$donation.donor_id", "bags": {"$sum": 1}}},
+        {"$lookup": {"from": "donors", "localField": "_id", "foreignField": "_id", "as": "donor"}},
+        {"$unwind": "$donor"},
+        {"$group": {"_id": BLOOD_GROUP, "available_bags": {"$sum": "$bags"}}},
+        {"$sort": {"available_bags": 1}},
+    ]
+
+
+def donor_donations(today):
+    return [
+        {"$group": {"_id": "$donation.donor_id", "donation_count": {"$sum": 1}}},
+        *with_donor({"donation_count": 1}),
+        {"$sort": {"donation_count": -1}},
+    ]
+
+
+def disqualified_percentage(today):
+    return [
+        {"$unwind": "$examinations"},
+        {"$group": {"_id": None, "total": {"$sum": 1},
+                    "disqualified": {"$sum": {"$cond": ["$examinations.is_qualified", 0, 1]}}}},
+        {"$project": {"_id": 0, "disqualified_precentage": {
+            "$multiply": [100.0, {"$divide": ["$disqualified", "$total"]}]}}},
+    ]
+
+
+def eligible_donors(today):
+    return [
+        {"$group": {"_id": "$donation.donor_id", "last_donation_date": {"$max": "$donation.date"}}},
+        {"$match": {"last_donation_date": {"$lte": months_before(today, 1)}}},
+        *with_donor({"last_donation_date": 1}),
+        {"$sort": {"last_donation_date": 1}},
+    ]
+
+
+def urgent_awaiting_orders(today):
+    return [
+        {"$match": {"state": "awaiting", "is_urgent": True}},
+        {"$project": {"date": 1, "state": 1, "is_urgent": 1, "blood_type": 1, "blood_rh": 1, "bag_count": 1,
+                      "hospital_name": "$hospital.name", "hospital_address": "$hospital.address"}},
+    ]
+
+
+def frequent_donors(today):
+    return [
+        {"$match": {"donation.date": {"$gte": months_before(today, 12)}}},
+        {"$group": {"_id": "$donation.donor_id", "donation_count": {"$sum": 1}}},
+        {"$match": {"donation_count": {"$gt": 5}}},
+        *with_donor({"donation_count": 1}),
+        {"$sort": {"donation_count": -1}},
+    ]
+
+
+def average_weight_height(today):
+    return [
+        {"$unwind": "$examinations"},
+        {"$group": {"_id": None, "avg_weight": {"$avg": "$examinations.weight"},
+                    "avg_height": {"$avg": "$examinations.height"}}},
+    ]
+
+
+def lab_results_per_blood_group(today):
+    # sums and counts per donor first, the averages come out of them per group
+    sums = {level: {"$sum": f"$lab_result.{level}"} for level in LAB_LEVELS}
+    return [
+        {"$group": {"_id": "$donation.donor_id", "bags": {"$sum": 1}, **sums}},
+        {"$lookup": {"from": "donors", "localField": "_id", "foreignField": "_id", "as": "donor"}},
+        {"$unwind": "$donor"},
+        {"$group": {"_id": BLOOD_GROUP, "bags": {"$sum": "$bags"},
+                    **{level: {"$sum": f"${level}"} for level in LAB_LEVELS}}},
+        {"$project": {f"avg_{level}": {"$divide": [f"${level}", "$bags"]} for level in LAB_LEVELS}},
+    ]
+
+
+def facility_statistics(today):
+    counters = ["total_donations", "qualified_donations", "available_blood_bags"]
+    return [
+        {"$group": {
+            "_id": "$facility_id",
+            "total_donations": {"$sum": 1},
+            "qualified_donations": {"$sum": {"$cond": ["$lab_result.is_qualified", 1, 0]}},
+            "available_blood_bags": {"$sum": {"$cond": [{"$and": ["$lab_result.is_qualified", NO_ORDER]}, 1, 0]}},
+        }},
+        # facilities without a single bag still get a row, like the LEFT JOIN
+        {"$unionWith": {"coll": "facilities", "pipeline": [
+            {"$project": {counter: {"$literal": 0} for counter in counters}}]}},
+        {"$group": {"_id": "$_id", **{counter: {"$sum": f"${counter}"} for counter in counters}}},
+        *with_facility({counter: 1 for counter in counters}),
+        {"$sort": {"available_blood_bags": -1}},
+    ]
+
+
+def average_qualification_time(today):
+    return [
+        {"$group": {"_id": "$facility_id", "avg_qualification_time": {"$avg": {
+            "$divide": [{"$subtract": ["$lab_result.date", "$donation.date"]}, 86400000]}}}},
+        *with_facility({"avg_qualification_time": 1}),
+        {"$sort": {"avg_qualification_time": 1}},
+    ]
+
+
+def certified_donors(today):
+    # a $lookup with both localField and a pipeline needs MongoDB 5.0
+    return [
+        {"$match": {"certificates.0": {"$exists": True}}},
+        {"$lookup": {"from": "blood_bags", "localField": "_id", "foreignField": "donation.donor_id",
+                     "pipeline": [{"$project": {"_id": 0, "volume": 1}}], "as": "bags"}},
+        {"$unwind": "$certificates"},
+        {"$project": {"first_name": "$name", "last_name": 1, "level": "$certificates.level",
+                      "acquisition_date": "$certificates.acquisition_date",
+                      "donated_blood_ml": {"$sum": "$bags.volume"}}},
+        {"$sort": {"level": 1}},
+    ]
+
+
+def average_donations_per_donor(today):
+    return [
+        {"$group": {"_id": None, "donations": {"$sum": 1}}},
+        {"$lookup": {"from": "donors", "pipeline": [{"$count": "n"}], "as": "donors"}},
+        {"$project": {"_id": 0, "avg_donations_per_donor": {
+            "$divide": ["$donations", {"$arrayElemAt": ["$donors.n", 0]}]}}},
+    ]
+
+
+def orders_per_hospital(today):
+    return [
+        {"$group": {"_id": "$hospital.hospital_id", "name": {"$first": "$hospital.name"},
+                    "order_count": {"$sum": 1}}},
+        {"$sort": {"order_count": -1}},
+    ]
+
+
+REPORTS = {
+    "donors_per_blood_group": ("donors", donors_per_blood_group),
+    "available_bags_per_blood_group": ("blood_bags", available_bags_per_blood_group),
+    "donor_donations": ("blood_bags", donor_donations),
+    "disqualified_percentage": ("donors", disqualified_percentage),
+    "eligible_donors": ("blood_bags", eligible_donors),
+    "urgent_awaiting_orders": ("orders", urgent_awaiting_orders),
+    "frequent_donors": ("blood_bags", frequent_donors),
+    "average_weight_height": ("donors", average_weight_height),
+    "lab_results_per_blood_group": ("blood_bags", lab_results_per_blood_group),
+    "facility_statistics": ("blood_bags", facility_statistics),
+    "average_qualification_time": ("blood_bags", average_qualification_time),
+    "certified_donors": ("donors", certified_donors),
+    "average_donations_per_donor": ("blood_bags", average_donations_per_donor),
+    "orders_per_hospital": ("orders", orders_per_hospital),
+}
+
+
+def reference_day(now=None):
+    # CURRENT_DATE of the SQL reports, dates are stored at midnight
+    return datetime.combine((now or datetime.now()).date(), datetime.min.time())
+
+
+def pipeline(name, now=None):
+    collection, build = REPORTS[name]
+    return collection, build(reference_day(now))
+
+
+def run(db, name, now=None):
+    collection, stages = pipeline(name, now)
+    return list(db[collection].aggregate(stages, allowDiskUse=True))
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from pymongo.mongo_client import MongoClient
+    from pymongo.server_api import ServerApi
+
+    parser = argparse.ArgumentParser(description="Run the lab5 reports as aggregation pipelines on MongoDB.")
+    # checked by hand, python before 3.12 checks an empty "*" positional against
+    # choices and rejects it
+    parser.add_argument("reports", nargs="*", help=f"reports to run, all when omitted: {', '.join(REPORTS)}")
+    parser.add_argument("--database", default="krwiodawcy")
+    parser.add_argument("--limit", type=int, default=5, help="documents printed per report")
+    args = parser.parse_args()
+    unknown = [name for name in args.reports if name not in REPORTS]
+    if unknown:
+        parser.error(f"unknown reports: {', '.join(unknown)}")
+
+    load_dotenv()
+    client = MongoClient(os.environ["MONGODB_URI"], server_api=ServerApi('1'))
+    db = client[args.database]
+    for name in args.reports or list(REPORTS):
+        start = time.perf_counter()
+        result = run(db, name)
+        print(f"{name}: {len(result)} documents in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for document in result[:args.limit]:
+            print(f"  {document}")
@@ -0,0 +1,37 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def timed(name, fn, ctx):
+    start = time.perf_counter()
+    fn(ctx)
+    return time.perf_counter() - start
+
+
+def run_stages(stages, ctx, max_workers=4):
+    # stages: name -> (dependencies, fn), fn(ctx) runs once all of its
+    # dependencies have finished
+    for name, (dependencies, _) in stages.items():
+        unknown = set(dependencies) - set(stages)
+        if unknown:
+            raise ValueError(f"stage {name} depends on unknown stages: {', '.join(sorted(unknown))}")
+
+    done = set()
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(done) < len(stages):
+            for name, (dependencies, fn) in stages.items():
+                if name in done or name in running.values():
+                    continue
+                if set(dependencies) <= done:
+                    running[executor.submit(timed, name, fn, ctx)] = name
+
+            if not running:
+                raise ValueError(f"dependency cycle between stages: {', '.join(sorted(set(stages) - done))}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                elapsed = future.result()
+                done.add(name)
+                print(f"stage {name} finished in {elapsed:.2f}s")
@@ -92,6 +92,8 @@ CREATE TABLE "orders" (
 	"date" DATE NOT NULL CONSTRAINT "chk_not_future_date" CHECK ("date" <= CURRENT_DATE),
 	"state" ORDER_STATE NOT NULL DEFAULT 'AWAITING',
 	"is_urgent" BOOLEAN NOT NULL,
+	"blood_info" BLOOD_INFO,
+	"bag_count" INTEGER NOT NULL DEFAULT 1 CONSTRAINT "chk_positive_bag_count" CHECK ("bag_count" > 0),
 	"fk_transport_id" INTEGER,
 	"fk_hospital_id" INTEGER NOT NULL,
 	PRIMARY KEY("id")
@@ -0,0 +1,5 @@
+-- grupa krwi i liczba workow w zamowieniu dla istniejacych baz (lab4/allocation.py)
+-- blood_info = NULL oznacza dowolna grupe
+ALTER TABLE "orders" ADD COLUMN IF NOT EXISTS "blood_info" BLOOD_INFO;
+ALTER TABLE "orders" ADD COLUMN IF NOT EXISTS "bag_count" INTEGER NOT NULL DEFAULT 1
+	CONSTRAINT "chk_positive_bag_count" CHECK ("bag_count" > 0);
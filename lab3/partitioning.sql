@@ -0,0 +1,164 @@
+-- partycjonowanie donations, examinations i lab_results po roku z kolumny date
+-- uruchamiane po blood-ddl.sql (pusta baza) albo na istniejacych danych jako migracja:
+--   psql -1 -f partitioning.sql
+-- klucz glowny to (id, date), wiec blood_bags dostaje kolumny z datami
+-- do kluczy obcych zlozonych; form_number jest unikalny w obrebie (form_number, date)
+-- indeksy i klucze obce tabel sa przenoszone, a lab6/index-pack.sql trzeba uruchomic bez CONCURRENTLY
+-- (nie dziala na tabelach partycjonowanych)
+-- widoki zalezne od tych tabel przerywaja migracje i sa wypisane w bledzie, trzeba je usunac przed nia,
+-- np. DROP VIEW blood_inventory_expected i DROP MATERIALIZED VIEW donor_stats; po migracji uruchomic
+-- ponownie lab5/inventory.sql (triggery na lab_results i widok blood_inventory_expected)
+-- oraz lab5/donor-stats.sql (widok donor_stats z indeksami)
+
+
+-- partycje <tabela>_<rok> dla lat first_year..last_year, istniejace sa pomijane
+CREATE OR REPLACE FUNCTION create_year_partitions(parent TEXT, first_year INTEGER, last_year INTEGER)
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+	FOR year IN first_year..last_year LOOP
+		EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+		               parent || '_' || year, parent, make_date(year, 1, 1), make_date(year + 1, 1, 1));
+	END LOOP;
+END $$;
+
+-- domyslnie biezacy i nastepny rok, daty z przyszlosci blokuje chk_not_future_date
+CREATE OR REPLACE FUNCTION ensure_year_partitions(first_year INTEGER DEFAULT NULL, last_year INTEGER DEFAULT NULL)
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+	parent TEXT;
+BEGIN
+	FOREACH parent IN ARRAY ARRAY['donations', 'examinations', 'lab_results'] LOOP
+		PERFORM create_year_partitions(parent,
+		                               COALESCE(first_year, EXTRACT(YEAR FROM CURRENT_DATE)::INTEGER),
+		                               COALESCE(last_year, EXTRACT(YEAR FROM CURRENT_DATE)::INTEGER + 1));
+	END LOOP;
+END $$;
+
+
+-- zamienia tabele na partycjonowana, przenosi dane, indeksy, klucze obce i sekwencje id;
+-- klucze obce wskazujace na te tabele sa usuwane i trzeba je dodac od nowa
+CREATE OR REPLACE FUNCTION partition_by_year(tbl TEXT)
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+	old TEXT := tbl || '_unpartitioned';
+	current_year INTEGER := EXTRACT(YEAR FROM CURRENT_DATE)::INTEGER;
+	first_year INTEGER;
+	last_year INTEGER;
+	next_id BIGINT;
+	statements TEXT[];
+	ddl TEXT;
+	views TEXT;
+	fk RECORD;
+BEGIN
+	IF (SELECT relkind FROM pg_class WHERE oid = to_regclass(tbl)) = 'p' THEN
+		RETURN;
+	END IF;
+
+	-- stara tabela jest usuwana bez CASCADE, zalezne widoki zniknelyby po cichu
+	SELECT string_agg(DISTINCT dependent.oid::REGCLASS::TEXT, ', ') INTO views
+	FROM pg_depend
+	         JOIN pg_rewrite ON pg_rewrite.oid = pg_depend.objid
+	         JOIN pg_class dependent ON dependent.oid = pg_rewrite.ev_class
+	WHERE pg_depend.classid = 'pg_rewrite'::REGCLASS
+	  AND pg_depend.refobjid = tbl::REGCLASS
+	  AND dependent.oid <> tbl::REGCLASS;
+	IF views IS NOT NULL THEN
+		RAISE EXCEPTION 'od tabeli % zaleza widoki: %', tbl, views
+			USING HINT = 'usun je przed migracja i utworz ponownie po niej';
+	END IF;
+
+	-- zapamietane przed zmiana nazwy, zeby wskazywaly na nowa tabele
+	SELECT array_agg(pg_get_indexdef(indexrelid)) INTO statements
+	FROM pg_index
+	WHERE indrelid = tbl::REGCLASS AND NOT indisunique;
+
+	SELECT COALESCE(statements, '{}') || COALESCE(array_agg(
+		CASE WHEN contype = 'f'
+		     THEN format('ALTER TABLE %I ADD CONSTRAINT %I %s', tbl, conname, pg_get_constraintdef(oid))
+		     ELSE format('ALTER TABLE %I ADD CONSTRAINT %I UNIQUE (%s, "date")', tbl, conname,
+		                 (SELECT string_agg(quote_ident(attname), ', ')
+		                  FROM pg_attribute
+		                  WHERE attrelid = conrelid AND attnum = ANY(conkey)))
+		END), '{}') INTO statements
+	FROM pg_constraint
+	WHERE conrelid = tbl::REGCLASS
+	  AND (contype = 'f'
+	       OR contype = 'u' AND conkey <> ARRAY[(SELECT attnum FROM pg_attribute
+	                                             WHERE attrelid = conrelid AND attname = 'id')]);
+
+	EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, old);
+	EXECUTE format('ALTER SEQUENCE %s RENAME TO %I', pg_get_serial_sequence(quote_ident(old), 'id'), old || '_id_seq');
+
+	EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY) '
+	               'PARTITION BY RANGE ("date")', tbl, old);
+	EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY ("id", "date")', tbl);
+
+	EXECUTE format('SELECT EXTRACT(YEAR FROM MIN("date"))::INTEGER, EXTRACT(YEAR FROM MAX("date"))::INTEGER FROM %I', old)
+		INTO first_year, last_year;
+	PERFORM create_year_partitions(tbl, LEAST(COALESCE(first_year, current_year), current_year),
+	                               GREATEST(COALESCE(last_year, current_year), current_year + 1));
+	EXECUTE format('INSERT INTO %I SELECT * FROM %I', tbl, old);
+
+	-- nowa sekwencja zaczyna tam, gdzie skonczyla stara
+	EXECUTE format('SELECT nextval(%L)', old || '_id_seq') INTO next_id;
+	PERFORM setval(pg_get_serial_sequence(quote_ident(tbl), 'id'), next_id, false);
+
+	FOR fk IN SELECT conrelid::REGCLASS::TEXT AS referencing, conname
+	          FROM pg_constraint
+	          WHERE contype = 'f' AND confrelid = old::REGCLASS AND conrelid <> old::REGCLASS LOOP
+		EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', fk.referencing, fk.conname);
+	END LOOP;
+	EXECUTE format('DROP TABLE %I', old);
+
+	FOREACH ddl IN ARRAY statements LOOP
+		EXECUTE ddl;
+	END LOOP;
+END $$;
+
+
+ALTER TABLE "blood_bags" ADD COLUMN IF NOT EXISTS "donation_date" DATE;
+ALTER TABLE "blood_bags" ADD COLUMN IF NOT EXISTS "lab_results_date" DATE;
+
+UPDATE "blood_bags"
+SET "donation_date" = donations.date
+FROM donations
+WHERE donations.id = blood_bags.fk_donation_id
+  AND blood_bags.donation_date IS NULL;
+
+UPDATE "blood_bags"
+SET "lab_results_date" = lab_results.date
+FROM lab_results
+WHERE lab_results.id = blood_bags.fk_lab_results_id
+  AND blood_bags.lab_results_date IS NULL;
+
+ALTER TABLE "blood_bags" ALTER COLUMN "donation_date" SET NOT NULL;
+
+SELECT partition_by_year('donations');
+SELECT partition_by_year('examinations');
+SELECT partition_by_year('lab_results');
+
+ALTER TABLE "blood_bags" DROP CONSTRAINT IF EXISTS "blood_bags_donation_fkey";
+ALTER TABLE "blood_bags"
+ADD CONSTRAINT "blood_bags_donation_fkey" FOREIGN KEY ("fk_donation_id", "donation_date") REFERENCES "donations"("id", "date")
+ON UPDATE CASCADE ON DELETE RESTRICT;
+
+ALTER TABLE "blood_bags" DROP CONSTRAINT IF EXISTS "blood_bags_lab_results_fkey";
+ALTER TABLE "blood_bags"
+ADD CONSTRAINT "blood_bags_lab_results_fkey" FOREIGN KEY ("fk_lab_results_id", "lab_results_date") REFERENCES "lab_results"("id", "date")
+ON UPDATE CASCADE ON DELETE SET NULL;
+
+-- MATCH SIMPLE nie sprawdza klucza z jedna kolumna NULL
+ALTER TABLE "blood_bags" DROP CONSTRAINT IF EXISTS "chk_lab_results_date";
+ALTER TABLE "blood_bags"
+ADD CONSTRAINT "chk_lab_results_date" CHECK (("fk_lab_results_id" IS NULL) = ("lab_results_date" IS NULL));
+
+-- nowe partycje codziennie, jesli jest pg_cron
+DO $$
+BEGIN
+	IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+		PERFORM cron.schedule('ensure_year_partitions', '0 3 * * *', 'SELECT ensure_year_partitions()');
+	END IF;
+END $$;
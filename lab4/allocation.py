@@ -0,0 +1,183 @@
+import argparse
+import heapq
+import sys
+from pathlib import Path
+
+from psycopg2.extras import execute_values
+
+from bulk import BATCH_SIZE
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.db import connect
+
+# red cell compatibility: recipient group -> donor groups in the order they are
+# tried, the exact group first and 0- last because it is the universal donor
+COMPATIBLE = {
+    ("0", "-"): [("0", "-")],
+    ("0", "+"): [("0", "+"), ("0", "-")],
+    ("A", "-"): [("A", "-"), ("0", "-")],
+    ("A", "+"): [("A", "+"), ("A", "-"), ("0", "+"), ("0", "-")],
+    ("B", "-"): [("B", "-"), ("0", "-")],
+    ("B", "+"): [("B", "+"), ("B", "-"), ("0", "+"), ("0", "-")],
+    ("AB", "-"): [("AB", "-"), ("A", "-"), ("B", "-"), ("0", "-")],
+    ("AB", "+"): [("AB", "+"), ("AB", "-"), ("A", "+"), ("A", "-"), ("B", "+"), ("B", "-"), ("0", "+"), ("0", "-")],
+}
+# orders without a requested group take any bag, scarce groups last
+ANY_GROUP = COMPATIBLE[("AB", "+")]
+
+
+class Order:
+    def __init__(self, order_id, is_urgent, group, missing):
+        self.id = order_id
+        self.is_urgent = is_urgent
+        self.group = group
+        self.missing = missing
+        self.facility = None
+
+    def groups(self, exact_only=False):
+        if self.group is None:
+            return [] if exact_only else ANY_GROUP
+        return COMPATIBLE[self.group][:1] if exact_only else COMPATIBLE[self.group]
+
+
+class Inventory:
+    # one heap of (donation date, bag id) per (blood group, facility), so the
+    # oldest bag of a queue is always at its head
+    def __init__(self):
+        self.queues = {}
+        self.facilities = {}
+
+    def add(self, group, facility, donation_date, bag_id):
+        queue = self.queues.setdefault((group, facility), [])
+        queue.append((donation_date, bag_id))
+        self.facilities.setdefault(group, set()).add(facility)
+
+    def heapify(self):
+        for queue in self.queues.values():
+            heapq.heapify(queue)
+
+    def has(self, group, facility):
+        return bool(self.queues.get((group, facility)))
+
+    def oldest_facility(self, group):
+        facilities = self.facilities.get(group)
+        if not facilities:
+            return None
+        return min(facilities, key=lambda facility: self.queues[(group, facility)][0])
+
+    def take(self, group, facility):
+        queue = self.queues[(group, facility)]
+        _, bag_id = heapq.heappop(queue)
+        if not queue:
+            self.facilities[group].discard(facility)
+        return bag_id
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+
+def load_inventory(conn):
+    # bags without a facility cannot be shipped and are left out
+    inventory = Inventory()
+    with conn.cursor(name="allocation_inventory") as cur:
+        cur.itersize = 50000
+        cur.execute("""
+            SELECT bb.id, bb.fk_facility_id, (d.blood_info).blood_type, (d.blood_info).blood_rh, dn.date
+            FROM "blood_bags" bb
+            JOIN "lab_results" lr ON bb.fk_lab_results_id = lr.id
+            JOIN "donations" dn ON bb.fk_donation_id = dn.id
+            JOIN "donors" d ON dn.fk_donor_id = d.id
+            WHERE lr.is_qualified = true
+                AND bb.fk_facility_id IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM "blood_bags_orders" bbo WHERE bbo.fk_blood_bag_id = bb.id)
+        """)
+        for bag_id, facility_id, blood_type, blood_rh, donation_date in cur:
+            inventory.add((blood_type, blood_rh), facility_id, donation_date, bag_id)
+    inventory.heapify()
+    return inventory
+
+
+def load_orders(conn, states):
+    # bags already assigned to an order count towards its bag_count; grouped by
+    # every selected column, a bare load runs this before orders has its key
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT o.id, o.is_urgent, (o.blood_info).blood_type, (o.blood_info).blood_rh,
+                   o.bag_count - COUNT(bbo.fk_blood_bag_id) AS missing
+            FROM "orders" o
+            LEFT JOIN "blood_bags_orders" bbo ON bbo.fk_order_id = o.id
+            WHERE o.state = ANY(%s::order_state[])
+            GROUP BY o.id, o.is_urgent, o.blood_info, o.bag_count, o.date
+            HAVING o.bag_count - COUNT(bbo.fk_blood_bag_id) > 0
+            ORDER BY o.is_urgent DESC, o.date, o.id
+        """, (list(states),))
+        return [
+            Order(order_id, is_urgent, (blood_type, blood_rh) if blood_type else None, missing)
+            for order_id, is_urgent, blood_type, blood_rh, missing in cur.fetchall()
+        ]
+
+
+def fill(order, groups, inventory, pairs):
+    # stays with the facility it already takes bags from, one transport per order;
+    # once that facility runs out of a group the next group is tried there, and
+    # whatever it cannot cover stays missing
+    for group in groups:
+        if order.facility is None:
+            order.facility = inventory.oldest_facility(group)
+            if order.facility is None:
+                continue
+        while order.missing and inventory.has(group, order.facility):
+            pairs.append((inventory.take(group, order.facility), order.id))
+            order.missing -= 1
+
+
+def allocate(orders, inventory):
+    # urgent orders may use any compatible group right away, the rest first
+    # take exact matches so that they do not use up the groups others depend on
+    pairs = []
+    urgent = [order for order in orders if order.is_urgent]
+    regular = [order for order in orders if not order.is_urgent]
+
+    for order in urgent:
+        fill(order, order.groups(), inventory, pairs)
+    for order in regular:
+        fill(order, order.groups(exact_only=True), inventory, pairs)
+    for order in regular:
+        fill(order, order.groups(), inventory, pairs)
+    return pairs
+
+
+def assign(conn, states=("AWAITING",), dry_run=False):
+    with conn.cursor() as cur:
+        # one allocation at a time, two runs must never hand out the same bag
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('blood_bags_orders'))")
+
+    inventory = load_inventory(conn)
+    orders = load_orders(conn, states)
+    available = len(inventory)
+    pairs = allocate(orders, inventory)
+
+    if not dry_run:
+        with conn.cursor() as cur:
+            execute_values(cur, 'INSERT INTO "blood_bags_orders" (fk_blood_bag_id, fk_order_id) VALUES %s',
+                           pairs, page_size=BATCH_SIZE)
+
+    filled = sum(1 for order in orders if not order.missing)
+    print(f"orders: {len(orders)}, filled: {filled}, short: {len(orders) - filled}, "
+          f"assigned blood bags: {len(pairs)} of {available}")
+    return pairs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Assign qualified blood bags to open orders.")
+    parser.add_argument("--states", nargs="+", default=["AWAITING"],
+                        help="order states to fill")
+    parser.add_argument("--dry-run", action="store_true", help="compute the allocation without writing it")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        assign(conn, args.states, args.dry_run)
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,55 @@
+from datetime import datetime
+from io import StringIO
+
+BATCH_SIZE = 10000
+
+COPY_ESCAPES = str.maketrans({
+    "\\": "\\\\",
+    "\t": "\\t",
+    "\n": "\\n",
+    "\r": "\\r",
+})
+
+
+def copy_value(value):
+    if value is None:
+        return "\\N"
+    if value is True:
+        return "t"
+    if value is False:
+        return "f"
+    if isinstance(value, datetime):
+        value = value.date()
+    return str(value).translate(COPY_ESCAPES)
+
+
+def copy_rows(cur, table, columns, rows, batch_size=BATCH_SIZE):
+    sql = 'COPY "{}" ({}) FROM STDIN'.format(table, ", ".join(f'"{c}"' for c in columns))
+
+    buffer = StringIO()
+    pending = 0
+    total = 0
+    for row in rows:
+        buffer.write("\t".join(copy_value(v) for v in row))
+        buffer.write("\n")
+        pending += 1
+        if pending >= batch_size:
+            buffer.seek(0)
+            cur.copy_expert(sql, buffer)
+            total += pending
+            buffer = StringIO()
+            pending = 0
+
+    if pending:
+        buffer.seek(0)
+        cur.copy_expert(sql, buffer)
+        total += pending
+
+    return total
+
+
+def reserve_ids(cur, table, n):
+    cur.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+        (f'"{table}"', n))
+    return [row[0] for row in cur.fetchall()]
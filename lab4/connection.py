@@ -0,0 +1,194 @@
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from psycopg2.pool import ThreadedConnectionPool
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.db import connect, params
+
+# indexes of their own, not the ones behind a primary key or unique constraint;
+# unique ones are only deferred in bare mode, otherwise they keep the data correct
+DEFERRABLE_INDEXES = """
+    SELECT idx.relname, pg_get_indexdef(idx.oid)
+    FROM pg_index
+             JOIN pg_class idx ON idx.oid = pg_index.indexrelid
+             JOIN pg_class tbl ON tbl.oid = pg_index.indrelid
+    WHERE idx.relnamespace = 'public'::REGNAMESPACE
+      AND tbl.relkind IN ('r', 'p')
+      AND (%(unique)s OR NOT pg_index.indisunique)
+      AND NOT idx.relispartition
+      AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = idx.oid)
+    ORDER BY idx.relname
+"""
+
+# partitions inherit their constraints from the parent, only the parent ones are dropped;
+# a foreign key to a partitioned table counts as partitioned, VALIDATE leaves the
+# copies it has per partition marked not valid
+DEFERRABLE_CONSTRAINTS = """
+    SELECT conname, conrelid::REGCLASS::TEXT, contype, pg_get_constraintdef(pg_constraint.oid),
+           CASE WHEN contype IN ('p', 'u') THEN pg_get_indexdef(conindid) END,
+           relkind = 'p' OR EXISTS (SELECT 1 FROM pg_class referenced
+                                    WHERE referenced.oid = confrelid AND referenced.relkind = 'p')
+    FROM pg_constraint
+             JOIN pg_class ON pg_class.oid = conrelid
+    WHERE contype::TEXT = ANY(%(types)s::TEXT[])
+      AND connamespace = 'public'::REGNAMESPACE
+      AND relkind IN ('r', 'p')
+      AND NOT relispartition
+      AND conparentid = 0
+      AND coninhcount = 0
+    ORDER BY conrelid::REGCLASS::TEXT, conname
+"""
+
+# dropped in this order, foreign keys first since they depend on the keys
+CONSTRAINT_KINDS = {"f": "foreign_keys", "c": "checks", "p": "keys", "u": "keys"}
+
+
+def session_options(session):
+    # libpq options, so that every connection of the load starts with them
+    return " ".join(f"-c {name}={value}" for name, value in sorted(session.items()))
+
+
+def open_connection(session=None, dbname=None):
+    if not session:
+        return connect(dbname)
+    return connect(dbname, options=session_options(session))
+
+
+def durable_commit(conn):
+    # with synchronous_commit=off a commit may be lost on a server crash; the
+    # manifest only records a stage once its last commit is flushed, which
+    # flushes everything written before it too
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL synchronous_commit TO on")
+    conn.commit()
+
+
+class Pool:
+    def __init__(self, size, session=None, dbname=None):
+        kwargs = params(dbname)
+        if session:
+            kwargs["options"] = session_options(session)
+        self.size = size
+        self.pool = ThreadedConnectionPool(1, size, **kwargs)
+
+    @contextmanager
+    def connection(self):
+        conn = self.pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    def execute(self, sql):
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+
+    def run_all(self, statements):
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            for future in [executor.submit(self.execute, sql) for sql in statements]:
+                future.result()
+
+    def close(self):
+        self.pool.closeall()
+
+
+def deferrable(conn, indexes=False, foreign_keys=False, bare=False):
+    # bare also takes the checks, primary keys and unique constraints, only the
+    # columns and their NOT NULLs stay during the load
+    deferred = {"indexes": [], "foreign_keys": [], "checks": [], "keys": []}
+    types = (["f"] if foreign_keys or bare else []) + (["c", "p", "u"] if bare else [])
+    with conn.cursor() as cur:
+        cur.execute(DEFERRABLE_CONSTRAINTS, {"types": types})
+        for name, table, contype, definition, index, partitioned in cur.fetchall():
+            deferred[CONSTRAINT_KINDS[contype]].append({"name": name, "table": table, "definition": definition,
+                                                        "index": index, "partitioned": partitioned})
+        if indexes or bare:
+            cur.execute(DEFERRABLE_INDEXES, {"unique": bare})
+            for name, definition in cur.fetchall():
+                deferred["indexes"].append({"name": name, "definition": definition})
+    conn.commit()
+    return deferred
+
+
+def drop_deferred(conn, deferred):
+    with conn.cursor() as cur:
+        for kind in ("foreign_keys", "checks", "keys"):
+            for constraint in deferred.get(kind, []):
+                cur.execute(f'ALTER TABLE {constraint["table"]} DROP CONSTRAINT IF EXISTS "{constraint["name"]}"')
+        for index in deferred["indexes"]:
+            cur.execute(f'DROP INDEX IF EXISTS "{index["name"]}"')
+    conn.commit()
+
+
+def add_validated(pool, constraints, existing):
+    # NOT VALID only checks new rows and is instant; the full check then runs
+    # per table in parallel, VALIDATE locks its table against another VALIDATE;
+    # partitioned tables do not take NOT VALID foreign keys, their constraints
+    # are added with the full check on the same threads
+    by_table = defaultdict(list)
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            for constraint in constraints:
+                table, name = constraint["table"], constraint["name"]
+                exists = (table, name) in existing
+                definition = constraint["definition"].removesuffix(" NOT VALID")
+                if constraint["partitioned"]:
+                    if not exists:
+                        by_table[table].append(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}')
+                    continue
+                if not exists:
+                    cur.execute(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition} NOT VALID')
+                by_table[table].append(f'ALTER TABLE {table} VALIDATE CONSTRAINT "{name}"')
+    pool.run_all([";".join(statements) for statements in by_table.values()])
+
+
+def restore_deferred(pool, deferred):
+    timings = {}
+
+    # a resumed run may have restored part of them already
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT relname FROM pg_class WHERE relnamespace = 'public'::REGNAMESPACE")
+            relations = {row[0] for row in cur.fetchall()}
+            cur.execute("SELECT conrelid::REGCLASS::TEXT, conname FROM pg_constraint")
+            existing = set(cur.fetchall())
+    keys = [key for key in deferred.get("keys", []) if (key["table"], key["name"]) not in existing]
+
+    # every index builds side by side, CREATE INDEX only takes a SHARE lock; the
+    # primary key and unique indexes too, their constraints take them over below;
+    # pg_get_indexdef says ON ONLY for a partitioned table, which would leave the
+    # index invalid and build none on the partitions
+    start = time.perf_counter()
+    pool.run_all([index["definition"].replace(" ON ONLY ", " ON ", 1)
+                  for index in deferred["indexes"] if index["name"] not in relations]
+                 + [key["index"] for key in keys if not key["partitioned"] and key["name"] not in relations])
+    timings["indexes"] = round(time.perf_counter() - start, 3)
+
+    # partitioned tables cannot take over an index, their keys are built here
+    start = time.perf_counter()
+    by_table = defaultdict(list)
+    for key in keys:
+        kind = "PRIMARY KEY" if key["definition"].startswith("PRIMARY KEY") else "UNIQUE"
+        using = f' {kind} USING INDEX "{key["name"]}"' if not key["partitioned"] else f' {key["definition"]}'
+        by_table[key["table"]].append(f'ALTER TABLE {key["table"]} ADD CONSTRAINT "{key["name"]}"{using}')
+    pool.run_all([";".join(statements) for statements in by_table.values()])
+    timings["keys"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    add_validated(pool, deferred.get("checks", []), existing)
+    timings["checks"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    add_validated(pool, deferred["foreign_keys"], existing)
+    timings["foreign_keys"] = round(time.perf_counter() - start, 3)
+    return timings
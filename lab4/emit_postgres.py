@@ -0,0 +1,96 @@
+from bulk import BATCH_SIZE, copy_rows
+
+# FK order, parents first
+TABLES = [
+    "users", "doctors", "moderators", "nurses", "drivers", "transports", "hospitals",
+    "facilities", "doctors_facilities", "nurses_facilities", "donors", "certificates",
+    "orders", "donations", "examinations", "lab_results", "blood_bags", "blood_bags_orders",
+]
+
+
+def blood_info(blood_type, blood_rh):
+    return f"({blood_type},{blood_rh})"
+
+
+def is_partitioned(cur):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('donations')")
+    return cur.fetchone()[0] == 'p'
+
+
+def tables(dataset, partitioned=False):
+    # (table, columns, rows) for every table, rows are generated while COPY reads them
+    yield "users", ["id", "first_name", "last_name", "login", "email", "password", "phone_number"], (
+        (u.id, u.first_name, u.last_name, u.login, u.email, u.password, u.phone_number) for u in dataset.users)
+    yield "doctors", ["id", "fk_user_id"], ((d.id, d.user_id) for d in dataset.doctors)
+    yield "moderators", ["id", "fk_user_id"], ((m.id, m.user_id) for m in dataset.moderators)
+    yield "nurses", ["id", "first_name", "last_name", "phone_number"], (
+        (n.id, n.first_name, n.last_name, n.phone_number) for n in dataset.nurses)
+    yield "drivers", ["id", "first_name", "last_name"], ((d.id, d.first_name, d.last_name) for d in dataset.drivers)
+    yield "transports", ["id", "fk_driver_id"], ((t.id, t.driver_id) for t in dataset.transports)
+    yield "hospitals", ["id", "name", "address", "fk_user_id"], (
+        (h.id, h.name, h.address, h.user_id) for h in dataset.hospitals)
+    yield "facilities", ["id", "name", "address", "email", "phone_number"], (
+        (f.id, f.name, f.address, f.email, f.phone_number) for f in dataset.facilities)
+    yield "doctors_facilities", ["fk_doctor_id", "fk_facility_id"], (
+        (doctor_id, f.id) for f in dataset.facilities for doctor_id in f.doctor_ids)
+    yield "nurses_facilities", ["fk_nurse_id", "fk_facility_id"], (
+        (nurse_id, f.id) for f in dataset.facilities for nurse_id in f.nurse_ids)
+    yield "donors", ["id", "pesel", "birth_date", "sex", "blood_info", "fk_user_id"], (
+        (d.id, d.pesel, d.birth_date, d.sex, blood_info(d.blood_type, d.blood_rh), d.user_id) for d in dataset.donors)
+    yield "certificates", ["id", "level", "acquisition_date", "fk_donor_id"], (
+        (c.id, c.level, c.acquisition_date, c.donor_id) for c in dataset.certificates)
+    yield "orders", ["id", "date", "state", "is_urgent", "blood_info", "bag_count", "fk_transport_id",
+                     "fk_hospital_id"], (
+        (o.id, o.date, o.state, o.is_urgent, blood_info(o.blood_type, o.blood_rh), o.bag_count, o.transport_id,
+         o.hospital_id) for o in dataset.orders)
+    yield "donations", ["id", "date", "fk_donor_id", "fk_nurse_id"], (
+        (d.id, d.date, d.donor_id, d.nurse_id) for d in dataset.donations)
+    yield "examinations", ["id", "date", "weight", "height", "diastolic_blood_pressure", "systolic_blood_pressure",
+                           "is_qualified", "form_number", "fk_donor_id", "fk_doctor_id"], (
+        (e.id, e.date, e.weight, e.height, e.diastolic_blood_pressure, e.systolic_blood_pressure, e.is_qualified,
+         e.form_number, e.donor_id, e.doctor_id) for e in dataset.examinations)
+    yield "lab_results", ["id", "date", "red_cells_count", "white_cells_count", "platelet_count",
+                          "hemoglobin_level", "hematocrit_level", "glucose_level", "is_qualified"], (
+        (r.id, r.date, r.red_cells_count, r.white_cells_count, r.platelet_count, r.hemoglobin_level,
+         r.hematocrit_level, r.glucose_level, r.is_qualified) for r in dataset.lab_results)
+
+    # the partitioned layout references donations and lab_results by (id, date)
+    columns = ["id", "volume", "fk_donation_id", "fk_lab_results_id", "fk_facility_id"]
+    if partitioned:
+        columns += ["donation_date", "lab_results_date"]
+
+    def blood_bag_rows():
+        for b in dataset.blood_bags:
+            row = (b.id, b.volume, b.donation_id, b.lab_result_id, b.facility_id)
+            if partitioned:
+                row += (dataset.donations[b.donation_id - 1].date, dataset.lab_results[b.lab_result_id - 1].date)
+            yield row
+
+    yield "blood_bags", columns, blood_bag_rows()
+    yield "blood_bags_orders", ["fk_blood_bag_id", "fk_order_id"], (
+        (b.id, b.order_id) for b in dataset.blood_bags if b.order_id is not None)
+
+
+def emit(conn, dataset, batch_size=BATCH_SIZE, on_table=None):
+    # replaces the contents of every table with the dataset, ids included, and
+    # moves the identity sequences past them so later inserts keep working
+    with conn.cursor() as cur:
+        partitioned = is_partitioned(cur)
+        if partitioned:
+            cur.execute("SELECT ensure_year_partitions(%s, %s)",
+                        (min(d.date for d in dataset.donations).year, dataset.now.year + 1))
+        # the lab5 inventory counters are no FK child of blood_bags, CASCADE
+        # would leave them counting the bags of the previous load
+        cur.execute("SELECT to_regclass('blood_inventory') IS NOT NULL")
+        tables_to_clear = TABLES + ["blood_inventory"] if cur.fetchone()[0] else TABLES
+        cur.execute("TRUNCATE {} RESTART IDENTITY CASCADE".format(", ".join(f'"{t}"' for t in tables_to_clear)))
+
+        counts = {}
+        for table, columns, rows in tables(dataset, partitioned):
+            counts[table] = copy_rows(cur, table, columns, rows, batch_size)
+            if columns[0] == "id" and counts[table]:
+                cur.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", (f'"{table}"', counts[table]))
+            if on_table:
+                on_table(table, counts[table])
+    conn.commit()
+    return counts
@@ -1,23 +1,82 @@
-import os
-from dotenv import load_dotenv
+import argparse
+import sys
+import time
 from pathlib import Path
-import psycopg2
+from psycopg2.extras import execute_values
 import random
 from datetime import datetime, timedelta
 from faker import Faker
 
+import allocation
+from bulk import BATCH_SIZE, copy_rows, reserve_ids
+from connection import Pool, deferrable, drop_deferred, durable_commit, open_connection, restore_deferred
+from registry import UniqueRegistry
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.manifest import RunManifest
+from common.model import BLOOD_RHS, BLOOD_TYPES, CERTIFICATE_LEVELS, COUNTS, ORDER_STATES, SEXES, scaled
+from common.pesel import PeselAllocator
+from common.pools import PooledFaker
+
 fake = Faker(['pl-PL'])
 
-load_dotenv(dotenv_path=Path('db.env'))
+BULK = False
+PARTITIONED = False
+SESSION = {}
+CLINICAL = "rows"
+NOW = datetime.now()
+SHARD = 0
+SHARDS = 1
+
+conn = None
+cur = None
+registries = {}
+
+
+def registry(table, *columns):
+    key = (table,) + columns
+    if key not in registries:
+        registries[key] = UniqueRegistry.load(conn, table, *columns, shard=SHARD, shards=SHARDS)
+    return registries[key]
+
+
+def table_ids(table):
+    cur.execute(f'SELECT id FROM "{table}" ORDER BY id')
+    return [row[0] for row in cur.fetchall()]
+
+
+def sample_ids(table, n):
+    # sampled on the client so that the seed alone decides which rows are picked
+    ids = table_ids(table)
+    return random.sample(ids, min(n, len(ids)))
+
+
+def random_phone_number():
+    return ''.join([str(random.randint(0, 9)) for _ in range(9)])
+
+
+def with_ids(ids, columns, rows):
+    if ids is None:
+        return columns, rows
+    return ["id"] + columns, ((row_id,) + row for row_id, row in zip(ids, rows))
+
+
+def write_rows(table, columns, rows):
+    if BULK:
+        return copy_rows(cur, table, columns, rows, BATCH_SIZE)
+
+    sql = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+        table, ", ".join(columns), ", ".join(["%s"] * len(columns)))
+    count = 0
+    for row in rows:
+        cur.execute(sql, row)
+        count += 1
+    return count
 
-conn = psycopg2.connect(
-    dbname=os.getenv('DB_DATABASE'),
-    user=os.getenv('DB_USER'),
-    password=os.getenv('DB_PASSWORD'),
-    host=os.getenv('DB_HOST'),
-    port=os.getenv('DB_PORT')
-)
-cur = conn.cursor()
+
+def write_links(table, columns, rows):
+    execute_values(cur, 'INSERT INTO "{}" ({}) VALUES %s ON CONFLICT DO NOTHING'.format(
+        table, ", ".join(columns)), rows, page_size=BATCH_SIZE)
 
 
 def remove_polish_signs(name):
@@ -29,6 +88,14 @@ def remove_polish_signs(name):
     return name.translate(polish_chars)
 
 
+def random_birth_date(minimum_age, maximum_age):
+    today = NOW.date()
+    return fake.date_between_dates(
+        date_start=today - timedelta(days=int((maximum_age + 1) * 365.25) - 1),
+        date_end=today - timedelta(days=int(minimum_age * 365.25) + 1)
+    )
+
+
 def random_email(firstname, lastname):
     firstname = remove_polish_signs(firstname.lower().replace(" ", ""))
     lastname = remove_polish_signs(lastname.lower().replace(" ", ""))
@@ -69,198 +136,155 @@ def random_login(firstname, lastname):
     return random.choice(options)
 
 
-def insert_users(n):
-    for _ in range(n):
-        first_name = fake.first_name()
-        last_name = fake.last_name()
+def insert_users(n, ids=None):
+    logins = registry("users", "login")
+    emails = registry("users", "email")
+    phone_numbers = registry("users", "phone_number")
 
-        login = random_login(first_name, last_name)
-        while True:
-            cur.execute('SELECT COUNT(*) FROM "users" WHERE login = %s', (login,))
-            if cur.fetchone()[0] == 0:
-                break
-            login += str(random.randint(1, 9))
+    def rows():
+        for _ in range(n):
+            first_name = fake.first_name()
+            last_name = fake.last_name()
 
-        email = random_email(first_name, last_name)
-        while True:
-            cur.execute('SELECT COUNT(*) FROM "users" WHERE email = %s', (email,))
-            if cur.fetchone()[0] == 0:
-                break
+            login = logins.unique(
+                random_login(first_name, last_name),
+                lambda value: random_login(first_name, last_name))
 
-            email = email.split('@')[0] + str(random.randint(1, 9)) + "@" + email.split('@')[1]
+            email = emails.unique(
+                random_email(first_name, last_name),
+                lambda value: random_email(first_name, last_name))
 
-        phone_number = ''.join([str(random.randint(0, 9)) for _ in range(9)])
-        while True:
-            cur.execute('SELECT COUNT(*) FROM "users" WHERE phone_number = %s', (phone_number,))
-            if cur.fetchone()[0] == 0:
-                break
-            phone_number = ''.join(
-                [str(random.randint(0, 9)) for _ in range(9)])
+            phone_number = phone_numbers.unique(random_phone_number(), lambda value: random_phone_number())
 
-        password = fake.password(length=10, special_chars=True, upper_case=True)
-        if "_" in password:
-            password = password.replace("_", "!")
+            password = fake.password(length=10, special_chars=True, upper_case=True)
+            if "_" in password:
+                password = password.replace("_", "!")
 
-        cur.execute("""
-            INSERT INTO "users" (first_name, last_name, login, email, password, phone_number)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (first_name, last_name, login, email, password, phone_number))
+            yield first_name, last_name, login, email, password, phone_number
+
+    write_rows("users", *with_ids(ids, ["first_name", "last_name", "login", "email", "password", "phone_number"], rows()))
 
 
 def insert_doctors(n):
-    cur.execute('SELECT id FROM "users" ORDER BY random() LIMIT %s', (n,))
-    user_ids = cur.fetchall()
-    for user_id in user_ids:
-        cur.execute("""
-            INSERT INTO "doctors" (fk_user_id)
-            VALUES (%s)
-        """, (user_id[0],))
+    user_ids = sample_ids("users", n)
+    write_rows("doctors", ["fk_user_id"], ((user_id,) for user_id in user_ids))
 
 
 def insert_nurses(n):
-    for _ in range(n):
-        first_name = fake.first_name()
-        last_name = fake.last_name()
-        phone_number = ''.join([str(random.randint(0, 9)) for _ in range(9)])
-        cur.execute("""
-            INSERT INTO "nurses" (first_name, last_name, phone_number)
-            VALUES (%s, %s, %s)
-        """, (first_name, last_name, phone_number))
+    def rows():
+        for _ in range(n):
+            first_name = fake.first_name()
+            last_name = fake.last_name()
+            phone_number = random_phone_number()
+            yield first_name, last_name, phone_number
+
+    write_rows("nurses", ["first_name", "last_name", "phone_number"], rows())
 
 
 def insert_moderators(n):
-    cur.execute('SELECT id FROM "users" ORDER BY random() LIMIT %s', (n,))
-    user_ids = cur.fetchall()
-    for user_id in user_ids:
-        cur.execute("""
-            INSERT INTO "moderators" (fk_user_id)
-            VALUES (%s)
-        """, (user_id[0],))
+    user_ids = sample_ids("users", n)
+    write_rows("moderators", ["fk_user_id"], ((user_id,) for user_id in user_ids))
 
 
 def insert_hospitals(n):
-    cur.execute('SELECT id FROM "users" ORDER BY random() LIMIT %s', (n,))
-    user_ids = cur.fetchall()
-    for user_id in user_ids:
-        name = fake.company()
-        address = fake.address()
-        cur.execute("""
-            INSERT INTO "hospitals" (name, address, fk_user_id)
-            VALUES (%s, %s, %s)
-        """, (name, address, user_id[0]))
-
-
-def insert_donors(n):
-    cur.execute('SELECT id FROM "users" ORDER BY random() LIMIT %s', (n,))
-    user_ids = cur.fetchall()
-    blood_types = ['0', 'A', 'B', 'AB']
-    blood_rhs = ['+', '-']
-    sexes = ['M', 'F']
-    for user_id in user_ids:
-
-        birth_date = fake.date_of_birth(minimum_age=18, maximum_age=60)
-        sex = random.choice(sexes)
-        blood_type = random.choice(blood_types)
-        blood_rh = random.choice(blood_rhs)
-        while True:
-            pesel = fake.pesel(datetime.combine(birth_date, datetime.min.time()), sex)
-            cur.execute('SELECT COUNT(*) FROM "donors" WHERE pesel = %s', (pesel,))
-            if cur.fetchone()[0] == 0:
-                break
-        cur.execute("""
-            INSERT INTO "donors" (pesel, birth_date, sex, blood_info, fk_user_id)
-            VALUES (%s, %s, %s, ROW(%s, %s)::blood_info, %s)
-        """, (pesel, birth_date, sex, blood_type, blood_rh, user_id[0]))
+    user_ids = sample_ids("users", n)
+
+    def rows():
+        for user_id in user_ids:
+            name = fake.company()
+            address = fake.address()
+            yield name, address, user_id
+
+    write_rows("hospitals", ["name", "address", "fk_user_id"], rows())
+
+
+def insert_donors(n, user_ids=None, ids=None):
+    if user_ids is None:
+        user_ids = sample_ids("users", n)
+    # serials per birth date and sex, unique across shards without any retries
+    pesels = PeselAllocator(registry("donors", "pesel").values, SHARD, SHARDS)
+
+    def rows():
+        for user_id in user_ids:
+
+            birth_date = random_birth_date(18, 60)
+            sex = random.choice(SEXES)
+            blood_type = random.choice(BLOOD_TYPES)
+            blood_rh = random.choice(BLOOD_RHS)
+            pesel = pesels.allocate(birth_date, sex)
+            yield pesel, birth_date, sex, f"({blood_type},{blood_rh})", user_id
+
+    write_rows("donors", *with_ids(ids, ["pesel", "birth_date", "sex", "blood_info", "fk_user_id"], rows()))
 
 
 def insert_drivers(n):
-    for _ in range(n):
-        first_name = fake.first_name()
-        last_name = fake.last_name()
-        cur.execute("""
-            INSERT INTO "drivers" (first_name, last_name)
-            VALUES (%s, %s)
-        """, (first_name, last_name))
+    def rows():
+        for _ in range(n):
+            first_name = fake.first_name()
+            last_name = fake.last_name()
+            yield first_name, last_name
+
+    write_rows("drivers", ["first_name", "last_name"], rows())
 
 
 def insert_transports(n):
-    cur.execute('SELECT id FROM "drivers" ORDER BY random() LIMIT %s', (n,))
-    driver_ids = cur.fetchall()
-    for driver_id in driver_ids:
-        cur.execute("""
-            INSERT INTO "transports" (fk_driver_id)
-            VALUES (%s)
-        """, (driver_id[0],))
+    driver_ids = sample_ids("drivers", n)
+    write_rows("transports", ["fk_driver_id"], ((driver_id,) for driver_id in driver_ids))
 
 
 def insert_orders(n):
-    cur.execute('SELECT id FROM "hospitals"')
-    hospital_ids = [h[0] for h in cur.fetchall()]
-    cur.execute('SELECT id FROM "transports"')
-    transport_ids = [t[0] for t in cur.fetchall()]
+    hospital_ids = table_ids("hospitals")
+    transport_ids = table_ids("transports")
 
-    states = ['COMPLETED', 'AWAITING', 'CANCELED']
     num_hospitals = len(hospital_ids)
     num_transports = len(transport_ids)
 
-    for j in range(n):
-        order_date = datetime.now() - timedelta(days=random.randint(1, 3000))
-        state = random.choice(states)
-        is_urgent = random.choice([True, False])
-
-        hospital_id = hospital_ids[j % num_hospitals]
-        transport_id = transport_ids[j % num_transports] if num_transports > 0 else None
-
-        cur.execute("""
-            INSERT INTO "orders" (date, state, is_urgent, fk_transport_id, fk_hospital_id)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (order_date, state, is_urgent, transport_id, hospital_id))
+    def rows():
+        for j in range(n):
+            order_date = NOW - timedelta(days=random.randint(1, 3000))
+            state = random.choice(ORDER_STATES)
+            is_urgent = random.choice([True, False])
+            blood_info = f"({random.choice(BLOOD_TYPES)},{random.choice(BLOOD_RHS)})"
+            bag_count = random.randint(1, 3)
 
+            hospital_id = hospital_ids[j % num_hospitals]
+            transport_id = transport_ids[j % num_transports] if num_transports > 0 else None
 
-def insert_donations_and_examinations(n):
-    cur.execute('SELECT id FROM "donors" ORDER BY random() LIMIT %s', (n,))
-    donor_ids = cur.fetchall()
+            yield order_date, state, is_urgent, blood_info, bag_count, transport_id, hospital_id
 
-    cur.execute('SELECT id FROM "doctors" ORDER BY random()')
-    doctor_ids = [doc[0] for doc in cur.fetchall()]
+    write_rows("orders", ["date", "state", "is_urgent", "blood_info", "bag_count", "fk_transport_id", "fk_hospital_id"],
+               rows())
 
-    cur.execute('SELECT id FROM "facilities" ORDER BY random()')
-    facility_ids = [fac[0] for fac in cur.fetchall()]
 
-    cur.execute('SELECT id FROM "nurses" ORDER BY random()')
-    nurse_ids = [nurse[0] for nurse in cur.fetchall()]
+DONATION_CHAIN_TABLES = ["donations", "examinations", "lab_results", "blood_bags"]
+DONATION_DAYS = 10000
+PARTITIONING_SQL = Path(__file__).resolve().parent.parent / "lab3" / "partitioning.sql"
+EXAMINATION_COLUMNS = ["date", "weight", "height", "diastolic_blood_pressure", "systolic_blood_pressure",
+                       "is_qualified", "form_number", "fk_donor_id", "fk_doctor_id"]
+LAB_RESULT_COLUMNS = ["date", "red_cells_count", "white_cells_count", "platelet_count",
+                      "hemoglobin_level", "hematocrit_level", "glucose_level", "is_qualified"]
 
-    for donor_id in donor_ids:
-        donation_date = datetime.now() - timedelta(days=random.randint(1, 10000))
-        nurse_id = random.choice(nurse_ids)
-
-        cur.execute("""
-            INSERT INTO "donations" (date, fk_donor_id, fk_nurse_id)
-            VALUES (%s, %s, %s) RETURNING id
-        """, (donation_date, donor_id[0], nurse_id))
-        donation_id = cur.fetchone()[0]
 
+def random_examination(donation_date, donor_id, doctor_ids, form_numbers, values=None):
+    # values: the measurements already generated column-wise by clinical_values
+    if values is None:
         weight = round(random.uniform(50.0, 100.0), 2)
         height = random.randint(150, 200)
         diastolic_blood_pressure = random.randint(60, 90)
         systolic_blood_pressure = random.randint(90, 140)
         is_qualified = random.choice([True] * 8 + [False])
-        doctor_id = random.choice(doctor_ids)
-
-        while True:
-            form_number = str(random.randint(500000000, 600000000))
-            cur.execute('SELECT COUNT(*) FROM "examinations" WHERE form_number = %s', (form_number,))
-            if cur.fetchone()[0] == 0:
-                break
-
-        cur.execute("""
-            INSERT INTO "examinations" (date, weight, height, diastolic_blood_pressure, systolic_blood_pressure,
-                                        is_qualified, form_number, fk_donor_id, fk_doctor_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            donation_date, weight, height, diastolic_blood_pressure, systolic_blood_pressure,
-            is_qualified, form_number, donor_id[0], doctor_id))
+        values = (weight, height, diastolic_blood_pressure, systolic_blood_pressure, is_qualified)
+    doctor_id = random.choice(doctor_ids)
+
+    form_number = form_numbers.unique(
+        str(random.randint(500000000, 600000000)),
+        lambda value: str(random.randint(500000000, 600000000)))
+
+    return (donation_date,) + values + (form_number, donor_id, doctor_id)
+
 
+def random_lab_result(donation_date, values=None):
+    if values is None:
         red_cells_count = round(random.uniform(4.0, 6.0), 2)
         white_cells_count = round(random.uniform(4.0, 11.0), 2)
         platelet_count = round(random.uniform(150, 450), 2)
@@ -268,162 +292,373 @@ def insert_donations_and_examinations(n):
         hematocrit_level = round(random.uniform(36.0, 52.0), 2)
         glucose_level = round(random.uniform(70, 140), 2)
         is_qualified = random.choice([True] * 8 + [False])
-        lab_result_date = donation_date + timedelta(days=random.randint(1, 7))
-        lab_result_date = min(lab_result_date, datetime.now())
+        values = (red_cells_count, white_cells_count, platelet_count,
+                  hemoglobin_level, hematocrit_level, glucose_level, is_qualified, random.randint(1, 7))
+    *values, delay = values
+    lab_result_date = min(donation_date + timedelta(days=delay), NOW)
 
-        cur.execute("""
-            INSERT INTO "lab_results" (date, red_cells_count, white_cells_count, platelet_count,
-                                       hemoglobin_level, hematocrit_level, glucose_level, is_qualified)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
-        """, (lab_result_date, red_cells_count, white_cells_count, platelet_count,
-              hemoglobin_level, hematocrit_level, glucose_level, is_qualified))
+    return (lab_result_date,) + tuple(values)
 
-        lab_result_id = cur.fetchone()[0]
 
-        volume = random.randint(450, 550)
-        facility_id = random.choice(facility_ids)
+def clinical_values(n):
+    # examination and lab result measurements of n donations, built with numpy a
+    # column at a time instead of ~15 random calls per donation
+    if CLINICAL == "rows":
+        return [None] * n, [None] * n
 
-        cur.execute("""
-            INSERT INTO "blood_bags" (volume, fk_donation_id, fk_lab_results_id, fk_facility_id)
-            VALUES (%s, %s, %s, %s)
-        """, (volume, donation_id, lab_result_id, facility_id))
+    from common import clinical
+    gen = clinical.generator(random)
+    correlated = CLINICAL == "correlated"
+    examinations = clinical.examinations(gen, n, correlated)
+    lab_results = clinical.lab_results(gen, n, correlated)
+    lab_results["delay"] = clinical.integers(gen, n, 1, 7)
+    return (list(clinical.rows(examinations, EXAMINATION_COLUMNS[1:6])),
+            list(clinical.rows(lab_results, LAB_RESULT_COLUMNS[1:] + ["delay"])))
 
 
-def insert_facilities(n):
-    for _ in range(n):
-        number_of_facility = random.randint(100, 999)
-        name = f"Placówka Donacji {number_of_facility}"
-        address = f"{random.randint(1, 999)} {random.choice(['Kwiatowa', 'Złota', 'Generalna', 'Wyszyńskiego'])}"
-        phone_number = ''.join([str(random.randint(0, 9)) for _ in range(9)])
-        email = f"placowka{number_of_facility}@krew.pl"
+def blood_bag_columns():
+    # the partitioned layout references donations and lab_results by (id, date)
+    columns = ["volume", "fk_donation_id", "fk_lab_results_id", "fk_facility_id"]
+    return columns + ["donation_date", "lab_results_date"] if PARTITIONED else columns
 
-        cur.execute("""
-            INSERT INTO "facilities" (name, address, email, phone_number)
-            VALUES (%s, %s, %s, %s)
-        """, (name, address, email, phone_number))
 
+def blood_bag_row(volume, donation_id, donation_date, lab_result_id, lab_result_date, facility_id):
+    row = (volume, donation_id, lab_result_id, facility_id)
+    return row + (donation_date, lab_result_date) if PARTITIONED else row
 
-def insert_certificates(n):
-    cur.execute('SELECT id FROM "donors" ORDER BY random() LIMIT %s', (n,))
-    donor_ids = cur.fetchall()
 
-    certificate_levels = ['I', 'II', 'III']
+def use_partitioned_layout():
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('donations')")
+    if cur.fetchone()[0] != 'p':
+        cur.execute(PARTITIONING_SQL.read_text(encoding="utf-8"))
+    # donation dates go back DONATION_DAYS from the reference time
+    cur.execute("SELECT ensure_year_partitions(%s, %s)",
+                ((NOW - timedelta(days=DONATION_DAYS)).year, NOW.year + 1))
 
-    for donor_id in donor_ids:
-        level = random.choice(certificate_levels)
-        acquisition_date = datetime.now() - timedelta(days=random.randint(0, 10000))
 
-        cur.execute('SELECT COUNT(*) FROM "certificates" WHERE fk_donor_id = %s AND level = %s', (donor_id[0], level))
-        if cur.fetchone()[0] == 0:
-            cur.execute("""
-                INSERT INTO "certificates" (level, acquisition_date, fk_donor_id)
-                VALUES (%s, %s, %s)
-            """, (level, acquisition_date, donor_id[0]))
+def insert_donations_and_examinations(n, rounds=1, ids=None):
+    doctor_ids = table_ids("doctors")
+    facility_ids = table_ids("facilities")
+    nurse_ids = table_ids("nurses")
 
+    form_numbers = registry("examinations", "form_number")
 
-def assign_facilities_to_nurses():
-    cur.execute('SELECT id FROM "nurses"')
-    nurse_ids = [nurse[0] for nurse in cur.fetchall()]
+    if BULK:
+        insert_donation_chains(n, rounds, ids, doctor_ids, facility_ids, nurse_ids, form_numbers)
+        return
+
+    for _ in range(rounds):
+        donor_ids = sample_ids("donors", n)
+        examination_values, lab_result_values = clinical_values(len(donor_ids))
 
-    cur.execute('SELECT id FROM "facilities"')
-    facility_ids = [facility[0] for facility in cur.fetchall()]
+        examinations = []
+        blood_bags = []
 
-    for nurse_id in nurse_ids:
-        selected_facilities = random.sample(facility_ids, random.randint(1, 3))
-        for facility_id in selected_facilities:
+        for donor_id, examination_value, lab_result_value in zip(donor_ids, examination_values, lab_result_values):
+            donation_date = NOW - timedelta(days=random.randint(1, DONATION_DAYS))
+            nurse_id = random.choice(nurse_ids)
 
             cur.execute("""
-                SELECT 1 FROM "nurses_facilities" 
-                WHERE fk_nurse_id = %s AND fk_facility_id = %s
-            """, (nurse_id, facility_id))
+                INSERT INTO "donations" (date, fk_donor_id, fk_nurse_id)
+                VALUES (%s, %s, %s) RETURNING id
+            """, (donation_date, donor_id, nurse_id))
+            donation_id = cur.fetchone()[0]
 
-            if cur.fetchone() is None:
-                cur.execute("""
-                    INSERT INTO "nurses_facilities" (fk_nurse_id, fk_facility_id)
-                    VALUES (%s, %s)
-                """, (nurse_id, facility_id))
+            examinations.append(random_examination(donation_date, donor_id, doctor_ids, form_numbers,
+                                                   examination_value))
 
+            lab_result = random_lab_result(donation_date, lab_result_value)
+            cur.execute("""
+                INSERT INTO "lab_results" (date, red_cells_count, white_cells_count, platelet_count,
+                                           hemoglobin_level, hematocrit_level, glucose_level, is_qualified)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
+            """, lab_result)
+            lab_result_id = cur.fetchone()[0]
+
+            volume = random.randint(450, 550)
+            facility_id = random.choice(facility_ids)
+
+            blood_bags.append(blood_bag_row(volume, donation_id, donation_date, lab_result_id, lab_result[0], facility_id))
+
+        write_rows("examinations", EXAMINATION_COLUMNS, examinations)
+        write_rows("blood_bags", blood_bag_columns(), blood_bags)
+
+
+def insert_donation_chains(n, rounds, ids, doctor_ids, facility_ids, nurse_ids, form_numbers):
+    # ids come from reserved identity blocks (or from blocks the caller has
+    # reserved already), so the foreign keys are known up front and all four
+    # tables go through COPY without RETURNING
+    all_donor_ids = table_ids("donors")
+
+    offset = 0
+    rounds_per_chunk = max(1, BATCH_SIZE // max(n, 1))
+    for chunk_start in range(0, rounds, rounds_per_chunk):
+        donor_ids = []
+        for _ in range(min(rounds_per_chunk, rounds - chunk_start)):
+            donor_ids.extend(random.sample(all_donor_ids, min(n, len(all_donor_ids))))
+
+        if ids:
+            chunk_ids = {table: ids[table][offset:offset + len(donor_ids)] for table in DONATION_CHAIN_TABLES}
+        else:
+            chunk_ids = {table: reserve_ids(cur, table, len(donor_ids)) for table in DONATION_CHAIN_TABLES}
+        offset += len(donor_ids)
+        examination_values, lab_result_values = clinical_values(len(donor_ids))
+
+        donations = []
+        examinations = []
+        lab_results = []
+        blood_bags = []
+
+        for (donor_id, examination_value, lab_result_value,
+             donation_id, examination_id, lab_result_id, blood_bag_id) in zip(
+                donor_ids, examination_values, lab_result_values,
+                *(chunk_ids[table] for table in DONATION_CHAIN_TABLES)):
+            donation_date = NOW - timedelta(days=random.randint(1, DONATION_DAYS))
+            nurse_id = random.choice(nurse_ids)
+            donations.append((donation_id, donation_date, donor_id, nurse_id))
+
+            examinations.append((examination_id,) + random_examination(
+                donation_date, donor_id, doctor_ids, form_numbers, examination_value))
+            lab_result = random_lab_result(donation_date, lab_result_value)
+            lab_results.append((lab_result_id,) + lab_result)
+
+            volume = random.randint(450, 550)
+            facility_id = random.choice(facility_ids)
+            blood_bags.append((blood_bag_id,) + blood_bag_row(
+                volume, donation_id, donation_date, lab_result_id, lab_result[0], facility_id))
+
+        write_rows("donations", ["id", "date", "fk_donor_id", "fk_nurse_id"], donations)
+        write_rows("examinations", ["id"] + EXAMINATION_COLUMNS, examinations)
+        write_rows("lab_results", ["id"] + LAB_RESULT_COLUMNS, lab_results)
+        write_rows("blood_bags", ["id"] + blood_bag_columns(), blood_bags)
 
-def assign_facilities_to_doctors():
-    cur.execute('SELECT id FROM "doctors"')
-    doctor_ids = [doctor[0] for doctor in cur.fetchall()]
 
-    cur.execute('SELECT id FROM "facilities"')
-    facility_ids = [facility[0] for facility in cur.fetchall()]
+def insert_facilities(n):
+    emails = registry("facilities", "email")
+    phone_numbers = registry("facilities", "phone_number")
 
-    for doctor_id in doctor_ids:
-        selected_facilities = random.sample(facility_ids, random.randint(1, 3))
-        for facility_id in selected_facilities:
+    def rows():
+        for _ in range(n):
+            number_of_facility = random.randint(100, 999)
+            while not emails.add(f"placowka{number_of_facility}@krew.pl"):
+                number_of_facility = random.randint(100, 999)
+            name = f"Placówka Donacji {number_of_facility}"
+            address = f"{random.randint(1, 999)} {random.choice(['Kwiatowa', 'Złota', 'Generalna', 'Wyszyńskiego'])}"
+            phone_number = phone_numbers.unique(random_phone_number(), lambda value: random_phone_number())
+            email = f"placowka{number_of_facility}@krew.pl"
+            yield name, address, email, phone_number
 
-            cur.execute("""
-                SELECT 1 FROM "doctors_facilities" 
-                WHERE fk_doctor_id = %s AND fk_facility_id = %s
-            """, (doctor_id, facility_id))
+    write_rows("facilities", ["name", "address", "email", "phone_number"], rows())
 
-            if cur.fetchone() is None:
-                cur.execute("""
-                    INSERT INTO "doctors_facilities" (fk_doctor_id, fk_facility_id)
-                    VALUES (%s, %s)
-                """, (doctor_id, facility_id))
 
+def insert_certificates(n):
+    donor_ids = sample_ids("donors", n)
 
-def assign_blood_bags_to_orders():
-    cur.execute('SELECT id FROM "orders" WHERE state IN (%s,%s)', ('AWAITING', 'COMPLETED'))
-    order_ids = [order[0] for order in cur.fetchall()]
+    certificates = registry("certificates", "fk_donor_id", "level")
 
-    cur.execute("""
-        SELECT bb.id
-        FROM "blood_bags" bb
-        JOIN "lab_results" lr ON bb.fk_lab_results_id = lr.id
-        WHERE lr.is_qualified = true
-            AND bb.id NOT IN (SELECT fk_blood_bag_id FROM "blood_bags_orders")
-    """)
+    def rows():
+        for donor_id in donor_ids:
+            level = random.choice(CERTIFICATE_LEVELS)
+            acquisition_date = NOW - timedelta(days=random.randint(0, 10000))
 
-    available_blood_bag_ids = [bag[0] for bag in cur.fetchall()]
+            if certificates.add((donor_id, level)):
+                yield level, acquisition_date, donor_id
 
-    if not available_blood_bag_ids:
-        print("No blood bags available")
-        return
+    write_rows("certificates", ["level", "acquisition_date", "fk_donor_id"], rows())
 
-    assigned_blood_bag_ids_count = 0
-    for order_id in order_ids:
-        if assigned_blood_bag_ids_count >= len(available_blood_bag_ids):
-            break
 
-        bag_needed = random.randint(1, 3)
+def assign_facilities_to_nurses():
+    nurse_ids = table_ids("nurses")
+    facility_ids = table_ids("facilities")
 
-        for _ in range(bag_needed):
-            if assigned_blood_bag_ids_count >= len(available_blood_bag_ids):
-                break
+    pairs = [
+        (nurse_id, facility_id)
+        for nurse_id in nurse_ids
+        for facility_id in random.sample(facility_ids, random.randint(1, 3))
+    ]
+    write_links("nurses_facilities", ["fk_nurse_id", "fk_facility_id"], pairs)
 
-            blood_bag_id = available_blood_bag_ids[assigned_blood_bag_ids_count]
-            cur.execute("""
-                INSERT INTO "blood_bags_orders" (fk_blood_bag_id, fk_order_id)
-                VALUES (%s, %s)
-            """, (blood_bag_id, order_id))
-            assigned_blood_bag_ids_count += 1
-
-    print(f'assigned blood bags: {assigned_blood_bag_ids_count}')
-
-
-insert_users(5000)
-insert_doctors(20)
-insert_nurses(30)
-insert_moderators(10)
-insert_hospitals(10)
-insert_donors(2000)
-insert_drivers(15)
-insert_transports(10000)
-insert_orders(20)
-insert_facilities(5)
-for i in range(100):
-    insert_donations_and_examinations(50)
-insert_certificates(100)
-assign_facilities_to_nurses()
-assign_facilities_to_doctors()
-assign_blood_bags_to_orders()
-
-conn.commit()
-cur.close()
-conn.close()
-print("Database populated with random data.")
+
+def assign_facilities_to_doctors():
+    doctor_ids = table_ids("doctors")
+    facility_ids = table_ids("facilities")
+
+    pairs = [
+        (doctor_id, facility_id)
+        for doctor_id in doctor_ids
+        for facility_id in random.sample(facility_ids, random.randint(1, 3))
+    ]
+    write_links("doctors_facilities", ["fk_doctor_id", "fk_facility_id"], pairs)
+
+
+def assign_blood_bags_to_orders():
+    # completed orders are filled too, so that the history has shipped bags
+    allocation.assign(conn, states=("AWAITING", "COMPLETED"))
+
+
+def seed_stages(counts, parallel=None):
+    users = parallel.insert_users if parallel else insert_users
+    donors = parallel.insert_donors if parallel else insert_donors
+    donations = parallel.insert_donations_and_examinations if parallel else insert_donations_and_examinations
+
+    return [
+        ("users", lambda: users(counts["users"])),
+        ("doctors", lambda: insert_doctors(counts["doctors"])),
+        ("nurses", lambda: insert_nurses(counts["nurses"])),
+        ("moderators", lambda: insert_moderators(counts["moderators"])),
+        ("hospitals", lambda: insert_hospitals(counts["hospitals"])),
+        ("donors", lambda: donors(counts["donors"])),
+        ("drivers", lambda: insert_drivers(counts["drivers"])),
+        ("transports", lambda: insert_transports(counts["transports"])),
+        ("orders", lambda: insert_orders(counts["orders"])),
+        ("facilities", lambda: insert_facilities(counts["facilities"])),
+        ("donations", lambda: donations(counts["donations"], rounds=counts["donation_rounds"])),
+        ("certificates", lambda: insert_certificates(counts["certificates"])),
+        ("nurses_facilities", assign_facilities_to_nurses),
+        ("doctors_facilities", assign_facilities_to_doctors),
+        ("blood_bags_orders", assign_blood_bags_to_orders),
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Populate the blood donation database with random data.")
+    parser.add_argument("--bulk", action="store_true",
+                        help="build rows in memory and load them with COPY instead of row-by-row INSERTs")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="rows per COPY batch in bulk mode")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes generating users, donors and donations in parallel "
+                             "(reproducible ids for the donation chain need --bulk)")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="seed the yearly partitioned layout of lab3/partitioning.sql, "
+                             "an unpartitioned schema is converted first")
+    parser.add_argument("--scale", type=float, default=1,
+                        help="multiply every row count, e.g. 10 or 100 for benchmark data sets")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="base seed, every stage and worker derives its own seed from it")
+    parser.add_argument("--manifest", default="seed-manifest.json",
+                        help="file recording the seed, counts and completed stages of the run")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the run recorded in --manifest after its last completed stage")
+    parser.add_argument("--synchronous-commit", choices=["on", "off"], default=None,
+                        help="synchronous_commit of the load sessions, off does not wait for WAL flushes "
+                             "(a stage is still only checkpointed once it is on disk)")
+    parser.add_argument("--work-mem", default=None, help="work_mem of the load sessions, e.g. 256MB")
+    parser.add_argument("--maintenance-work-mem", default=None,
+                        help="maintenance_work_mem of the load sessions, used when deferred indexes are built")
+    parser.add_argument("--defer-indexes", action="store_true",
+                        help="drop non-unique indexes before the load and build them afterwards")
+    parser.add_argument("--defer-foreign-keys", action="store_true",
+                        help="drop foreign keys before the load and add them back afterwards")
+    parser.add_argument("--bare", action="store_true",
+                        help="load into bare tables: drop every index, key, check and foreign key first, "
+                             "then build the indexes and add the constraints NOT VALID and validate them")
+    parser.add_argument("--clinical", choices=["rows", "columns", "correlated"], default="rows",
+                        help="how examination and lab result measurements are generated: row by row, "
+                             "as whole numpy columns, or as numpy columns with realistic correlations "
+                             "(qualification following hemoglobin and blood pressure)")
+    parser.add_argument("--value-pools", type=int, default=0, metavar="SIZE",
+                        help="draw names, companies, addresses and passwords from pools of SIZE faker values "
+                             "per field, generated once per seed and cached in .cache/pools")
+    parser.add_argument("--pool-size", type=int, default=4,
+                        help="connections building deferred indexes and keys in parallel")
+    args = parser.parse_args()
+
+    session = {}
+    if args.synchronous_commit:
+        session["synchronous_commit"] = args.synchronous_commit
+    if args.work_mem:
+        session["work_mem"] = args.work_mem
+    if args.maintenance_work_mem:
+        session["maintenance_work_mem"] = args.maintenance_work_mem
+
+    manifest = RunManifest.open(
+        args.manifest,
+        seed=args.seed,
+        counts=None if args.resume else scaled(COUNTS, args.scale),
+        settings={"bulk": args.bulk, "batch_size": args.batch_size, "workers": args.workers,
+                  "partitioned": args.partitioned, "session": session,
+                  "defer_indexes": args.defer_indexes, "defer_foreign_keys": args.defer_foreign_keys,
+                  "bare": args.bare, "clinical": args.clinical, "value_pools": args.value_pools},
+        resume=args.resume
+    )
+    settings = manifest.data["settings"]
+    BULK = settings["bulk"]
+    BATCH_SIZE = settings["batch_size"]
+    PARTITIONED = settings.get("partitioned", False)
+    SESSION = settings.get("session", {})
+    CLINICAL = settings.get("clinical", "rows")
+    if settings.get("value_pools"):
+        fake = PooledFaker("pl_PL", manifest.seed, settings["value_pools"], fake)
+    NOW = manifest.reference_time
+    print(f"seed: {manifest.seed}, manifest: {args.manifest}")
+
+    conn = open_connection(SESSION)
+    cur = conn.cursor()
+
+    if PARTITIONED:
+        use_partitioned_layout()
+        conn.commit()
+
+    # the definitions go to the manifest before anything is dropped, a crashed
+    # run still knows what to put back
+    deferred = manifest.data.get("deferred")
+    if deferred is None and any(settings.get(key) for key in ("defer_indexes", "defer_foreign_keys", "bare")):
+        deferred = deferrable(conn, settings.get("defer_indexes", False), settings.get("defer_foreign_keys", False),
+                              settings.get("bare", False))
+        manifest.data["deferred"] = deferred
+        manifest.save()
+    if deferred and not manifest.is_done("restore_deferred"):
+        start = time.perf_counter()
+        drop_deferred(conn, deferred)
+        manifest.complete("drop_deferred", seconds=round(time.perf_counter() - start, 3))
+
+    parallel = None
+    if settings["workers"] > 1:
+        from parallel import ParallelSeeder
+        parallel = ParallelSeeder(conn, settings["workers"], manifest, BULK, BATCH_SIZE, PARTITIONED, SESSION,
+                                  CLINICAL, settings.get("value_pools", 0))
+
+    try:
+        for stage, run in seed_stages(manifest.counts, parallel):
+            if manifest.is_done(stage):
+                print(f"{stage}: already done, skipping")
+                continue
+
+            random.seed(manifest.stage_seed(stage))
+            fake.seed_instance(manifest.stage_seed(stage))
+
+            start = time.perf_counter()
+            run()
+            # every stage is its own transaction, a crash loses at most one stage
+            durable_commit(conn)
+            manifest.complete(stage, seconds=round(time.perf_counter() - start, 3))
+            print(f"{stage}: done")
+
+        if deferred and not manifest.is_done("restore_deferred"):
+            pool = Pool(args.pool_size, SESSION)
+            try:
+                start = time.perf_counter()
+                timings = restore_deferred(pool, deferred)
+                manifest.complete("restore_deferred", seconds=round(time.perf_counter() - start, 3), **timings)
+                print(f"restore_deferred: {len(deferred['indexes'])} indexes, "
+                      f"{len(deferred.get('keys', []))} keys, {len(deferred.get('checks', []))} checks, "
+                      f"{len(deferred['foreign_keys'])} foreign keys")
+            finally:
+                pool.close()
+    finally:
+        if parallel:
+            parallel.close()
+        cur.close()
+        conn.close()
+
+    # seconds per phase of this run; resumed stages keep the time of the run that did them
+    print("\nphase                          seconds")
+    for stage, info in manifest.data["stages"].items():
+        if "seconds" in info:
+            print(f"{stage:<30}{info['seconds']:>8.2f}")
+        for phase in ("indexes", "keys", "checks", "foreign_keys"):
+            if phase in info:
+                print(f"  {phase:<28}{info[phase]:>8.2f}")
+
+    print("Database populated with random data.")
@@ -0,0 +1,151 @@
+import multiprocessing
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import main
+from bulk import reserve_ids
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.manifest import from_ranges, to_ranges
+from common.pools import PooledFaker
+
+
+def split(n, shards):
+    base, extra = divmod(n, shards)
+    return [base + (1 if shard < extra else 0) for shard in range(shards)]
+
+
+def partition(items, shards):
+    parts = []
+    start = 0
+    for size in split(len(items), shards):
+        parts.append(items[start:start + size])
+        start += size
+    return parts
+
+
+def expand(kwargs):
+    # id lists are stored in the manifest as [first, last] ranges
+    kwargs = dict(kwargs)
+    if isinstance(kwargs.get("ids"), dict):
+        kwargs["ids"] = {table: from_ranges(ranges) for table, ranges in kwargs["ids"].items()}
+    elif kwargs.get("ids") is not None:
+        kwargs["ids"] = from_ranges(kwargs["ids"])
+    if "user_ids" in kwargs:
+        kwargs["user_ids"] = from_ranges(kwargs["user_ids"])
+    return kwargs
+
+
+def init_worker(bulk, batch_size, now, partitioned, session, clinical, value_pools, seed):
+    main.BULK = bulk
+    main.PARTITIONED = partitioned
+    main.BATCH_SIZE = batch_size
+    main.NOW = now
+    main.SESSION = session
+    main.CLINICAL = clinical
+    if value_pools:
+        main.fake = PooledFaker("pl_PL", seed, value_pools, main.fake)
+    main.conn = main.open_connection(session)
+    main.cur = main.conn.cursor()
+
+
+def run_shard(stage, function, shard, shards, seed, kwargs):
+    shard_seed = f"{seed}:{shard}"
+    random.seed(shard_seed)
+    main.fake.seed_instance(shard_seed)
+
+    main.SHARD = shard
+    main.SHARDS = shards
+    main.registries.clear()
+
+    try:
+        getattr(main, function)(**expand(kwargs))
+        main.durable_commit(main.conn)
+    except Exception:
+        main.conn.rollback()
+        raise
+
+
+class ParallelSeeder:
+    def __init__(self, conn, workers, manifest, bulk, batch_size, partitioned=False, session=None, clinical="rows",
+                 value_pools=0):
+        self.conn = conn
+        self.workers = workers
+        self.manifest = manifest
+        self.bulk = bulk
+        # spawn instead of fork, an inherited libpq socket must never be shared
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(bulk, batch_size, manifest.reference_time, partitioned, session or {}, clinical,
+                      value_pools, manifest.seed)
+        )
+
+    def run(self, stage, function, build_plan):
+        # the plan (shard arguments with their reserved ids) is saved before any
+        # shard starts, a resumed run only repeats the shards that never committed
+        plan = self.manifest.plan(stage)
+        if plan is None:
+            plan = build_plan()
+            self.manifest.save_plan(stage, plan)
+
+        # workers only see committed rows
+        self.conn.commit()
+
+        futures = {
+            self.executor.submit(run_shard, stage, function, shard, len(plan),
+                                 self.manifest.stage_seed(stage), kwargs): shard
+            for shard, kwargs in enumerate(plan)
+            if not self.manifest.is_shard_done(stage, shard)
+        }
+        for future in as_completed(futures):
+            future.result()
+            self.manifest.complete_shard(stage, futures[future])
+
+    def insert_users(self, n, stage="users"):
+        def build_plan():
+            with self.conn.cursor() as cur:
+                ids = reserve_ids(cur, "users", n)
+            return [{"n": len(part), "ids": to_ranges(part)} for part in partition(ids, self.workers)]
+
+        self.run(stage, "insert_users", build_plan)
+
+    def insert_donors(self, n, stage="donors"):
+        def build_plan():
+            with self.conn.cursor() as cur:
+                cur.execute('SELECT id FROM "users" ORDER BY id')
+                user_ids = [user[0] for user in cur.fetchall()]
+                user_ids = random.sample(user_ids, min(n, len(user_ids)))
+                ids = reserve_ids(cur, "donors", len(user_ids))
+            return [
+                {"n": len(users), "user_ids": to_ranges(users), "ids": to_ranges(part)}
+                for users, part in zip(partition(user_ids, self.workers), partition(ids, self.workers))
+            ]
+
+        self.run(stage, "insert_donors", build_plan)
+
+    def insert_donations_and_examinations(self, n, rounds, stage="donations"):
+        def build_plan():
+            plan = []
+            with self.conn.cursor() as cur:
+                cur.execute('SELECT count(*) FROM "donors"')
+                per_round = min(n, cur.fetchone()[0])
+                for shard_rounds in split(rounds, self.workers):
+                    ids = None
+                    if self.bulk:
+                        # reserved here, in shard order, so that the ids do not depend
+                        # on how the workers happen to interleave
+                        ids = {
+                            table: to_ranges(reserve_ids(cur, table, shard_rounds * per_round))
+                            for table in main.DONATION_CHAIN_TABLES
+                        }
+                    plan.append({"n": n, "rounds": shard_rounds, "ids": ids})
+            return plan
+
+        self.run(stage, "insert_donations_and_examinations", build_plan)
+
+    def close(self):
+        self.executor.shutdown()
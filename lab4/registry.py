@@ -0,0 +1,43 @@
+from itertools import count
+from zlib import crc32
+
+_cursor_names = count()
+
+
+class UniqueRegistry:
+    def __init__(self, values=(), shard=0, shards=1):
+        self.values = set(values)
+        self.shard = shard
+        self.shards = shards
+
+    @classmethod
+    def load(cls, conn, table, *columns, shard=0, shards=1):
+        # server-side cursor so that preloading a large table streams
+        with conn.cursor(name=f"registry_{next(_cursor_names)}") as cur:
+            cur.itersize = 50000
+            cur.execute('SELECT {} FROM "{}"'.format(", ".join(f'"{c}"' for c in columns), table))
+            if len(columns) == 1:
+                return cls((row[0] for row in cur), shard, shards)
+            return cls((tuple(row) for row in cur), shard, shards)
+
+    def __contains__(self, value):
+        return value in self.values
+
+    def __len__(self):
+        return len(self.values)
+
+    def owns(self, value):
+        # parallel workers split the key space by hash, so two shards can
+        # never claim the same new value without talking to each other
+        return self.shards == 1 or crc32(str(value).encode()) % self.shards == self.shard
+
+    def add(self, value):
+        if value in self.values or not self.owns(value):
+            return False
+        self.values.add(value)
+        return True
+
+    def unique(self, value, retry):
+        while not self.add(value):
+            value = retry(value)
+        return value
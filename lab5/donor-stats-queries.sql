@@ -0,0 +1,44 @@
+-- zapytania z queries.sql przepisane na donor_stats (wymaga donor-stats.sql)
+
+-- zlicza donorow i ich donacje
+SELECT donor_id AS id,
+       first_name,
+       last_name,
+       donation_count
+FROM donor_stats
+WHERE donation_count > 0
+ORDER BY donation_count DESC;
+
+-- lista donorow ktorzy moga znowu oddac krew
+SELECT donor_id           AS id,
+       first_name,
+       last_name,
+       last_donation_date
+FROM donor_stats
+WHERE last_donation_date <= CURRENT_DATE - INTERVAL '1 months'
+ORDER BY last_donation_date;
+
+-- Pobiera dawców, którzy oddali krew więcej niż 5 razy w ciągu ostatniego roku, z imieniem użytkownika
+SELECT donor_stats.first_name,
+       donor_stats.last_name,
+       donors.*,
+       donor_stats.donations_last_year AS donation_count
+FROM donor_stats
+         JOIN donors ON donors.id = donor_stats.donor_id
+WHERE donor_stats.donations_last_year > 5
+ORDER BY donation_count DESC;
+
+-- Donorzy z certyfikatem i ilością oddanej krwi
+SELECT donor_stats.donor_id AS id,
+       donor_stats.first_name,
+       donor_stats.last_name,
+       certificates.level,
+       certificates.acquisition_date,
+       donor_stats.donated_blood_ml
+FROM donor_stats
+         JOIN certificates ON certificates.fk_donor_id = donor_stats.donor_id
+ORDER BY certificates.level;
+
+-- Średnia ilość donacji na dawcę
+SELECT AVG(donation_count) AS avg_donations_per_donor
+FROM donor_stats;
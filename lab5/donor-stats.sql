@@ -0,0 +1,40 @@
+-- statystyki dawcow liczone raz i odswiezane przez donor_stats.py zamiast przy kazdym raporcie
+-- donations_last_year jest liczone wzgledem dnia odswiezenia, stad limit nieaktualnosci w donor_stats.py
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS "donor_stats" AS
+SELECT donors.id                                                                          AS donor_id,
+       users.first_name,
+       users.last_name,
+       COUNT(donations.id)                                                                AS donation_count,
+       MAX(donations.date)                                                                AS last_donation_date,
+       COUNT(donations.id) FILTER (WHERE donations.date >= CURRENT_DATE - INTERVAL '1 year') AS donations_last_year,
+       COALESCE(SUM(bags.volume), 0)                                                      AS donated_blood_ml
+FROM donors
+         JOIN users ON donors.fk_user_id = users.id
+         LEFT JOIN donations ON donations.fk_donor_id = donors.id
+         LEFT JOIN (SELECT fk_donation_id, SUM(volume) AS volume
+                    FROM blood_bags
+                    GROUP BY fk_donation_id) bags ON bags.fk_donation_id = donations.id
+GROUP BY donors.id, users.first_name, users.last_name;
+
+-- REFRESH ... CONCURRENTLY wymaga unikalnego indeksu
+CREATE UNIQUE INDEX IF NOT EXISTS idx_donor_stats_donor_id ON donor_stats (donor_id);
+CREATE INDEX IF NOT EXISTS idx_donor_stats_last_donation_date ON donor_stats (last_donation_date);
+
+-- kiedy widoki zmaterializowane byly ostatnio odswiezone
+CREATE TABLE IF NOT EXISTS "matview_refreshes" (
+	"name" TEXT NOT NULL,
+	"refreshed_at" TIMESTAMPTZ NOT NULL,
+	"duration" INTERVAL NOT NULL,
+	PRIMARY KEY("name")
+);
+
+INSERT INTO "matview_refreshes" (name, refreshed_at, duration)
+VALUES ('donor_stats', now(), INTERVAL '0')
+ON CONFLICT (name) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION donor_stats_staleness()
+RETURNS INTERVAL
+LANGUAGE sql STABLE AS $$
+	SELECT now() - refreshed_at FROM matview_refreshes WHERE name = 'donor_stats'
+$$;
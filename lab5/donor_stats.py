@@ -0,0 +1,105 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.db import connect
+
+DONOR_STATS_SQL = Path(__file__).resolve().parent / "donor-stats.sql"
+
+# any constant shared by all schedulers, keeps two of them from refreshing at once
+REFRESH_LOCK = 5170
+
+
+def install(conn):
+    with conn.cursor() as cur:
+        cur.execute(DONOR_STATS_SQL.read_text(encoding="utf-8"))
+    conn.commit()
+    print("donor_stats installed")
+
+
+def staleness(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXTRACT(EPOCH FROM donor_stats_staleness())")
+        seconds = cur.fetchone()[0]
+    conn.commit()
+    return float(seconds) if seconds is not None else None
+
+
+def refresh(conn):
+    # CONCURRENTLY keeps the view readable while it is rebuilt
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (REFRESH_LOCK,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            print("another refresh is running, skipped")
+            return False
+        start = time.perf_counter()
+        cur.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY "donor_stats"')
+        seconds = time.perf_counter() - start
+        cur.execute("""
+            INSERT INTO "matview_refreshes" (name, refreshed_at, duration)
+            VALUES ('donor_stats', now(), make_interval(secs => %s))
+            ON CONFLICT (name) DO UPDATE
+            SET refreshed_at = EXCLUDED.refreshed_at, duration = EXCLUDED.duration
+        """, (seconds,))
+    conn.commit()
+    print(f"donor_stats refreshed in {seconds:.2f}s")
+    return True
+
+
+def status(conn, max_staleness):
+    age = staleness(conn)
+    if age is None:
+        print("donor_stats was never refreshed")
+        return False
+    print(f"donor_stats is {age:.0f}s old, bound {max_staleness:.0f}s")
+    return age <= max_staleness
+
+
+def schedule(conn, interval, max_staleness):
+    # refreshes every interval seconds counted from the last refresh (also one made
+    # by another scheduler) and warns once the view gets older than the bound
+    while True:
+        age = staleness(conn)
+        if age is None or age >= interval:
+            refresh(conn)
+            age = staleness(conn) or 0.0
+        if age > max_staleness:
+            print(f"warning: donor_stats is {age:.0f}s old, over the {max_staleness:.0f}s bound", file=sys.stderr)
+        time.sleep(max(interval - age, 1.0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Refresh the donor_stats materialized view.")
+    parser.add_argument("command", choices=["install", "refresh", "run", "status"],
+                        help="install: create the view, "
+                             "refresh: refresh it once, "
+                             "run: keep refreshing it every --interval seconds, "
+                             "status: fail when it is older than --max-staleness")
+    parser.add_argument("--interval", type=float, default=300, help="seconds between refreshes")
+    parser.add_argument("--max-staleness", type=float, default=900,
+                        help="seconds the view may lag behind the tables before it is reported as stale")
+    args = parser.parse_args()
+
+    if args.max_staleness < args.interval:
+        parser.error("--max-staleness must not be shorter than --interval")
+
+    conn = connect()
+    ok = True
+    try:
+        if args.command == "install":
+            install(conn)
+        elif args.command == "refresh":
+            refresh(conn)
+        elif args.command == "run":
+            schedule(conn, args.interval, args.max_staleness)
+        else:
+            ok = status(conn, args.max_staleness)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+    sys.exit(0 if ok else 1)
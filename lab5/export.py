@@ -0,0 +1,257 @@
+import argparse
+import csv
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.db import connect
+
+# the per-donor reports of queries.sql, driven by one keyset page of donors
+# at a time ("page" holds the ids) and ordered by donor id, so that the last
+# id of a page is where the next one starts
+PAGE = 'SELECT id FROM "donors" WHERE id > %(after)s ORDER BY id LIMIT %(limit)s'
+
+REPORTS = {
+    # zlicza donorow i ich donacje
+    "donor_donations": """
+        WITH page AS ({page})
+        SELECT donors.id,
+               users.first_name,
+               users.last_name,
+               COUNT(donations.id) AS donation_count
+        FROM page
+                 JOIN donors ON donors.id = page.id
+                 JOIN users ON donors.fk_user_id = users.id
+                 JOIN donations ON donations.fk_donor_id = donors.id
+        GROUP BY donors.id, users.first_name, users.last_name
+        ORDER BY donors.id
+    """,
+    # lista donorow ktorzy moga znowu oddac krew
+    "eligible_donors": """
+        WITH page AS ({page})
+        SELECT donors.id,
+               users.first_name,
+               users.last_name,
+               MAX(donations.date) AS last_donation_date
+        FROM page
+                 JOIN donors ON donors.id = page.id
+                 JOIN users ON donors.fk_user_id = users.id
+                 JOIN donations ON donations.fk_donor_id = donors.id
+        GROUP BY donors.id, users.first_name, users.last_name
+        HAVING MAX(donations.date) <= CURRENT_DATE - INTERVAL '1 months'
+        ORDER BY donors.id
+    """,
+    # dawcy, ktorzy oddali krew wiecej niz 5 razy w ciagu ostatniego roku
+    "frequent_donors": """
+        WITH page AS ({page})
+        SELECT donors.id,
+               users.first_name,
+               users.last_name,
+               COUNT(donations.id) AS donation_count
+        FROM page
+                 JOIN donors ON donors.id = page.id
+                 JOIN users ON donors.fk_user_id = users.id
+                 JOIN donations ON donations.fk_donor_id = donors.id
+        WHERE donations.date >= CURRENT_DATE - INTERVAL '1 year'
+        GROUP BY donors.id, users.first_name, users.last_name
+        HAVING COUNT(donations.id) > 5
+        ORDER BY donors.id
+    """,
+    # donorzy z certyfikatem i iloscia oddanej krwi
+    "certified_donors": """
+        WITH page AS ({page})
+        SELECT donors.id,
+               users.first_name,
+               users.last_name,
+               certificates.level,
+               certificates.acquisition_date,
+               COALESCE(SUM(blood_bags.volume), 0) AS donated_blood_ml
+        FROM page
+                 JOIN donors ON donors.id = page.id
+                 JOIN users ON donors.fk_user_id = users.id
+                 JOIN certificates ON certificates.fk_donor_id = donors.id
+                 LEFT JOIN donations ON donations.fk_donor_id = donors.id
+                 LEFT JOIN blood_bags ON blood_bags.fk_donation_id = donations.id
+        GROUP BY donors.id, users.first_name, users.last_name, certificates.level, certificates.acquisition_date
+        ORDER BY donors.id, certificates.level
+    """,
+}
+
+
+def open_output(path, append=False):
+    # a resumed export appends, gzip then starts a new member, which gzip
+    # readers simply concatenate
+    if path == "-":
+        return sys.stdout
+    if path.endswith(".gz"):
+        return gzip.open(path, "at" if append else "wt", encoding="utf-8", newline="")
+    return open(path, "a" if append else "w", encoding="utf-8", newline="")
+
+
+def has_data(path):
+    return path != "-" and Path(path).exists() and Path(path).stat().st_size > 0
+
+
+class CsvWriter:
+    def __init__(self, path, columns, append=False):
+        # the header is already in a file that is resumed
+        header = not (append and has_data(path))
+        self.file = open_output(path, append)
+        self.writer = csv.writer(self.file)
+        if header:
+            self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class NdjsonWriter:
+    def __init__(self, path, columns, append=False):
+        self.file = open_output(path, append)
+        self.columns = columns
+
+    def write(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(dict(zip(self.columns, row)), default=str, ensure_ascii=False))
+            self.file.write("\n")
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class ParquetWriter:
+    # one row group per page, the schema is taken from the first page; a
+    # parquet file cannot be appended to, a resumed export goes to a new one
+    def __init__(self, path, columns, append=False):
+        if append and has_data(path):
+            raise SystemExit(f"{path} cannot be appended to, resume the parquet export into a new file")
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("parquet export needs pyarrow: pip install pyarrow")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.columns = columns
+        self.writer = None
+
+    def write(self, rows):
+        if not rows:
+            return
+        data = {column: [row[i] for row in rows] for i, column in enumerate(self.columns)}
+        if self.writer is None:
+            table = self.pa.table(data)
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = self.pa.table(data, schema=self.writer.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {"csv": CsvWriter, "ndjson": NdjsonWriter, "parquet": ParquetWriter}
+
+
+def estimated_donors(conn):
+    # planner estimate, a count(*) would scan the whole table before the export starts
+    with conn.cursor() as cur:
+        cur.execute("SELECT reltuples::BIGINT FROM pg_class WHERE oid = to_regclass('donors')")
+        return max(cur.fetchone()[0], 0)
+
+
+def export(conn, report, writer_class, path, page_size=10000, fetch_size=2000, after=0, snapshot=False,
+           append=False):
+    sql = REPORTS[report].format(page=PAGE)
+    # one read-only snapshot for the whole export, otherwise every page is its
+    # own short transaction and never holds back vacuum; set before any query,
+    # psycopg2 refuses it inside a transaction
+    conn.set_session(isolation_level="REPEATABLE READ" if snapshot else "DEFAULT", readonly=True)
+    total = estimated_donors(conn)
+
+    writer = None
+    pages = 0
+    rows_written = 0
+    finished = False
+    start = time.perf_counter()
+    try:
+        while True:
+            # donors in a page without any row in the report still move the key on
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT max(id) FROM ({PAGE}) page", {"after": after, "limit": page_size})
+                last_donor = cur.fetchone()[0]
+            if last_donor is None:
+                break
+
+            # a page is written only once it is read completely, so the file
+            # always ends at a page boundary and --after resumes without gaps
+            # or duplicates
+            page_rows = []
+            with conn.cursor(name=f"export_{pages}") as cur:
+                cur.itersize = fetch_size
+                cur.execute(sql, {"after": after, "limit": page_size})
+                while True:
+                    rows = cur.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    page_rows.extend(rows)
+                if writer is None:
+                    writer = writer_class(path, [column.name for column in cur.description], append)
+            writer.write(page_rows)
+            rows_written += len(page_rows)
+            if not snapshot:
+                conn.commit()
+
+            after = last_donor
+            pages += 1
+            elapsed = time.perf_counter() - start
+            done = min(pages * page_size, total) if total else pages * page_size
+            print(f"page {pages}: donors up to id {after}, rows {rows_written}, "
+                  f"{done / elapsed if elapsed else 0:.0f} donors/s"
+                  + (f", ~{100 * done / total:.0f}%" if total else ""), file=sys.stderr)
+        conn.commit()
+        finished = True
+    finally:
+        if writer is not None:
+            writer.close()
+        # after is the last donor of the last page in the file
+        print(f"{report}: {rows_written} rows in {pages} pages, {time.perf_counter() - start:.1f}s"
+              + ("" if finished else f", interrupted, resume with --after {after}"), file=sys.stderr)
+    return rows_written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stream a per-donor report to a file page by page.")
+    parser.add_argument("report", choices=list(REPORTS))
+    parser.add_argument("output", help="output file, '-' for stdout (csv and ndjson), .gz compresses")
+    parser.add_argument("--format", choices=list(WRITERS), default=None,
+                        help="output format, taken from the file extension when omitted")
+    parser.add_argument("--page-size", type=int, default=10000, help="donors per keyset page")
+    parser.add_argument("--fetch-size", type=int, default=2000, help="rows fetched from the server cursor at once")
+    parser.add_argument("--after", type=int, default=0,
+                        help="start after this donor id and append to the output, to resume an export")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="export from a single consistent snapshot (one long read-only transaction)")
+    args = parser.parse_args()
+
+    output_format = args.format
+    if output_format is None:
+        suffixes = [suffix.lstrip(".") for suffix in Path(args.output).suffixes if suffix != ".gz"]
+        output_format = suffixes[-1] if suffixes and suffixes[-1] in WRITERS else "csv"
+
+    conn = connect()
+    try:
+        export(conn, args.report, WRITERS[output_format], args.output,
+               args.page_size, args.fetch_size, args.after, args.snapshot, append=args.after > 0)
+    finally:
+        conn.close()
@@ -0,0 +1,19 @@
+-- zapytania z queries.sql przepisane na blood_inventory (wymaga inventory.sql)
+
+-- zlicza dostepne torebki pogrupowane grupa krwi
+SELECT blood_type::text || blood_rh::text AS blood_group,
+       SUM(available_bags)                AS avaiable_bags
+FROM blood_inventory
+GROUP BY blood_type, blood_rh
+ORDER BY avaiable_bags;
+
+-- Statystyki dla placówek - liczba donacji, ilość zakwalifikowanych donacji i liczba dostępnych worków z krwią
+SELECT facilities.id                                  AS facility_id,
+       facilities.name                                AS facility_name,
+       COALESCE(SUM(blood_inventory.total_bags), 0)     AS total_donations,
+       COALESCE(SUM(blood_inventory.qualified_bags), 0) AS qualified_donations,
+       COALESCE(SUM(blood_inventory.available_bags), 0) AS available_blood_bags
+FROM facilities
+         LEFT JOIN blood_inventory ON blood_inventory.fk_facility_id = facilities.id
+GROUP BY facilities.id, facilities.name
+ORDER BY available_blood_bags DESC;
@@ -0,0 +1,70 @@
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.db import connect
+
+INVENTORY_SQL = Path(__file__).resolve().parent / "inventory.sql"
+
+
+def install(cur):
+    cur.execute(INVENTORY_SQL.read_text(encoding="utf-8"))
+    cur.execute("SELECT blood_inventory_rebuild()")
+    print(f"inventory installed, groups: {cur.fetchone()[0]}")
+
+
+def rebuild(cur):
+    cur.execute("SELECT blood_inventory_rebuild()")
+    print(f"inventory rebuilt, groups: {cur.fetchone()[0]}")
+
+
+def verify(cur):
+    cur.execute("SELECT * FROM blood_inventory_verify()")
+    mismatches = cur.fetchall()
+    for facility_id, blood_type, blood_rh, column, stored, expected in mismatches:
+        print(f"facility {facility_id} {blood_type}{blood_rh} {column}: stored {stored}, expected {expected}")
+    print(f"mismatched counters: {len(mismatches)}")
+    return not mismatches
+
+
+def show(cur):
+    cur.execute("""
+        SELECT blood_type::text || blood_rh::text AS blood_group, SUM(available_bags)
+        FROM blood_inventory
+        GROUP BY blood_type, blood_rh
+        ORDER BY 2
+    """)
+    for blood_group, available in cur.fetchall():
+        print(f"{blood_group:<3} {available}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage the incrementally maintained blood inventory.")
+    parser.add_argument("command", choices=["install", "rebuild", "verify", "show"],
+                        help="install: create the table and triggers and fill it, "
+                             "rebuild: recount everything, "
+                             "verify: compare the counters with the full query, "
+                             "show: available bags per blood group")
+    parser.add_argument("--fix", action="store_true", help="rebuild when verify finds mismatches")
+    args = parser.parse_args()
+
+    conn = connect()
+    ok = True
+    try:
+        with conn.cursor() as cur:
+            if args.command == "install":
+                install(cur)
+            elif args.command == "rebuild":
+                rebuild(cur)
+            elif args.command == "verify":
+                ok = verify(cur)
+                if not ok and args.fix:
+                    rebuild(cur)
+            else:
+                show(cur)
+        conn.commit()
+    finally:
+        conn.close()
+
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,323 @@
+-- stan magazynu krwi utrzymywany przyrostowo przez triggery
+-- (placowka, grupa krwi) -> liczba workow: wszystkich, zakwalifikowanych i dostepnych
+-- fk_facility_id = 0 oznacza worki bez przypisanej placowki
+
+CREATE TABLE IF NOT EXISTS "blood_inventory" (
+	"fk_facility_id" INTEGER NOT NULL,
+	"blood_type" BLOOD_TYPE NOT NULL,
+	"blood_rh" BLOOD_RH NOT NULL,
+	"total_bags" INTEGER NOT NULL DEFAULT 0,
+	"qualified_bags" INTEGER NOT NULL DEFAULT 0,
+	"available_bags" INTEGER NOT NULL DEFAULT 0,
+	PRIMARY KEY("fk_facility_id", "blood_type", "blood_rh")
+);
+
+DO $$
+BEGIN
+	CREATE TYPE inventory_delta AS (
+		fk_facility_id INTEGER,
+		blood_type BLOOD_TYPE,
+		blood_rh BLOOD_RH,
+		total_bags INTEGER,
+		qualified_bags INTEGER,
+		available_bags INTEGER
+	);
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+
+-- wklad jednego worka w magazyn wedlug aktualnego stanu pozostalych tabel
+CREATE OR REPLACE FUNCTION blood_bag_inventory(bag_id INTEGER, donation_id INTEGER, lab_results_id INTEGER, facility_id INTEGER)
+RETURNS SETOF inventory_delta
+LANGUAGE sql STABLE AS $$
+	SELECT COALESCE(facility_id, 0),
+	       (donors.blood_info).blood_type,
+	       (donors.blood_info).blood_rh,
+	       1,
+	       (lab_results.is_qualified IS TRUE)::INTEGER,
+	       (lab_results.is_qualified IS TRUE
+	            AND NOT EXISTS (SELECT 1 FROM blood_bags_orders WHERE blood_bags_orders.fk_blood_bag_id = bag_id))::INTEGER
+	FROM donations
+	         JOIN donors ON donations.fk_donor_id = donors.id
+	         LEFT JOIN lab_results ON lab_results.id = lab_results_id
+	WHERE donations.id = donation_id
+$$;
+
+
+-- dodaje zmiany do licznikow, grupy blokowane zawsze w tej samej kolejnosci
+CREATE OR REPLACE FUNCTION inventory_apply(deltas inventory_delta[])
+RETURNS VOID
+LANGUAGE sql AS $$
+	INSERT INTO blood_inventory AS inventory (fk_facility_id, blood_type, blood_rh, total_bags, qualified_bags, available_bags)
+	SELECT fk_facility_id, blood_type, blood_rh, SUM(total_bags), SUM(qualified_bags), SUM(available_bags)
+	FROM unnest(deltas)
+	GROUP BY fk_facility_id, blood_type, blood_rh
+	HAVING SUM(total_bags) <> 0 OR SUM(qualified_bags) <> 0 OR SUM(available_bags) <> 0
+	ORDER BY fk_facility_id, blood_type, blood_rh
+	ON CONFLICT (fk_facility_id, blood_type, blood_rh) DO UPDATE
+	SET total_bags = inventory.total_bags + EXCLUDED.total_bags,
+	    qualified_bags = inventory.qualified_bags + EXCLUDED.qualified_bags,
+	    available_bags = inventory.available_bags + EXCLUDED.available_bags
+$$;
+
+
+CREATE OR REPLACE FUNCTION blood_bags_inventory_insert()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+	PERFORM inventory_apply(ARRAY(
+		SELECT delta
+		FROM new_bags, blood_bag_inventory(new_bags.id, new_bags.fk_donation_id, new_bags.fk_lab_results_id, new_bags.fk_facility_id) delta
+	));
+	RETURN NULL;
+END $$;
+
+-- blood_bags_orders blokuje usuniecie zamowionego worka, wiec usuwany worek nie ma zamowien
+CREATE OR REPLACE FUNCTION blood_bags_inventory_delete()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+	PERFORM inventory_apply(ARRAY(
+		SELECT ROW(delta.fk_facility_id, delta.blood_type, delta.blood_rh,
+		           -delta.total_bags, -delta.qualified_bags, -delta.available_bags)::inventory_delta
+		FROM old_bags, blood_bag_inventory(old_bags.id, old_bags.fk_donation_id, old_bags.fk_lab_results_id, old_bags.fk_facility_id) delta
+	));
+	RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION blood_bags_inventory_update()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+	PERFORM inventory_apply(ARRAY(
+		SELECT ROW(delta.fk_facility_id, delta.blood_type, delta.blood_rh,
+		           -delta.total_bags, -delta.qualified_bags, -delta.available_bags)::inventory_delta
+		FROM old_bags, blood_bag_inventory(old_bags.id, old_bags.fk_donation_id, old_bags.fk_lab_results_id, old_bags.fk_facility_id) delta
+		UNION ALL
+		SELECT delta
+		FROM new_bags, blood_bag_inventory(new_bags.id, new_bags.fk_donation_id, new_bags.fk_lab_results_id, new_bags.fk_facility_id) delta
+	));
+	RETURN NULL;
+END $$;
+
+
+-- zmiana kwalifikacji przesuwa worki miedzy zakwalifikowanymi a niezakwalifikowanymi
+CREATE OR REPLACE FUNCTION lab_results_inventory_update()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+	PERFORM inventory_apply(ARRAY(
+		SELECT ROW(COALESCE(blood_bags.fk_facility_id, 0),
+		           (donors.blood_info).blood_type,
+		           (donors.blood_info).blood_rh,
+		           0,
+		           CASE WHEN new_results.is_qualified THEN 1 ELSE -1 END,
+		           CASE WHEN NOT EXISTS (SELECT 1 FROM blood_bags_orders WHERE blood_bags_orders.fk_blood_bag_id = blood_bags.id)
+		                THEN CASE WHEN new_results.is_qualified THEN 1 ELSE -1 END
+		                ELSE 0 END)::inventory_delta
+		FROM old_results
+		         JOIN new_results ON new_results.id = old_results.id
+		         JOIN blood_bags ON blood_bags.fk_lab_results_id = new_results.id
+		         JOIN donations ON blood_bags.fk_donation_id = donations.id
+		         JOIN donors ON donations.fk_donor_id = donors.id
+		WHERE old_results.is_qualified IS DISTINCT FROM new_results.is_qualified
+	));
+	RETURN NULL;
+END $$;
+
+-- wiersz po wierszu i przed usunieciem: kaskadowe SET NULL na blood_bags
+-- widzi juz usuniety wynik i nie potrafi odjac jego kwalifikacji
+CREATE OR REPLACE FUNCTION lab_results_inventory_delete()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+	IF OLD.is_qualified THEN
+		PERFORM inventory_apply(ARRAY(
+			SELECT ROW(delta.fk_facility_id, delta.blood_type, delta.blood_rh,
+			           0, -delta.qualified_bags, -delta.available_bags)::inventory_delta
+			FROM blood_bags, blood_bag_inventory(blood_bags.id, blood_bags.fk_donation_id, blood_bags.fk_lab_results_id, blood_bags.fk_facility_id) delta
+			WHERE blood_bags.fk_lab_results_id = OLD.id
+		));
+	END IF;
+	RETURN OLD;
+END $$;
+
+
+-- worek jest dostepny dopoki nie ma zadnego zamowienia, liczy sie tylko
+-- przejscie miedzy "bez zamowien" a "z zamowieniami"
+CREATE OR REPLACE FUNCTION blood_bags_orders_inventory_insert()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+	PERFORM inventory_apply(ARRAY(
+		SELECT ROW(delta.fk_facility_id, delta.blood_type, delta.blood_rh,
+		           0, 0, -delta.qualified_bags)::inventory_delta
+		FROM (SELECT DISTINCT fk_blood_bag_id FROM new_links) bags
+		         JOIN blood_bags ON blood_bags.id = bags.fk_blood_bag_id,
+		     blood_bag_inventory(blood_bags.id, blood_bags.fk_donation_id, blood_bags.fk_lab_results_id, blood_bags.fk_facility_id) delta
+		WHERE NOT EXISTS (
+			SELECT 1
+			FROM blood_bags_orders
+			WHERE blood_bags_orders.fk_blood_bag_id = bags.fk_blood_bag_id
+			  AND NOT EXISTS (SELECT 1 FROM new_links
+			                  WHERE new_links.fk_blood_bag_id = blood_bags_orders.fk_blood_bag_id
+			                    AND new_links.fk_order_id = blood_bags_orders.fk_order_id))
+	));
+	RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION blood_bags_orders_inventory_delete()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+	PERFORM inventory_apply(ARRAY(
+		SELECT ROW(delta.fk_facility_id, delta.blood_type, delta.blood_rh,
+		           0, 0, delta.available_bags)::inventory_delta
+		FROM (SELECT DISTINCT fk_blood_bag_id FROM old_links) bags
+		         JOIN blood_bags ON blood_bags.id = bags.fk_blood_bag_id,
+		     blood_bag_inventory(blood_bags.id, blood_bags.fk_donation_id, blood_bags.fk_lab_results_id, blood_bags.fk_facility_id) delta
+	));
+	RETURN NULL;
+END $$;
+
+-- przepiecie zamowienia: dostepnosc zmienia sie tylko dla workow, ktore
+-- przed zmiana mialy zamowienie, a po zmianie nie maja (lub odwrotnie)
+CREATE OR REPLACE FUNCTION blood_bags_orders_inventory_update()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+	PERFORM inventory_apply(ARRAY(
+		SELECT ROW(delta.fk_facility_id, delta.blood_type, delta.blood_rh,
+		           0, 0, CASE WHEN bags.had_orders THEN delta.available_bags ELSE -delta.qualified_bags END)::inventory_delta
+		FROM (SELECT affected.fk_blood_bag_id,
+		             EXISTS (SELECT 1 FROM old_links WHERE old_links.fk_blood_bag_id = affected.fk_blood_bag_id)
+		                 OR EXISTS (SELECT 1
+		                            FROM blood_bags_orders
+		                            WHERE blood_bags_orders.fk_blood_bag_id = affected.fk_blood_bag_id
+		                              AND NOT EXISTS (SELECT 1 FROM new_links
+		                                              WHERE new_links.fk_blood_bag_id = blood_bags_orders.fk_blood_bag_id
+		                                                AND new_links.fk_order_id = blood_bags_orders.fk_order_id)) AS had_orders,
+		             EXISTS (SELECT 1 FROM blood_bags_orders WHERE blood_bags_orders.fk_blood_bag_id = affected.fk_blood_bag_id) AS has_orders
+		      FROM (SELECT fk_blood_bag_id FROM old_links UNION SELECT fk_blood_bag_id FROM new_links) affected) bags
+		         JOIN blood_bags ON blood_bags.id = bags.fk_blood_bag_id,
+		     blood_bag_inventory(blood_bags.id, blood_bags.fk_donation_id, blood_bags.fk_lab_results_id, blood_bags.fk_facility_id) delta
+		WHERE bags.had_orders <> bags.has_orders
+	));
+	RETURN NULL;
+END $$;
+
+
+DROP TRIGGER IF EXISTS "blood_bags_inventory_insert" ON "blood_bags";
+CREATE TRIGGER "blood_bags_inventory_insert" AFTER INSERT ON "blood_bags"
+REFERENCING NEW TABLE AS new_bags
+FOR EACH STATEMENT EXECUTE FUNCTION blood_bags_inventory_insert();
+
+DROP TRIGGER IF EXISTS "blood_bags_inventory_delete" ON "blood_bags";
+CREATE TRIGGER "blood_bags_inventory_delete" AFTER DELETE ON "blood_bags"
+REFERENCING OLD TABLE AS old_bags
+FOR EACH STATEMENT EXECUTE FUNCTION blood_bags_inventory_delete();
+
+DROP TRIGGER IF EXISTS "blood_bags_inventory_update" ON "blood_bags";
+CREATE TRIGGER "blood_bags_inventory_update" AFTER UPDATE ON "blood_bags"
+REFERENCING OLD TABLE AS old_bags NEW TABLE AS new_bags
+FOR EACH STATEMENT EXECUTE FUNCTION blood_bags_inventory_update();
+
+DROP TRIGGER IF EXISTS "lab_results_inventory_update" ON "lab_results";
+CREATE TRIGGER "lab_results_inventory_update" AFTER UPDATE ON "lab_results"
+REFERENCING OLD TABLE AS old_results NEW TABLE AS new_results
+FOR EACH STATEMENT EXECUTE FUNCTION lab_results_inventory_update();
+
+DROP TRIGGER IF EXISTS "lab_results_inventory_delete" ON "lab_results";
+CREATE TRIGGER "lab_results_inventory_delete" BEFORE DELETE ON "lab_results"
+FOR EACH ROW EXECUTE FUNCTION lab_results_inventory_delete();
+
+DROP TRIGGER IF EXISTS "blood_bags_orders_inventory_insert" ON "blood_bags_orders";
+CREATE TRIGGER "blood_bags_orders_inventory_insert" AFTER INSERT ON "blood_bags_orders"
+REFERENCING NEW TABLE AS new_links
+FOR EACH STATEMENT EXECUTE FUNCTION blood_bags_orders_inventory_insert();
+
+DROP TRIGGER IF EXISTS "blood_bags_orders_inventory_delete" ON "blood_bags_orders";
+CREATE TRIGGER "blood_bags_orders_inventory_delete" AFTER DELETE ON "blood_bags_orders"
+REFERENCING OLD TABLE AS old_links
+FOR EACH STATEMENT EXECUTE FUNCTION blood_bags_orders_inventory_delete();
+
+DROP TRIGGER IF EXISTS "blood_bags_orders_inventory_update" ON "blood_bags_orders";
+CREATE TRIGGER "blood_bags_orders_inventory_update" AFTER UPDATE ON "blood_bags_orders"
+REFERENCING OLD TABLE AS old_links NEW TABLE AS new_links
+FOR EACH STATEMENT EXECUTE FUNCTION blood_bags_orders_inventory_update();
+
+
+-- pelne przeliczenie tym samym zapytaniem co w queries.sql
+CREATE OR REPLACE VIEW "blood_inventory_expected" AS
+SELECT COALESCE(blood_bags.fk_facility_id, 0)                              AS fk_facility_id,
+       (donors.blood_info).blood_type                                       AS blood_type,
+       (donors.blood_info).blood_rh                                         AS blood_rh,
+       COUNT(*)::INTEGER                                                    AS total_bags,
+       COUNT(*) FILTER (WHERE lab_results.is_qualified IS TRUE)::INTEGER    AS qualified_bags,
+       COUNT(*) FILTER (WHERE lab_results.is_qualified IS TRUE
+                            AND blood_bags_orders.fk_blood_bag_id IS NULL)::INTEGER AS available_bags
+FROM blood_bags
+         JOIN donations ON blood_bags.fk_donation_id = donations.id
+         JOIN donors ON donations.fk_donor_id = donors.id
+         LEFT JOIN lab_results ON blood_bags.fk_lab_results_id = lab_results.id
+         LEFT JOIN (SELECT DISTINCT fk_blood_bag_id FROM blood_bags_orders) blood_bags_orders
+                   ON blood_bags.id = blood_bags_orders.fk_blood_bag_id
+GROUP BY COALESCE(blood_bags.fk_facility_id, 0), (donors.blood_info).blood_type, (donors.blood_info).blood_rh;
+
+-- grupy, w ktorych liczniki rozjechaly sie z pelnym przeliczeniem
+CREATE OR REPLACE FUNCTION blood_inventory_verify()
+RETURNS TABLE (fk_facility_id INTEGER, blood_type BLOOD_TYPE, blood_rh BLOOD_RH,
+               column_name TEXT, stored INTEGER, expected INTEGER)
+LANGUAGE sql STABLE AS $$
+	SELECT COALESCE(stored.fk_facility_id, expected.fk_facility_id),
+	       COALESCE(stored.blood_type, expected.blood_type),
+	       COALESCE(stored.blood_rh, expected.blood_rh),
+	       counter.name, counter.stored, counter.expected
+	FROM blood_inventory stored
+	         FULL JOIN blood_inventory_expected expected
+	                   ON stored.fk_facility_id = expected.fk_facility_id
+	                       AND stored.blood_type = expected.blood_type
+	                       AND stored.blood_rh = expected.blood_rh,
+	     LATERAL (VALUES ('total_bags', COALESCE(stored.total_bags, 0), COALESCE(expected.total_bags, 0)),
+	                     ('qualified_bags', COALESCE(stored.qualified_bags, 0), COALESCE(expected.qualified_bags, 0)),
+	                     ('available_bags', COALESCE(stored.available_bags, 0), COALESCE(expected.available_bags, 0)))
+	         AS counter(name, stored, expected)
+	WHERE counter.stored <> counter.expected
+	ORDER BY 1, 2, 3, 4
+$$;
+
+-- blokada SHARE ROW EXCLUSIVE wstrzymuje zapisy na czas przeliczenia,
+-- odczyty dzialaja dalej
+CREATE OR REPLACE FUNCTION blood_inventory_rebuild()
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+	group_count INTEGER;
+BEGIN
+	LOCK TABLE blood_bags, lab_results, blood_bags_orders, blood_inventory IN SHARE ROW EXCLUSIVE MODE;
+	DELETE FROM blood_inventory;
+	INSERT INTO blood_inventory (fk_facility_id, blood_type, blood_rh, total_bags, qualified_bags, available_bags)
+	SELECT fk_facility_id, blood_type, blood_rh, total_bags, qualified_bags, available_bags
+	FROM blood_inventory_expected;
+	GET DIAGNOSTICS group_count = ROW_COUNT;
+	RETURN group_count;
+END $$;
+
+
+-- TRUNCATE nie uruchamia triggerow DELETE, a blood_inventory nie ma klucza obcego,
+-- wiec CASCADE go nie obejmuje; bez tego ponowne ladowanie dodaje worki do starych licznikow
+CREATE OR REPLACE FUNCTION blood_inventory_truncate()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+	PERFORM blood_inventory_rebuild();
+	RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS "blood_bags_inventory_truncate" ON "blood_bags";
+CREATE TRIGGER "blood_bags_inventory_truncate" AFTER TRUNCATE ON "blood_bags"
+FOR EACH STATEMENT EXECUTE FUNCTION blood_inventory_truncate();
+
+DROP TRIGGER IF EXISTS "blood_bags_orders_inventory_truncate" ON "blood_bags_orders";
+CREATE TRIGGER "blood_bags_orders_inventory_truncate" AFTER TRUNCATE ON "blood_bags_orders"
+FOR EACH STATEMENT EXECUTE FUNCTION blood_inventory_truncate();
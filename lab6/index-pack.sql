@@ -0,0 +1,33 @@
+-- indeksy na kluczach obcych i indeksy czesciowe dla zapytan z lab5
+-- CONCURRENTLY nie blokuje zapisow, plik trzeba uruchomic poza transakcja (psql -f)
+-- pomiary przed i po: index-pack-report.md (benchmarks/queries.py --scales 1 10)
+
+-- klucze obce uzywane w joinach raportow
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_donations_donor_date ON donations (fk_donor_id) INCLUDE (date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_donations_nurse ON donations (fk_nurse_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_blood_bags_donation ON blood_bags (fk_donation_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_blood_bags_lab_results ON blood_bags (fk_lab_results_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_blood_bags_facility ON blood_bags (fk_facility_id) INCLUDE (fk_lab_results_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_blood_bags_orders_order ON blood_bags_orders (fk_order_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_examinations_donor ON examinations (fk_donor_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_hospital ON orders (fk_hospital_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_transport ON orders (fk_transport_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transports_driver ON transports (fk_driver_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_doctors_user ON doctors (fk_user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_donors_user ON donors (fk_user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_hospitals_user ON hospitals (fk_user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_moderators_user ON moderators (fk_user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_doctors_facilities_facility ON doctors_facilities (fk_facility_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_nurses_facilities_facility ON nurses_facilities (fk_facility_id);
+
+-- lekarze i badania w danym roku: zakres dat zamiast EXTRACT, lekarz w indeksie
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_examinations_date_doctor ON examinations (date) INCLUDE (fk_doctor_id);
+
+-- donacje z ostatniego roku
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_donations_date_donor ON donations (date) INCLUDE (fk_donor_id);
+
+-- tylko zakwalifikowane wyniki, reszta nigdy nie trafia do magazynu
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_lab_results_qualified ON lab_results (id) WHERE is_qualified;
+
+-- pilne zamowienia oczekujace
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_awaiting_urgent ON orders (fk_hospital_id) WHERE state = 'AWAITING' AND is_urgent;
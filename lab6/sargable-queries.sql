@@ -0,0 +1,44 @@
+-- zapytania z lab5 przepisane tak, zeby mogly korzystac z index-pack.sql
+-- komentarze sa takie same jak w lab5/queries.sql, benchmark podmienia zapytania po nich
+
+-- zlicza dostepne torebki pogrupowane grupa krwi
+SELECT (donors.blood_info).blood_type::text || (donors.blood_info).blood_rh::text AS blood_group,
+       COUNT(blood_bags.id)                                                       as avaiable_bags
+FROM blood_bags
+         JOIN lab_results ON blood_bags.fk_lab_results_id = lab_results.id
+         JOIN donations ON blood_bags.fk_donation_id = donations.id
+         JOIN donors ON donations.fk_donor_id = donors.id
+WHERE lab_results.is_qualified
+  AND NOT EXISTS (SELECT 1 FROM blood_bags_orders WHERE blood_bags_orders.fk_blood_bag_id = blood_bags.id)
+GROUP BY (donors.blood_info).blood_type, (donors.blood_info).blood_rh
+ORDER BY avaiable_bags;
+
+-- Pobiera listę lekarzy którzy przeprowadzali badania w 2024 roku i sortuje malejąco po ilości badań
+SELECT doctors.id,
+       users.first_name,
+       users.last_name,
+       COUNT(examinations.id) AS examination_count
+FROM doctors
+         JOIN
+     users ON doctors.fk_user_id = users.id
+         JOIN
+     examinations ON doctors.id = examinations.fk_doctor_id
+WHERE examinations.date >= DATE '2024-01-01'
+  AND examinations.date < DATE '2025-01-01'
+GROUP BY doctors.id, users.first_name, users.last_name
+ORDER BY examination_count DESC;
+
+-- Statystyki dla placówek - liczba donacji, ilość zakwalifikowanych donacji i liczba dostępnych worków z krwią
+SELECT facilities.id                                                AS facility_id,
+       facilities.name                                              AS facility_name,
+       COUNT(blood_bags.id)                                         AS total_donations,
+       COUNT(blood_bags.id) FILTER (WHERE lab_results.is_qualified) AS qualified_donations,
+       COUNT(blood_bags.id) FILTER (WHERE lab_results.is_qualified
+           AND ordered.fk_blood_bag_id IS NULL)                     AS available_blood_bags
+FROM facilities
+         LEFT JOIN blood_bags ON blood_bags.fk_facility_id = facilities.id
+         LEFT JOIN lab_results ON blood_bags.fk_lab_results_id = lab_results.id
+         LEFT JOIN (SELECT DISTINCT fk_blood_bag_id FROM blood_bags_orders) ordered
+                   ON ordered.fk_blood_bag_id = blood_bags.id
+GROUP BY facilities.id, facilities.name
+ORDER BY available_blood_bags DESC;
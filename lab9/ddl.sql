@@ -30,7 +30,7 @@ CREATE TABLE "orders" (
 -- alter existing
 ALTER TABLE "blood_bags"
 ADD COLUMN "fk_realization_id" INTEGER,
-ADD CONSTRAINT "fk_realization_id" FOREIGN KEY ("realization_id") REFERENCES "realizations" ("id") ON DELETE SET NULL;
+ADD CONSTRAINT "fk_realization_id" FOREIGN KEY ("fk_realization_id") REFERENCES "realizations" ("id") ON DELETE SET NULL;
 
 --move data
 INSERT INTO "realizations" ("date", "fk_transport_id")
@@ -48,6 +48,13 @@ FROM "realizations" AS r
 JOIN "orders_arch" AS o
 ON r."date" = o."date" AND r."fk_transport_id" = o."fk_transport_id";
 
+-- worki z zamowien dostaja realizacje zamowienia
+UPDATE "blood_bags"
+SET "fk_realization_id" = ro."fk_realization_id"
+FROM "blood_bags_orders" AS bbo
+JOIN "realization_orders" AS ro ON ro."fk_order_id" = bbo."fk_order_id"
+WHERE bbo."fk_blood_bag_id" = "blood_bags"."id";
+
 -- drop constraints tables
 ALTER TABLE "blood_bags_orders" DROP CONSTRAINT IF EXISTS "blood_bags_orders_fk_order_id_fkey";
 ALTER TABLE "realization_orders" DROP CONSTRAINT IF EXISTS "order_fk";
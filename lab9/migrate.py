@@ -0,0 +1,248 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from psycopg2 import errors
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.db import connect
+
+ONLINE_SQL = Path(__file__).resolve().parent / "online.sql"
+
+COPY_BATCH = """
+    WITH batch AS (
+        SELECT * FROM "orders" WHERE id = ANY(%(ids)s)
+    ), copied AS (
+        INSERT INTO "orders_new" (id, date, state, is_urgent, blood_info, bag_count, fk_hospital_id)
+        SELECT id, date, state, is_urgent, blood_info, bag_count, fk_hospital_id FROM batch
+        ON CONFLICT (id) DO UPDATE
+        SET date = EXCLUDED.date,
+            state = EXCLUDED.state,
+            is_urgent = EXCLUDED.is_urgent,
+            blood_info = EXCLUDED.blood_info,
+            bag_count = EXCLUDED.bag_count,
+            fk_hospital_id = EXCLUDED.fk_hospital_id
+    ), mapping AS (
+        -- realization ids are drawn up front, so each order gets exactly its own realization
+        SELECT batch.id AS order_id, batch.date, batch.fk_transport_id,
+               nextval(pg_get_serial_sequence('"realizations"', 'id')) AS realization_id
+        FROM batch
+        WHERE batch.fk_transport_id IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM "realization_orders" ro WHERE ro.fk_order_id = batch.id)
+    ), realized AS (
+        INSERT INTO "realizations" (id, date, fk_transport_id)
+        SELECT realization_id, date, fk_transport_id FROM mapping
+    )
+    INSERT INTO "realization_orders" (fk_realization_id, fk_order_id)
+    SELECT realization_id, order_id FROM mapping
+"""
+
+REFRESH_BAGS = """
+    SELECT migration_refresh_bags(ARRAY(
+        SELECT DISTINCT fk_blood_bag_id FROM "blood_bags_orders" WHERE fk_order_id = ANY(%(ids)s)))
+"""
+
+MISMATCHED_ORDERS = """
+    SELECT o.id
+    FROM "orders" o
+    LEFT JOIN "orders_new" n ON n.id = o.id
+    LEFT JOIN "realization_orders" ro ON ro.fk_order_id = o.id
+    LEFT JOIN "realizations" r ON r.id = ro.fk_realization_id
+    WHERE n.id IS NULL
+        OR (n.date, n.state, n.is_urgent, n.blood_info, n.bag_count, n.fk_hospital_id)
+            IS DISTINCT FROM (o.date, o.state, o.is_urgent, o.blood_info, o.bag_count, o.fk_hospital_id)
+        OR (o.fk_transport_id IS NULL) <> (r.id IS NULL)
+        OR (r.date, r.fk_transport_id) IS DISTINCT FROM (o.date, o.fk_transport_id) AND r.id IS NOT NULL
+    UNION
+    SELECT n.id FROM "orders_new" n WHERE NOT EXISTS (SELECT 1 FROM "orders" o WHERE o.id = n.id)
+"""
+
+MISMATCHED_BAGS = """
+    SELECT bb.id
+    FROM "blood_bags" bb
+    LEFT JOIN (
+        SELECT DISTINCT ON (bbo.fk_blood_bag_id) bbo.fk_blood_bag_id, ro.fk_realization_id
+        FROM "blood_bags_orders" bbo
+        JOIN "realization_orders" ro ON ro.fk_order_id = bbo.fk_order_id
+        ORDER BY bbo.fk_blood_bag_id, bbo.fk_order_id DESC
+    ) expected ON expected.fk_blood_bag_id = bb.id
+    WHERE bb.fk_realization_id IS DISTINCT FROM expected.fk_realization_id
+"""
+
+
+class Migration:
+    def __init__(self, conn, batch_size=5000, pause=0.0, progress_every=10):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.pause = pause
+        self.progress_every = progress_every
+        self.report = {"batch_size": batch_size, "phases": {}}
+
+    def phase(self, name, fn):
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        self.report["phases"][name] = round(seconds, 3)
+        print(f"{name}: {seconds:.2f}s")
+        return result
+
+    def prepare(self):
+        with self.conn.cursor() as cur:
+            cur.execute(ONLINE_SQL.read_text(encoding="utf-8"))
+        self.conn.commit()
+
+    def backfill(self):
+        # keyset batches on orders.id, each in its own short transaction; the
+        # batch rows are locked first, so the dual-write trigger and the copy
+        # never work on the same order at the same time
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT count(*) FROM "orders"')
+            total = cur.fetchone()[0]
+        self.conn.commit()
+
+        last_id = 0
+        done = 0
+        batches = 0
+        slowest = 0.0
+        start = time.perf_counter()
+        while True:
+            batch_start = time.perf_counter()
+            with self.conn.cursor() as cur:
+                cur.execute('SELECT id FROM "orders" WHERE id > %s ORDER BY id LIMIT %s FOR UPDATE',
+                            (last_id, self.batch_size))
+                ids = [row[0] for row in cur.fetchall()]
+                if not ids:
+                    self.conn.commit()
+                    break
+                cur.execute(COPY_BATCH, {"ids": ids})
+                cur.execute(REFRESH_BAGS, {"ids": ids})
+            self.conn.commit()
+
+            last_id = ids[-1]
+            done += len(ids)
+            batches += 1
+            slowest = max(slowest, time.perf_counter() - batch_start)
+            if batches % self.progress_every == 0:
+                elapsed = time.perf_counter() - start
+                rate = done / elapsed if elapsed else 0
+                remaining = max(total - done, 0) / rate if rate else 0
+                print(f"orders {done}/{total} ({100 * done / max(total, 1):.0f}%), "
+                      f"{rate:.0f} rows/s, eta {remaining:.0f}s")
+            if self.pause:
+                time.sleep(self.pause)
+
+        self.report["orders"] = done
+        self.report["batches"] = batches
+        self.report["slowest_batch_seconds"] = round(slowest, 3)
+
+        # SHARE UPDATE EXCLUSIVE, writers keep going while the key is checked
+        with self.conn.cursor() as cur:
+            cur.execute('ALTER TABLE "blood_bags" VALIDATE CONSTRAINT "fk_realization_id"')
+        self.conn.commit()
+
+    def verify(self, repair=True):
+        with self.conn.cursor() as cur:
+            cur.execute(MISMATCHED_ORDERS)
+            order_ids = [row[0] for row in cur.fetchall()]
+            cur.execute(MISMATCHED_BAGS)
+            bag_ids = [row[0] for row in cur.fetchall()]
+            print(f"mismatched orders: {len(order_ids)}, mismatched blood bags: {len(bag_ids)}")
+
+            if repair and (order_ids or bag_ids):
+                # orders deleted without the trigger having seen them
+                cur.execute("""
+                    DELETE FROM "realizations"
+                    WHERE id IN (SELECT ro.fk_realization_id
+                                 FROM "realization_orders" ro
+                                 WHERE ro.fk_order_id = ANY(%s)
+                                     AND NOT EXISTS (SELECT 1 FROM "orders" o WHERE o.id = ro.fk_order_id))
+                """, (order_ids,))
+                cur.execute("""
+                    DELETE FROM "orders_new" n
+                    WHERE n.id = ANY(%s) AND NOT EXISTS (SELECT 1 FROM "orders" o WHERE o.id = n.id)
+                """, (order_ids,))
+                cur.execute('SELECT migration_copy_order(o) FROM "orders" o WHERE o.id = ANY(%s)', (order_ids,))
+                cur.execute("SELECT migration_refresh_bags(%s)", (bag_ids,))
+        self.conn.commit()
+        return not order_ids and not bag_ids
+
+    def cutover(self, lock_timeout="2s", attempts=10):
+        # the only step that blocks writers: drop the triggers and swap names,
+        # gives up quickly instead of queueing behind long transactions
+        for attempt in range(1, attempts + 1):
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+                    cur.execute('LOCK TABLE "orders", "blood_bags_orders", "orders_new" IN ACCESS EXCLUSIVE MODE')
+                    locked = time.perf_counter()
+                    cur.execute('DROP TRIGGER "migration_orders_sync" ON "orders"')
+                    cur.execute('DROP TRIGGER "migration_blood_bags_orders_sync" ON "blood_bags_orders"')
+                    cur.execute("""
+                        SELECT nextval(pg_get_serial_sequence('"orders"', 'id')),
+                               pg_get_serial_sequence('"orders"', 'id'),
+                               pg_get_serial_sequence('"orders_new"', 'id')
+                    """)
+                    next_id, old_sequence, new_sequence = cur.fetchone()
+                    cur.execute('ALTER TABLE "orders" RENAME TO "orders_arch"')
+                    cur.execute(f'ALTER SEQUENCE {old_sequence} RENAME TO "orders_arch_id_seq"')
+                    cur.execute('ALTER TABLE "orders_new" RENAME TO "orders"')
+                    cur.execute(f'ALTER SEQUENCE {new_sequence} RENAME TO "orders_id_seq"')
+                    cur.execute("SELECT setval('\"orders_id_seq\"', %s, false)", (next_id,))
+                self.conn.commit()
+                self.report["lock_seconds"] = round(time.perf_counter() - locked, 3)
+                print(f"cutover done, writers blocked for {self.report['lock_seconds']}s")
+                return
+            except errors.LockNotAvailable:
+                self.conn.rollback()
+                print(f"cutover attempt {attempt}: lock not granted within {lock_timeout}, retrying")
+                time.sleep(1)
+        raise RuntimeError(f"cutover could not lock the tables in {attempts} attempts")
+
+    def cleanup(self):
+        with self.conn.cursor() as cur:
+            # migration_copy_order takes an orders_arch row and has to go first
+            cur.execute("DROP FUNCTION IF EXISTS migration_copy_order(orders_arch)")
+            cur.execute("DROP FUNCTION IF EXISTS migration_orders_sync()")
+            cur.execute("DROP FUNCTION IF EXISTS migration_blood_bags_orders_sync()")
+            cur.execute("DROP FUNCTION IF EXISTS migration_refresh_bags(INTEGER[])")
+            cur.execute('DROP TABLE IF EXISTS "blood_bags_orders"')
+            cur.execute('DROP TABLE IF EXISTS "orders_arch"')
+        self.conn.commit()
+
+    def run(self, command):
+        if command in ("prepare", "all"):
+            self.phase("prepare", self.prepare)
+        if command in ("backfill", "all"):
+            self.phase("backfill", self.backfill)
+        if command in ("verify", "all"):
+            if not self.phase("verify", self.verify) and command == "all":
+                # a second pass must come back clean before the cutover
+                if not self.phase("verify_again", self.verify):
+                    raise RuntimeError("orders and orders_new still differ, not cutting over")
+        if command in ("cutover", "all"):
+            self.phase("cutover", self.cutover)
+        if command == "cleanup":
+            self.phase("cleanup", self.cleanup)
+        return self.report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Online orders -> realizations migration (lab9).")
+    parser.add_argument("command", choices=["prepare", "backfill", "verify", "cutover", "cleanup", "all"],
+                        help="all runs prepare, backfill, verify and cutover; cleanup drops the old tables "
+                             "once nothing reads them any more")
+    parser.add_argument("--batch-size", type=int, default=5000, help="orders copied per transaction")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument("--report", default=None, help="write the phase timings as JSON to this file")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        report = Migration(conn, args.batch_size, args.pause).run(args.command)
+    finally:
+        conn.close()
+
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2))
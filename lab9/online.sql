@@ -0,0 +1,138 @@
+-- przygotowanie migracji orders -> realizations bez blokowania zapisow (migrate.py prepare)
+-- nowe tabele powstaja obok starych, triggery przepisuja kazda zmiane w orders
+-- i blood_bags_orders, a migrate.py kopiuje istniejace dane partiami
+
+CREATE TABLE IF NOT EXISTS "realizations" (
+	"id" INTEGER NOT NULL UNIQUE GENERATED BY DEFAULT AS IDENTITY,
+	"date" DATE NOT NULL,
+	"fk_transport_id" INTEGER NOT NULL,
+	PRIMARY KEY("id")
+);
+
+-- po przelaczeniu staje sie tabela "orders"
+CREATE TABLE IF NOT EXISTS "orders_new" (
+	"id" INTEGER NOT NULL UNIQUE GENERATED BY DEFAULT AS IDENTITY,
+	"date" DATE NOT NULL CONSTRAINT "chk_not_future_date" CHECK ("date" <= CURRENT_DATE),
+	"state" ORDER_STATE NOT NULL DEFAULT 'AWAITING',
+	"is_urgent" BOOLEAN NOT NULL,
+	"blood_info" BLOOD_INFO,
+	"bag_count" INTEGER NOT NULL DEFAULT 1 CONSTRAINT "chk_positive_bag_count" CHECK ("bag_count" > 0),
+	"fk_hospital_id" INTEGER NOT NULL,
+	PRIMARY KEY("id"),
+	CONSTRAINT "hospital_fk" FOREIGN KEY ("fk_hospital_id") REFERENCES "hospitals" ("id") ON DELETE CASCADE
+);
+
+-- jawne mapowanie zamowienie -> realizacja, jedna realizacja na zamowienie z transportem
+CREATE TABLE IF NOT EXISTS "realization_orders" (
+	"fk_realization_id" INTEGER NOT NULL,
+	"fk_order_id" INTEGER NOT NULL UNIQUE,
+	PRIMARY KEY("fk_realization_id", "fk_order_id"),
+	CONSTRAINT "realization_fk" FOREIGN KEY ("fk_realization_id") REFERENCES "realizations" ("id") ON DELETE CASCADE,
+	CONSTRAINT "order_fk" FOREIGN KEY ("fk_order_id") REFERENCES "orders_new" ("id") ON DELETE CASCADE
+);
+
+ALTER TABLE "blood_bags" ADD COLUMN IF NOT EXISTS "fk_realization_id" INTEGER;
+
+-- NOT VALID nie skanuje blood_bags, migrate.py waliduje klucz po skopiowaniu danych
+DO $$
+BEGIN
+	ALTER TABLE "blood_bags"
+	ADD CONSTRAINT "fk_realization_id" FOREIGN KEY ("fk_realization_id") REFERENCES "realizations" ("id")
+	ON DELETE SET NULL NOT VALID;
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_blood_bags_realization ON blood_bags (fk_realization_id);
+
+
+-- worek w kilku zamowieniach dostaje realizacje zamowienia o najwiekszym id
+CREATE OR REPLACE FUNCTION migration_refresh_bags(bag_ids INTEGER[])
+RETURNS VOID
+LANGUAGE sql AS $$
+	UPDATE blood_bags
+	SET fk_realization_id = latest.fk_realization_id
+	FROM (SELECT bag_id,
+	             (SELECT realization_orders.fk_realization_id
+	              FROM blood_bags_orders
+	                       JOIN realization_orders ON realization_orders.fk_order_id = blood_bags_orders.fk_order_id
+	              WHERE blood_bags_orders.fk_blood_bag_id = bag_id
+	              ORDER BY blood_bags_orders.fk_order_id DESC
+	              LIMIT 1) AS fk_realization_id
+	      FROM unnest(bag_ids) AS bag_id) latest
+	WHERE blood_bags.id = latest.bag_id
+	  AND blood_bags.fk_realization_id IS DISTINCT FROM latest.fk_realization_id
+$$;
+
+-- przepisuje jedno zamowienie z orders do orders_new, realizations i realization_orders
+CREATE OR REPLACE FUNCTION migration_copy_order(order_row orders)
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+	realization_id INTEGER;
+BEGIN
+	INSERT INTO orders_new (id, date, state, is_urgent, blood_info, bag_count, fk_hospital_id)
+	VALUES (order_row.id, order_row.date, order_row.state, order_row.is_urgent,
+	        order_row.blood_info, order_row.bag_count, order_row.fk_hospital_id)
+	ON CONFLICT (id) DO UPDATE
+	SET date = EXCLUDED.date,
+	    state = EXCLUDED.state,
+	    is_urgent = EXCLUDED.is_urgent,
+	    blood_info = EXCLUDED.blood_info,
+	    bag_count = EXCLUDED.bag_count,
+	    fk_hospital_id = EXCLUDED.fk_hospital_id;
+
+	SELECT fk_realization_id INTO realization_id FROM realization_orders WHERE fk_order_id = order_row.id;
+
+	IF order_row.fk_transport_id IS NULL THEN
+		DELETE FROM realizations WHERE id = realization_id;
+	ELSIF realization_id IS NULL THEN
+		INSERT INTO realizations (date, fk_transport_id)
+		VALUES (order_row.date, order_row.fk_transport_id)
+		RETURNING id INTO realization_id;
+		INSERT INTO realization_orders (fk_realization_id, fk_order_id) VALUES (realization_id, order_row.id);
+	ELSE
+		UPDATE realizations
+		SET date = order_row.date, fk_transport_id = order_row.fk_transport_id
+		WHERE id = realization_id;
+	END IF;
+END $$;
+
+CREATE OR REPLACE FUNCTION migration_orders_sync()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP = 'DELETE' THEN
+		DELETE FROM realizations
+		WHERE id IN (SELECT fk_realization_id FROM realization_orders WHERE fk_order_id = OLD.id);
+		DELETE FROM orders_new WHERE id = OLD.id;
+		RETURN OLD;
+	END IF;
+
+	PERFORM migration_copy_order(NEW);
+	IF TG_OP = 'INSERT' OR NEW.fk_transport_id IS DISTINCT FROM OLD.fk_transport_id THEN
+		PERFORM migration_refresh_bags(ARRAY(
+			SELECT fk_blood_bag_id FROM blood_bags_orders WHERE fk_order_id = NEW.id));
+	END IF;
+	RETURN NEW;
+END $$;
+
+CREATE OR REPLACE FUNCTION migration_blood_bags_orders_sync()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_OP IN ('UPDATE', 'DELETE') THEN
+		PERFORM migration_refresh_bags(ARRAY[OLD.fk_blood_bag_id]);
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') THEN
+		PERFORM migration_refresh_bags(ARRAY[NEW.fk_blood_bag_id]);
+	END IF;
+	RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS "migration_orders_sync" ON "orders";
+CREATE TRIGGER "migration_orders_sync" AFTER INSERT OR UPDATE OR DELETE ON "orders"
+FOR EACH ROW EXECUTE FUNCTION migration_orders_sync();
+
+DROP TRIGGER IF EXISTS "migration_blood_bags_orders_sync" ON "blood_bags_orders";
+CREATE TRIGGER "migration_blood_bags_orders_sync" AFTER INSERT OR UPDATE OR DELETE ON "blood_bags_orders"
+FOR EACH ROW EXECUTE FUNCTION migration_blood_bags_orders_sync();